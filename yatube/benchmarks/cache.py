@@ -0,0 +1,145 @@
+"""Сравнение бэкендов кэша: LocMemCache, файловый и общий SQLite.
+
+Каждая операция выполняется подряд `repeat` раз, задержки сводятся
+`report.summarize`. Отдельно меряется смесь чтений и записей в
+нескольких процессах сразу и доля попаданий у процесса, который читает
+записанное другим: у LocMemCache она нулевая, в этом и разница.
+"""
+import multiprocessing
+import os
+import time
+
+from django.utils.module_loading import import_string
+
+from .report import summarize
+
+BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'bench'),
+    'filebased': ('django.core.cache.backends.filebased.FileBasedCache',
+                  'files'),
+    'sqlite': ('core.cache.SQLiteCache', 'cache.sqlite3'),
+}
+# Размером с фрагмент ленты
+VALUE = {'html': 'x' * 4000}
+MANY = 20
+# Доля записей в смешанной нагрузке
+WRITE_SHARE = 0.1
+
+
+def make_cache(name, directory, max_entries=100000):
+    backend, location = BACKENDS[name]
+    if name != 'locmem':
+        location = os.path.join(directory, location)
+    return import_string(backend)(
+        location, {'OPTIONS': {'MAX_ENTRIES': max_entries}})
+
+
+def operations(cache, keys):
+    def key(number):
+        return f'key:{number % keys}'
+
+    return {
+        'set': lambda number: cache.set(key(number), VALUE),
+        'get_hit': lambda number: cache.get(key(number)),
+        'get_miss': lambda number: cache.get(f'missing:{number}'),
+        'set_many': lambda number: cache.set_many(
+            {key(number + shift): VALUE for shift in range(MANY)}),
+        'get_many': lambda number: cache.get_many(
+            [key(number + shift) for shift in range(MANY)]),
+        'incr': lambda number: cache.incr('counter'),
+    }
+
+
+def timed(operation, repeat):
+    latencies = []
+    started = time.perf_counter()
+    for number in range(repeat):
+        begin = time.perf_counter()
+        operation(number)
+        latencies.append(time.perf_counter() - begin)
+    return latencies, time.perf_counter() - started
+
+
+def run_operations(name, directory, repeat, keys):
+    cache = make_cache(name, directory)
+    cache.clear()
+    cache.set('counter', 0, timeout=None)
+    # `set` идет первым и заполняет ключи для чтений
+    return {
+        operation: summarize(*timed(function, repeat))
+        for operation, function in operations(cache, keys).items()
+    }
+
+
+def _mixed_worker(name, directory, repeat, keys, seed, results):
+    cache = make_cache(name, directory)
+    ops = operations(cache, keys)
+    every = round(1 / WRITE_SHARE)
+
+    def mixed(number):
+        number += seed
+        if number % every:
+            ops['get_hit'](number)
+        else:
+            ops['set'](number)
+
+    results.put(timed(mixed, repeat))
+
+
+def run_mixed(name, directory, processes, repeat, keys):
+    """Чтения и записи в `processes` процессах одновременно."""
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    workers = [
+        context.Process(target=_mixed_worker, args=(
+            name, directory, repeat, keys, number * repeat, results))
+        for number in range(processes)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    latencies = []
+    for _ in workers:
+        latencies.extend(results.get()[0])
+    for worker in workers:
+        worker.join()
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def _writer(name, directory, keys, results):
+    cache = make_cache(name, directory)
+    cache.set_many({f'key:{number}': VALUE for number in range(keys)})
+    results.put(None)
+
+
+def _reader(name, directory, keys, results):
+    cache = make_cache(name, directory)
+    found = cache.get_many([f'key:{number}' for number in range(keys)])
+    results.put(len(found) / keys)
+
+
+def shared_hit_ratio(name, directory, keys):
+    """Доля ключей, записанных одним воркером, которые видит другой.
+
+    Оба воркера - отдельные процессы, как у gunicorn: иначе LocMemCache
+    достался бы читателю от родителя при fork.
+    """
+    make_cache(name, directory).clear()
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    for target in (_writer, _reader):
+        process = context.Process(
+            target=target, args=(name, directory, keys, results))
+        process.start()
+        ratio = results.get()
+        process.join()
+    return ratio
+
+
+def run_backend(name, directory, repeat=2000, keys=1000, processes=4):
+    return {
+        'operations': run_operations(name, directory, repeat, keys),
+        f'mixed@{processes}': run_mixed(
+            name, directory, processes, repeat, keys),
+        'shared_hit_ratio': shared_hit_ratio(name, directory, keys),
+    }
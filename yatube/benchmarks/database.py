@@ -0,0 +1,172 @@
+"""Как запросы лент растут вместе с данными.
+
+Для каждой клетки матрицы (число постов x подписок на читателя x постов
+в группе) база заполняется `Seeder`, запросы лент выполняются несколько
+раз, и сохраняются медиана времени, план `EXPLAIN QUERY PLAN` и число
+шагов виртуальной машины SQLite. Шаги - замена «прочитанным строкам»,
+которых SQLite не отдает: полный просмотр таблицы растет в них вместе с
+таблицей, поиск по индексу - нет. Каждая клетка заполняется в
+транзакции, которая потом откатывается.
+"""
+import math
+import statistics
+import time
+from itertools import product
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from posts import feeds, stats
+from posts.importer import Importer
+from posts.models import AuthorStats, Group, InboxEntry, Post
+from posts.seeding import Seeder
+
+# Как часто SQLite вызывает счетчик шагов; точнее - медленнее
+STEP_GRANULARITY = 100
+# Рост быстрее n ** 1.2 считаем нелинейным
+NONLINEAR_EXPONENT = 1.2
+PLAN_WARNINGS = ('SCAN', 'USE TEMP B-TREE')
+
+
+def feed_queries():
+    """Запросы первых страниц лент для самых нагруженных объектов."""
+    per_page = settings.POSTS_PER_PAGE
+    reader = AuthorStats.objects.order_by('-following_count').first().user
+    author = AuthorStats.objects.order_by('-posts_count').first().user
+    group = Group.objects.order_by('-posts_count').first()
+    posts = Post.objects.select_related('author', 'group')
+    last_page = (Paginator(posts, per_page).num_pages - 1) * per_page
+    return {
+        # Страница ленты подписок - ключи из InboxEntry, посты по pk
+        'follow_index': (InboxEntry.objects.filter(user=reader)
+                         .order_by('-pub_date', '-post_id')
+                         .values_list('pub_date', 'post_id')[:per_page]),
+        'group_posts': (group.posts.select_related('author', 'group')
+                        [:per_page]),
+        'author_posts': author.posts.select_related('group')[:per_page],
+        'index_offset_last_page': posts[last_page:last_page + per_page],
+        'paginator_count': Post.objects.all(),
+        'group_paginator_count': group.posts.all(),
+    }
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def _evaluate(name, queryset):
+    if name.endswith('_count'):
+        return Paginator(queryset, settings.POSTS_PER_PAGE).count
+    return len(list(queryset.all()))
+
+
+def measure(name, queryset, repeat):
+    connection.ensure_connection()
+    raw = connection.connection
+    steps = []
+    raw.set_progress_handler(lambda: steps.append(1), STEP_GRANULARITY)
+    try:
+        # Для COUNT план нужен у запроса, который сделает пагинатор
+        with CaptureQueriesContext(connection) as captured:
+            rows = _evaluate(name, queryset)
+    finally:
+        raw.set_progress_handler(None, 0)
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _evaluate(name, queryset)
+        timings.append(time.perf_counter() - started)
+    return {
+        'ms': round(statistics.median(timings) * 1000, 3),
+        'rows': rows,
+        'vm_steps': len(steps) * STEP_GRANULARITY,
+        'plan': explain(captured[-1]['sql']),
+    }
+
+
+def seed(posts, follows, group_posts, users, seed_value):
+    seeder = Seeder(users=users, groups=max(posts // group_posts, 1),
+                    posts=posts, follows=follows, comments=0,
+                    seed=seed_value)
+    Importer(check_images=False).run(seeder.records(first_post_id=1))
+    stats.reconcile()
+    feeds.rebuild()
+
+
+def run_cell(posts, follows, group_posts, users=1000, repeat=5,
+             seed_value=0):
+    with transaction.atomic():
+        seed(posts, follows, group_posts, users, seed_value)
+        result = {
+            'posts': posts,
+            'follows': follows,
+            'group_posts': group_posts,
+            'queries': {
+                name: measure(name, queryset, repeat)
+                for name, queryset in feed_queries().items()
+            },
+        }
+        transaction.set_rollback(True)
+    return result
+
+
+def run_matrix(posts, follows, group_posts, **options):
+    for cell in product(posts, follows, group_posts):
+        yield run_cell(*cell, **options)
+
+
+DIMENSIONS = ('posts', 'follows', 'group_posts')
+
+
+def growth(cells):
+    """Показатели роста времени и шагов по каждому измерению.
+
+    Для соседних по измерению клеток при прочих равных считается k в
+    t2 / t1 = (n2 / n1) ** k; k > NONLINEAR_EXPONENT помечается.
+    """
+    findings = []
+    for dimension in DIMENSIONS:
+        others = [other for other in DIMENSIONS if other != dimension]
+        lines = {}
+        for cell in cells:
+            key = tuple(cell[other] for other in others)
+            lines.setdefault(key, []).append(cell)
+        for key, line in lines.items():
+            line.sort(key=lambda cell: cell[dimension])
+            for before, after in zip(line, line[1:]):
+                scale = math.log(after[dimension] / before[dimension])
+                if not scale:
+                    continue
+                for name, measured in after['queries'].items():
+                    previous = before['queries'][name]
+                    for metric in ('ms', 'vm_steps'):
+                        if not previous[metric] or not measured[metric]:
+                            continue
+                        exponent = math.log(
+                            measured[metric] / previous[metric]) / scale
+                        findings.append({
+                            'query': name,
+                            'dimension': dimension,
+                            'fixed': dict(zip(others, key)),
+                            'from': before[dimension],
+                            'to': after[dimension],
+                            'metric': metric,
+                            'exponent': round(exponent, 2),
+                            'nonlinear': exponent > NONLINEAR_EXPONENT,
+                        })
+    return findings
+
+
+def plan_warnings(cells):
+    """Полные просмотры и временные сортировки в планах запросов."""
+    warnings = set()
+    for cell in cells:
+        for name, measured in cell['queries'].items():
+            for step in measured['plan']:
+                if step.startswith(PLAN_WARNINGS):
+                    warnings.add((name, step))
+    return sorted(warnings)
@@ -0,0 +1,54 @@
+import shutil
+import tempfile
+
+from django.core.management.base import BaseCommand
+
+from benchmarks import cache, report
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает LocMemCache, файловый кэш и общий кэш в SQLite: '
+            'задержки операций, нагрузку из нескольких процессов и '
+            'попадания между процессами')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend', action='append', dest='backends',
+            choices=sorted(cache.BACKENDS),
+            help='Бэкенд (можно повторять), по умолчанию все',
+        )
+        parser.add_argument('--repeat', type=int, default=2000)
+        parser.add_argument('--keys', type=int, default=1000)
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--output', help='Куда записать JSON отчет')
+
+    def handle(self, *args, backends, repeat, keys, processes, output,
+               **options):
+        results = {}
+        for name in backends or cache.BACKENDS:
+            directory = tempfile.mkdtemp()
+            try:
+                results[name] = cache.run_backend(
+                    name, directory, repeat, keys, processes)
+            finally:
+                shutil.rmtree(directory)
+            self.write_backend(name, results[name])
+        if output:
+            report.save({
+                'environment': report.environment(),
+                'repeat': repeat,
+                'keys': keys,
+                'results': results,
+            }, output)
+
+    def write_backend(self, name, result):
+        self.stdout.write(
+            f"{name}: попаданий в другом процессе "
+            f"{result['shared_hit_ratio']:.0%}")
+        rows = dict(result['operations'])
+        rows.update((key, value) for key, value in result.items()
+                    if key.startswith('mixed@'))
+        for operation, row in rows.items():
+            self.stdout.write(
+                f"  {operation:<12} {row['rps']:>10} оп/с  "
+                f"p50 {row['p50_ms']} ms  p99 {row['p99_ms']} ms")
@@ -0,0 +1,81 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from benchmarks import database, report
+
+
+class Command(BaseCommand):
+    help = ('Меряет, как запросы лент растут с числом постов, подписок '
+            'и постов в группе')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int, nargs='+', default=[1000, 10000, 100000])
+        parser.add_argument(
+            '--follows', type=int, nargs='+', default=[10, 100],
+            help='Среднее число подписок на пользователя',
+        )
+        parser.add_argument(
+            '--group-posts', type=int, nargs='+', default=[100, 1000],
+            help='Среднее число постов в группе',
+        )
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Куда записать JSON отчет')
+
+    def handle(self, *args, posts, follows, group_posts, users, repeat,
+               seed, output, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Матрица рассчитана на SQLite')
+        # Отдельная файловая база: рабочие данные не мешают и не портятся
+        directory = tempfile.mkdtemp()
+        connection.settings_dict['TEST']['NAME'] = os.path.join(
+            directory, 'bench.sqlite3')
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            cells = []
+            for cell in database.run_matrix(
+                    posts, follows, group_posts, users=users,
+                    repeat=repeat, seed_value=seed):
+                cells.append(cell)
+                self.write_cell(cell)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            os.rmdir(directory)
+        findings = database.growth(cells)
+        warnings = database.plan_warnings(cells)
+        self.write_summary(findings, warnings)
+        if output:
+            report.save({
+                'environment': report.environment(),
+                'cells': cells,
+                'growth': findings,
+                'plan_warnings': warnings,
+            }, output)
+
+    def write_cell(self, cell):
+        self.stdout.write(
+            f"posts={cell['posts']} follows={cell['follows']} "
+            f"group_posts={cell['group_posts']}")
+        for name, measured in cell['queries'].items():
+            self.stdout.write(
+                f"  {name:<24} {measured['ms']:>10} ms "
+                f"{measured['vm_steps']:>10} шагов "
+                f"{measured['rows']:>8} строк")
+
+    def write_summary(self, findings, warnings):
+        nonlinear = [row for row in findings if row['nonlinear']]
+        if not nonlinear:
+            self.stdout.write(self.style.SUCCESS('Нелинейного роста нет'))
+        for row in nonlinear:
+            self.stdout.write(self.style.WARNING(
+                f"{row['query']}: {row['metric']} растет как "
+                f"{row['dimension']} ** {row['exponent']} "
+                f"({row['from']} -> {row['to']}, {row['fixed']})"))
+        for name, step in warnings:
+            self.stdout.write(f'{name}: {step}')
@@ -0,0 +1,97 @@
+from contextlib import ExitStack
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from benchmarks import report, web
+
+
+class Command(BaseCommand):
+    help = ('Меряет пропускную способность и задержки публичных страниц '
+            'на текущей базе')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--mode', choices=('client', 'wsgi'), default='client',
+            help='client - тестовый клиент Django, wsgi - HTTP к серверу',
+        )
+        parser.add_argument(
+            '--base-url',
+            help='Адрес уже запущенного сервера; без него в режиме wsgi '
+                 'поднимается встроенный',
+        )
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios',
+            choices=sorted(web.SCENARIOS),
+            help='Сценарий (можно повторять), по умолчанию все',
+        )
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+', default=[1],
+            help='Число параллельных клиентов; можно несколько значений',
+        )
+        parser.add_argument('--output', help='Куда записать JSON отчет')
+        parser.add_argument(
+            '--baseline',
+            help='JSON отчет, с которым сравнить; регрессия - ошибка',
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимое ухудшение метрики, доля',
+        )
+
+    def handle(self, *args, mode, base_url, scenarios, requests, warmup,
+               concurrency, output, baseline, tolerance, **options):
+        try:
+            targets = web.pick_targets()
+        except LookupError as error:
+            raise CommandError(error)
+        # Сценарии пишут посты и комментарии: данные снимаем до них
+        dataset = web.dataset()
+        results = {}
+        with ExitStack() as stack:
+            # Без DEBUG: иначе каждый запрос копит SQL в connection.queries
+            stack.enter_context(override_settings(DEBUG=False))
+            if mode == 'wsgi' and not base_url:
+                base_url = stack.enter_context(web.Server())
+            if mode == 'wsgi':
+                factory = partial(web.HTTPTransport, base_url)
+            else:
+                factory = web.ClientTransport
+            for name in scenarios or web.SCENARIOS:
+                for clients in concurrency:
+                    key = f'{name}@{clients}'
+                    results[key] = web.run_scenario(
+                        name, targets, factory, requests, clients, warmup)
+                    self.stdout.write(self.format(key, results[key]))
+        result = {
+            'environment': report.environment(),
+            'mode': mode,
+            'dataset': dataset,
+            'results': results,
+        }
+        if output:
+            report.save(result, output)
+        if baseline:
+            self.compare(result, report.load(baseline), tolerance)
+
+    def format(self, key, row):
+        return (f"{key:<18} {row['rps']:>9} rps  p50 {row['p50_ms']} ms  "
+                f"p95 {row['p95_ms']} ms  p99 {row['p99_ms']} ms  "
+                f"ошибок {row['errors']}")
+
+    def compare(self, result, baseline, tolerance):
+        if baseline.get('dataset') != result['dataset']:
+            self.stderr.write('Базовая линия снята на других данных')
+        regressions = report.compare(
+            result['results'], baseline['results'],
+            report.HTTP_METRICS, tolerance)
+        errors = [key for key, row in result['results'].items()
+                  if row['errors']]
+        if errors:
+            regressions.append(f'Ошибки в ответах: {", ".join(errors)}')
+        if regressions:
+            raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
@@ -0,0 +1,90 @@
+"""Статистика замеров, JSON-отчеты и сравнение с базовой линией."""
+import json
+import math
+import platform
+from datetime import datetime
+
+import django
+from django.db import connection
+
+
+def percentile(values, share):
+    """Перцентиль по ближайшему рангу; values должны быть отсортированы."""
+    if not values:
+        return None
+    rank = max(math.ceil(share * len(values)), 1)
+    return values[rank - 1]
+
+
+def summarize(latencies, elapsed, errors=0):
+    """Пропускная способность и задержки в миллисекундах."""
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        'requests': count,
+        'errors': errors,
+        'rps': round(count / elapsed, 2) if elapsed else None,
+        'mean_ms': round(sum(latencies) / count * 1000, 3) if count else None,
+        'p50_ms': _ms(percentile(latencies, 0.50)),
+        'p95_ms': _ms(percentile(latencies, 0.95)),
+        'p99_ms': _ms(percentile(latencies, 0.99)),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def environment():
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'machine': platform.node(),
+    }
+
+
+def load(path):
+    with open(path, encoding='utf-8') as source:
+        return json.load(source)
+
+
+def save(report, path):
+    with open(path, 'w', encoding='utf-8') as target:
+        json.dump(report, target, ensure_ascii=False, indent=2)
+        target.write('\n')
+
+
+# метрика: True, если рост значения - это ухудшение
+HTTP_METRICS = {
+    'p50_ms': True,
+    'p95_ms': True,
+    'p99_ms': True,
+    'rps': False,
+}
+
+
+def compare(results, baseline, metrics, tolerance=0.2):
+    """Регрессии относительно базовой линии.
+
+    `results` и `baseline` - {сценарий: {метрика: значение}}. Возвращает
+    строки с описанием метрик, ухудшившихся больше чем на `tolerance`.
+    """
+    regressions = []
+    for name, measured in sorted(results.items()):
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        for metric, higher_is_worse in metrics.items():
+            old, new = expected.get(metric), measured.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if not higher_is_worse:
+                change = -change
+            if change > tolerance:
+                regressions.append(
+                    f'{name}.{metric}: {old} -> {new} '
+                    f'({change:+.0%} хуже базовой линии)')
+    return regressions
@@ -0,0 +1,116 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase
+
+from posts.models import Post
+
+from . import cache, database, report, web
+
+
+class ReportTests(TestCase):
+    def test_percentiles(self):
+        values = list(range(1, 101))
+        self.assertEqual(report.percentile(values, 0.5), 50)
+        self.assertEqual(report.percentile(values, 0.99), 99)
+        self.assertEqual(report.percentile([7], 0.95), 7)
+        self.assertIsNone(report.percentile([], 0.5))
+
+    def test_compare_flags_only_worse_metrics(self):
+        baseline = {'index@1': {'p95_ms': 10, 'rps': 100}}
+        self.assertEqual(report.compare(
+            {'index@1': {'p95_ms': 11, 'rps': 150}}, baseline,
+            report.HTTP_METRICS), [])
+        regressions = report.compare(
+            {'index@1': {'p95_ms': 20, 'rps': 50}}, baseline,
+            report.HTTP_METRICS)
+        self.assertEqual(len(regressions), 2)
+
+
+class HTTPBenchmarkTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_data', users=10, groups=2, posts=30,
+                     follows=3, comments=20, stdout=StringIO())
+
+    def test_report_and_baseline(self):
+        self.posts_before = Post.objects.count()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, directory)
+        output = os.path.join(directory, 'http.json')
+        self.addCleanup(os.remove, output)
+        call_command('bench_http', requests=4, warmup=1, output=output,
+                     stdout=StringIO())
+        with open(output, encoding='utf-8') as source:
+            result = json.load(source)
+        self.assertEqual(
+            set(result['results']),
+            {'index@1', 'follow_index@1', 'group_posts@1', 'profile@1',
+             'post_detail@1', 'post_create@1', 'add_comment@1',
+             'follow@1'})
+        self.assertTrue(all(row['errors'] == 0
+                            for row in result['results'].values()))
+        # Данные сняты до сценариев, которые добавляют посты
+        self.assertEqual(result['dataset']['posts.Post'], self.posts_before)
+        # Базовая линия, которую не догнать
+        for row in result['results'].values():
+            row['p95_ms'] = row['p95_ms'] / 100
+        report.save(result, output)
+        with self.assertRaisesMessage(CommandError, 'index@1.p95_ms'):
+            call_command('bench_http', requests=4, warmup=0,
+                         scenarios=['index'], baseline=output,
+                         stdout=StringIO(), stderr=StringIO())
+
+    def test_view_exception_counted_as_error(self):
+        targets = web.pick_targets()
+        with mock.patch('posts.views.feed_fragment',
+                        side_effect=RuntimeError), \
+                self.assertLogs('benchmarks.web', 'ERROR'):
+            row = web.run_scenario('index', targets, web.ClientTransport, 2)
+        self.assertEqual(row['errors'], 2)
+
+
+class DatabaseBenchmarkTests(TestCase):
+    def test_cell_is_measured_and_rolled_back(self):
+        cell = database.run_cell(posts=50, follows=3, group_posts=10,
+                                 users=10, repeat=1)
+        self.assertFalse(Post.objects.exists())
+        group_posts = cell['queries']['group_posts']
+        self.assertEqual(group_posts['rows'], 10)
+        self.assertTrue(group_posts['plan'])
+        self.assertEqual(cell['queries']['paginator_count']['rows'], 50)
+
+    def test_growth_flags_superlinear_queries(self):
+        def cell(posts, linear_ms, quadratic_ms):
+            return {'posts': posts, 'follows': 10, 'group_posts': 100,
+                    'queries': {
+                        'linear': {'ms': linear_ms, 'vm_steps': 0},
+                        'quadratic': {'ms': quadratic_ms, 'vm_steps': 0},
+                    }}
+
+        findings = database.growth([cell(100, 1, 1), cell(1000, 10, 100)])
+        self.assertEqual(
+            {row['query']: row['nonlinear'] for row in findings},
+            {'linear': False, 'quadratic': True})
+
+
+class CacheBenchmarkTests(SimpleTestCase):
+    def test_only_shared_backends_hit_across_processes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(os.rmdir, directory)
+        output = os.path.join(directory, 'cache.json')
+        self.addCleanup(os.remove, output)
+        call_command('bench_cache', backends=['locmem', 'sqlite'],
+                     repeat=20, keys=10, processes=2, output=output,
+                     stdout=StringIO())
+        results = report.load(output)['results']
+        self.assertEqual(results['locmem']['shared_hit_ratio'], 0)
+        self.assertEqual(results['sqlite']['shared_hit_ratio'], 1)
+        self.assertEqual(
+            set(results['sqlite']['operations']),
+            set(cache.operations(None, 1)))
+        self.assertEqual(results['sqlite']['mixed@2']['requests'], 40)
@@ -0,0 +1,203 @@
+"""Нагрузочные сценарии для публичных страниц.
+
+Каждый сценарий строит запрос по номеру итерации, а запросы отправляет
+транспорт: тестовый клиент Django в том же процессе или HTTP к WSGI
+серверу - встроенному многопоточному или уже запущенному снаружи.
+Цели (самая большая группа, самый плодовитый автор, самый обсуждаемый
+пост, самый подписанный читатель) выбираются из текущей базы, поэтому
+бенчмарк запускают на данных `manage.py seed_data`.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+from itertools import count
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.servers.basehttp import (
+    ThreadedWSGIServer, WSGIRequestHandler, get_internal_wsgi_application,
+)
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from posts.models import AuthorStats, Comment, Follow, Group, Post
+
+from .report import summarize
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+Request = namedtuple('Request', 'method path data')
+Targets = namedtuple('Targets', 'reader author group post')
+
+
+def pick_targets():
+    """Самые нагруженные объекты базы - на них и меряем."""
+    reader = (AuthorStats.objects.select_related('user')
+              .order_by('-following_count').first())
+    author = (AuthorStats.objects.select_related('user')
+              .order_by('-posts_count').first())
+    group = Group.objects.order_by('-posts_count').first()
+    post = Post.objects.order_by('-comments_count', '-pk').first()
+    if not all((reader, author, group, post)):
+        raise LookupError('В базе нет данных, запустите manage.py seed_data')
+    return Targets(reader.user, author.user, group, post)
+
+
+def dataset():
+    return {
+        model._meta.label: model.objects.count()
+        for model in (User, Group, Post, Comment, Follow)
+    }
+
+
+def _follow(targets, iteration):
+    # Подписка и отписка чередуются, чтобы число подписок не росло
+    action = 'follow' if iteration % 2 else 'unfollow'
+    return Request('get', reverse(
+        f'posts:profile_{action}',
+        kwargs={'username': targets.author.username}), None)
+
+
+# сценарий: (нужен вход, запрос по целям и номеру итерации)
+SCENARIOS = {
+    'index': (False, lambda targets, iteration: Request(
+        'get', reverse('posts:index'), None)),
+    'follow_index': (True, lambda targets, iteration: Request(
+        'get', reverse('posts:follow_index'), None)),
+    'group_posts': (False, lambda targets, iteration: Request(
+        'get', reverse('posts:group_list',
+                       kwargs={'slug': targets.group.slug}), None)),
+    'profile': (False, lambda targets, iteration: Request(
+        'get', reverse('posts:profile',
+                       kwargs={'username': targets.author.username}), None)),
+    'post_detail': (False, lambda targets, iteration: Request(
+        'get', reverse('posts:post_detail',
+                       kwargs={'post_id': targets.post.pk}), None)),
+    'post_create': (True, lambda targets, iteration: Request(
+        'post', reverse('posts:post_create'),
+        {'text': f'Нагрузочный пост #{iteration}'})),
+    'add_comment': (True, lambda targets, iteration: Request(
+        'post', reverse('posts:add_comment',
+                        kwargs={'post_id': targets.post.pk}),
+        {'text': f'Нагрузочный комментарий #{iteration}'})),
+    'follow': (True, _follow),
+}
+
+
+class ClientTransport:
+    """Тестовый клиент Django: без сети и сервера, только код проекта."""
+
+    def __init__(self, user=None):
+        self.client = Client()
+        if user is not None:
+            self.client.force_login(user)
+
+    def send(self, request):
+        method = getattr(self.client, request.method)
+        try:
+            return method(request.path, request.data or {}).status_code
+        except Exception:
+            # Клиент Django 2.2 пробрасывает исключение представления;
+            # сервер ответил бы 500, и это ошибка сценария, а не бенчмарка
+            logger.exception('Запрос %s %s упал', request.method,
+                             request.path)
+            return 500
+
+
+class HTTPTransport:
+    """Настоящие HTTP-запросы к WSGI серверу."""
+
+    def __init__(self, base_url, user=None):
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        self.headers = {}
+        if user is not None:
+            client = Client()
+            client.force_login(user)
+            self.session.cookies.set(
+                settings.SESSION_COOKIE_NAME,
+                client.cookies[settings.SESSION_COOKIE_NAME].value)
+            # Страница с формой выдает CSRF-cookie для POST-запросов
+            self.session.get(self.base_url + reverse('posts:post_create'))
+            self.headers['X-CSRFToken'] = self.session.cookies.get(
+                settings.CSRF_COOKIE_NAME, '')
+
+    def send(self, request):
+        response = self.session.request(
+            request.method, self.base_url + request.path, data=request.data,
+            headers=self.headers, allow_redirects=False)
+        return response.status_code
+
+
+class QuietHandler(WSGIRequestHandler):
+    # Иначе заголовки и тело ответа ждут друг друга по 40 мс
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+
+class Server:
+    """Многопоточный WSGI сервер проекта на свободном порту."""
+
+    def __enter__(self):
+        self.httpd = ThreadedWSGIServer(('127.0.0.1', 0), QuietHandler)
+        self.httpd.set_app(get_internal_wsgi_application())
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        host, port = self.httpd.server_address
+        return f'http://{host}:{port}'
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def run_scenario(name, targets, transport_factory, total, concurrency=1,
+                 warmup=0):
+    """Выполняет `total` запросов сценария в `concurrency` потоков."""
+    needs_login, build = SCENARIOS[name]
+    user = targets.reader if needs_login else None
+    iterations = count()
+    latencies = []
+    errors = []
+
+    def work(limit):
+        transport = transport_factory(user)
+        try:
+            while True:
+                iteration = next(iterations)
+                if iteration >= limit:
+                    return
+                request = build(targets, iteration)
+                started = time.perf_counter()
+                status = transport.send(request)
+                latencies.append(time.perf_counter() - started)
+                if status >= 400:
+                    errors.append(status)
+        finally:
+            if threading.current_thread() is not threading.main_thread():
+                connections.close_all()
+
+    if warmup:
+        work(warmup)
+        latencies.clear()
+        errors.clear()
+        iterations = count(warmup)
+        total += warmup
+    started = time.perf_counter()
+    if concurrency <= 1:
+        work(total)
+    else:
+        threads = [threading.Thread(target=work, args=(total,))
+                   for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return summarize(latencies, time.perf_counter() - started, len(errors))
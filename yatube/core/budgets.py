@@ -0,0 +1,53 @@
+"""Бюджеты SQL-запросов для представлений.
+
+Бюджет - максимум запросов и суммарного времени SQL на один ответ.
+`query_budget` ловит все запросы блока и, если бюджет превышен, падает
+со списком этих запросов, отмечая повторы с одинаковой формой - это
+почти всегда N+1 из шаблона или цикла.
+"""
+import re
+from collections import Counter, namedtuple
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+Budget = namedtuple('Budget', 'queries sql_ms')
+
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def shape(sql):
+    """SQL без литералов: запросы N+1 отличаются только ими."""
+    return LITERAL.sub('?', sql)
+
+
+def describe(name, budget, queries, sql_ms):
+    repeated = Counter(shape(query['sql']) for query in queries)
+    lines = [
+        f'{name}: {len(queries)} запросов за {sql_ms:.1f} мс, '
+        f'бюджет {budget.queries} запросов и {budget.sql_ms} мс'
+    ]
+    for number, query in enumerate(queries, 1):
+        times = repeated[shape(query['sql'])]
+        mark = f' [повторяется {times} раз]' if times > 1 else ''
+        lines.append(f"{number}. ({query['time']} с){mark} {query['sql']}")
+    return '\n'.join(lines)
+
+
+@contextmanager
+def query_budget(name, budget):
+    with CaptureQueriesContext(connection) as captured:
+        yield captured
+    queries = captured.captured_queries
+    sql_ms = sum(float(query['time']) for query in queries) * 1000
+    if len(queries) > budget.queries or sql_ms > budget.sql_ms:
+        raise AssertionError(describe(name, budget, queries, sql_ms))
+
+
+class QueryBudgetMixin:
+    """Для TestCase: `with self.assertWithinBudget('posts:index'): ...`."""
+    budgets = {}
+
+    def assertWithinBudget(self, url_name, budget=None):
+        return query_budget(url_name, budget or self.budgets[url_name])
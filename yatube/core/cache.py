@@ -0,0 +1,538 @@
+"""Кэш в файле SQLite, общий для всех процессов одной машины, и
+двухуровневый кэш с памятью процесса перед общим.
+
+В отличие от LocMemCache, воркеры видят одни и те же записи, и сброс
+версии ленты в одном воркере сразу действует во всех. Файл открыт в
+режиме WAL: чтения не ждут записи, записи идут по одной.
+
+Число записей и их общий размер ведутся триггерами в `cache_stats`,
+поэтому проверка лимитов MAX_ENTRIES и MAX_SIZE после записи стоит
+одного чтения строки. При превышении сначала удаляются просроченные
+записи, затем давно не читанные. Время последнего чтения обновляется не
+чаще раза в ACCESS_RESOLUTION секунд, чтобы чтения не превращались в
+записи.
+
+    CACHES = {'default': {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+        'OPTIONS': {'MAX_ENTRIES': 100000, 'MAX_SIZE': 256 * 2 ** 20},
+    }}
+"""
+import os
+import pickle
+import socket
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import metrics
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL,
+        accessed REAL NOT NULL,
+        size INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+    CREATE TABLE IF NOT EXISTS cache_stats (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        entries INTEGER NOT NULL,
+        bytes INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO cache_stats VALUES (1, 0, 0);
+    CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN
+        UPDATE cache_stats
+        SET entries = entries + 1, bytes = bytes + new.size;
+    END;
+    CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size ON cache
+    BEGIN
+        UPDATE cache_stats SET bytes = bytes + new.size - old.size;
+    END;
+    CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN
+        UPDATE cache_stats
+        SET entries = entries - 1, bytes = bytes - old.size;
+    END;
+'''
+UPSERT = '''
+    INSERT INTO cache (key, value, expires, accessed, size)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (key) DO UPDATE SET
+        value = excluded.value, expires = excluded.expires,
+        accessed = excluded.accessed, size = excluded.size
+'''
+# Для add: существующая живая запись не меняется
+ADD = UPSERT + ' WHERE cache.expires IS NOT NULL AND cache.expires <= ?'
+LIVE = '(expires IS NULL OR expires > ?)'
+# Предел числа параметров запроса в старых сборках SQLite
+CHUNK = 500
+
+
+def _chunks(items):
+    items = list(items)
+    for start in range(0, len(items), CHUNK):
+        yield items[start:start + CHUNK]
+
+
+class SQLiteFile:
+    """Соединение с файлом SQLite в режиме WAL, свое у каждого потока и
+    каждого процесса после fork."""
+    schema = None
+
+    def __init__(self, path, busy_timeout=5):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+
+    @property
+    def db(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout,
+                                 isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(self.schema)
+            local.db, local.pid = db, os.getpid()
+        return local.db
+
+    @contextmanager
+    def _write(self):
+        # IMMEDIATE сразу берет блокировку записи: читать и менять
+        # в одной транзакции безопасно для других процессов
+        db = self.db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+
+class SQLiteCache(SQLiteFile, BaseCache):
+    schema = SCHEMA
+
+    def __init__(self, location, params):
+        BaseCache.__init__(self, params)
+        options = params.get('OPTIONS', {})
+        SQLiteFile.__init__(self, location, options.get('TIMEOUT', 5))
+        self.max_size = options.get('MAX_SIZE')
+        self.access_resolution = options.get('ACCESS_RESOLUTION', 5)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _row(self, key, value, timeout, now):
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = self.get_backend_timeout(timeout)
+        return key, blob, expires, now, len(blob) + len(key)
+
+    def _read(self, keys):
+        now = time.time()
+        found = {}
+        stale = []
+        for chunk in _chunks(keys):
+            marks = ','.join('?' * len(chunk))
+            rows = self.db.execute(
+                f'SELECT key, value, accessed FROM cache '
+                f'WHERE key IN ({marks}) AND {LIVE}', (*chunk, now))
+            for key, blob, accessed in rows:
+                found[key] = pickle.loads(blob)
+                if now - accessed > self.access_resolution:
+                    stale.append(key)
+        if stale:
+            with self._write() as db:
+                db.executemany(
+                    'UPDATE cache SET accessed = ? WHERE key = ?',
+                    [(now, key) for key in stale])
+        return found
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._read([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        found = self._read(keys)
+        return {keys[key]: value for key, value in found.items()}
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self.db.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {LIVE}',
+            (key, time.time())).fetchone()
+        return row is not None
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        rows = [self._row(self._key(key, version), value, timeout, now)
+                for key, value in data.items()]
+        with self._write() as db:
+            db.executemany(UPSERT, rows)
+            self._cull(db, now)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        row = self._row(self._key(key, version), value, timeout, now)
+        with self._write() as db:
+            added = db.execute(ADD, (*row, now)).rowcount == 1
+            if added:
+                self._cull(db, now)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        with self._write() as db:
+            return db.execute(
+                f'UPDATE cache SET expires = ?, accessed = ? '
+                f'WHERE key = ? AND {LIVE}',
+                (self.get_backend_timeout(timeout), now,
+                 self._key(key, version), now)).rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._write() as db:
+            row = db.execute(
+                f'SELECT value FROM cache WHERE key = ? AND {LIVE}',
+                (key, now)).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            db.execute(
+                'UPDATE cache SET value = ?, size = ?, accessed = ? '
+                'WHERE key = ?', (blob, len(blob) + len(key), now, key))
+        return value
+
+    def delete(self, key, version=None):
+        with self._write() as db:
+            return db.execute(
+                'DELETE FROM cache WHERE key = ?',
+                (self._key(key, version),)).rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._write() as db:
+            for chunk in _chunks(keys):
+                marks = ','.join('?' * len(chunk))
+                db.execute(
+                    f'DELETE FROM cache WHERE key IN ({marks})', chunk)
+
+    def clear(self):
+        with self._write() as db:
+            db.execute('DELETE FROM cache')
+
+    def stats(self):
+        entries, size = self.db.execute(
+            'SELECT entries, bytes FROM cache_stats').fetchone()
+        return {'entries': entries, 'bytes': size}
+
+    def _over(self, db):
+        entries, size = db.execute(
+            'SELECT entries, bytes FROM cache_stats').fetchone()
+        excess_entries = entries - self._max_entries
+        excess_size = size - self.max_size if self.max_size else 0
+        return excess_entries, excess_size
+
+    def _cull(self, db, now):
+        excess_entries, excess_size = self._over(db)
+        if excess_entries <= 0 and excess_size <= 0:
+            return
+        db.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        excess_entries, excess_size = self._over(db)
+        if excess_entries > 0:
+            # Как и LocMemCache, освобождаем место с запасом
+            entries = excess_entries + self._max_entries // (
+                self._cull_frequency or 1)
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY accessed LIMIT ?)', (entries,))
+            excess_size = self._over(db)[1]
+        if excess_size > 0:
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM ('
+                'SELECT key, size, SUM(size) OVER (ORDER BY accessed, key) '
+                'AS running FROM cache) WHERE running - size < ?)',
+                (excess_size,))
+
+    def close(self, **kwargs):
+        # Соединение живет дольше запроса: открывать файл заново дорого
+        pass
+
+
+BUS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS invalidations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        origin TEXT NOT NULL,
+        key TEXT NOT NULL,
+        created REAL NOT NULL
+    );
+'''
+# Ключ в шине, по которому все процессы очищают память целиком
+EVERYTHING = '*'
+# Неизменяемые значения хранятся в памяти как есть, остальные - копией
+IMMUTABLE = (str, bytes, int, float, bool, type(None))
+
+
+class InvalidationBus(SQLiteFile):
+    """Шина сброса: процессы дописывают измененные ключи в таблицу и
+    читают чужие записи после последней прочитанной."""
+    schema = BUS_SCHEMA
+
+    def __init__(self, path, retention):
+        super().__init__(path)
+        self.retention = retention
+        self.published = 0
+
+    def publish(self, origin, keys):
+        now = time.time()
+        with self._write() as db:
+            db.executemany(
+                'INSERT INTO invalidations (origin, key, created) '
+                'VALUES (?, ?, ?)', [(origin, key, now) for key in keys])
+            self.published += 1
+            # Старые записи уже прочитаны всеми, кто не проспал retention
+            if self.published % 100 == 0:
+                db.execute('DELETE FROM invalidations WHERE created < ?',
+                           (now - self.retention,))
+
+    def last_id(self):
+        return self.db.execute(
+            'SELECT COALESCE(MAX(id), 0) FROM invalidations').fetchone()[0]
+
+    def since(self, last_id, origin):
+        return self.db.execute(
+            'SELECT id, key FROM invalidations WHERE id > ? AND origin != ?',
+            (last_id, origin)).fetchall()
+
+
+class LocalTier:
+    """Память процесса: LRU на `max_entries` записей и позиция в шине."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.poll_lock = threading.Lock()
+        self.seen = 0
+        self.polled = None
+        self.counts = Counter()
+
+    @property
+    def origin(self):
+        return f'{socket.gethostname()}:{os.getpid()}:{id(self)}'
+
+    def get(self, key, now):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            expires, stored = entry
+            if expires <= now:
+                del self.entries[key]
+                return False, None
+            self.entries.move_to_end(key)
+        if isinstance(stored, IMMUTABLE):
+            return True, stored
+        return True, pickle.loads(stored[0])
+
+    def set(self, key, value, expires):
+        if not isinstance(value, IMMUTABLE):
+            # Кортеж отличает копию от значения-байтов
+            value = (pickle.dumps(value, pickle.HIGHEST_PROTOCOL),)
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def drop(self, keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class TieredCache(BaseCache):
+    """LRU в памяти процесса (L1) перед общим кэшем (L2).
+
+    Записи идут в L2 и в свою L1, а ключи - в шину сброса (файл
+    LOCATION). Раз в BUS_INTERVAL секунд процесс читает из шины чужие
+    ключи и выбрасывает их из L1, так что устаревшее значение живет в
+    чужой памяти не дольше BUS_INTERVAL, а без шины - не дольше
+    L1_TIMEOUT. Процесс, не читавший шину дольше BUS_RETENTION, очищает
+    L1 целиком. Шина - файл, поэтому общая только у процессов одной
+    машины; для нескольких машин ее заменит сетевая.
+
+        CACHES = {
+            'default': {
+                'BACKEND': 'core.cache.TieredCache',
+                'LOCATION': '/var/tmp/yatube-bus.sqlite3',
+                'OPTIONS': {'L2': 'shared', 'L1_MAX_ENTRIES': 5000},
+            },
+            'shared': {'BACKEND': 'core.cache.SQLiteCache', ...},
+        }
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.l2_alias = options['L2']
+        self.l1_timeout = options.get('L1_TIMEOUT', 30)
+        self.interval = options.get('BUS_INTERVAL', 0.5)
+        self.bus = InvalidationBus(location, options.get('BUS_RETENTION', 300))
+        with _tiers_lock:
+            # Экземпляр бэкенда свой у каждого потока, память - общая
+            self.tier = _tiers.setdefault(
+                location, LocalTier(options.get('L1_MAX_ENTRIES', 1000)))
+
+    @property
+    def l2(self):
+        return caches[self.l2_alias]
+
+    def sync(self):
+        """Выбрасывает из L1 ключи, измененные другими процессами."""
+        tier = self.tier
+        now = time.monotonic()
+        if tier.polled is not None and now - tier.polled < self.interval:
+            return
+        # Шину читает один поток, остальные не ждут его
+        if not tier.poll_lock.acquire(blocking=False):
+            return
+        try:
+            if tier.polled is None or now - tier.polled > self.bus.retention:
+                tier.clear()
+                tier.seen = self.bus.last_id()
+            else:
+                rows = self.bus.since(tier.seen, tier.origin)
+                keys = {key for _, key in rows}
+                if EVERYTHING in keys:
+                    tier.clear()
+                else:
+                    tier.drop(keys)
+                tier.seen = max((id_ for id_, _ in rows), default=tier.seen)
+            tier.polled = now
+        finally:
+            tier.poll_lock.release()
+
+    def _count(self, tier, result, amount=1):
+        self.tier.counts[f'{tier}_{result}'] += amount
+        metrics.TIER_REQUESTS.inc(amount, tier=tier, result=result)
+
+    def _expires(self, timeout):
+        expires = self.get_backend_timeout(timeout)
+        l1_expires = time.time() + self.l1_timeout
+        return l1_expires if expires is None else min(expires, l1_expires)
+
+    def _publish(self, keys):
+        self.bus.publish(self.tier.origin, keys)
+
+    def get_many(self, keys, version=None):
+        self.sync()
+        now = time.time()
+        found = {}
+        missing = []
+        for key in keys:
+            hit, value = self.tier.get(self.make_key(key, version), now)
+            if hit:
+                found[key] = value
+            else:
+                missing.append(key)
+        self._count('l1', 'hit', len(found))
+        if missing:
+            self._count('l1', 'miss', len(missing))
+            from_l2 = self.l2.get_many(missing, version=version)
+            self._count('l2', 'hit', len(from_l2))
+            self._count('l2', 'miss', len(missing) - len(from_l2))
+            # Срок записи в L2 неизвестен, поэтому в L1 - только L1_TIMEOUT
+            expires = now + self.l1_timeout
+            for key, value in from_l2.items():
+                self.tier.set(self.make_key(key, version), value, expires)
+            found.update(from_l2)
+        return found
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version).get(key, default)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.l2.set_many(data, timeout, version)
+        expires = self._expires(timeout)
+        keys = []
+        for key, value in data.items():
+            keys.append(self.make_key(key, version))
+            if key not in failed:
+                self.tier.set(keys[-1], value, expires)
+        self._publish(keys)
+        return failed
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # Промахи в L1 не хранятся, поэтому о новом ключе сообщать некому
+        added = self.l2.add(key, value, timeout, version)
+        if added:
+            self.tier.set(self.make_key(key, version), value,
+                          self._expires(timeout))
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        value = self.l2.incr(key, delta, version)
+        made = self.make_key(key, version)
+        self.tier.drop([made])
+        self._publish([made])
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.l2.touch(key, timeout, version)
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.l2.delete_many(keys, version)
+        made = [self.make_key(key, version) for key in keys]
+        self.tier.drop(made)
+        self._publish(made)
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def has_key(self, key, version=None):
+        return self.get_many([key], version) != {}
+
+    def clear(self):
+        self.l2.clear()
+        self.tier.clear()
+        self._publish([EVERYTHING])
+
+    def stats(self):
+        """Попадания по уровням в этом процессе."""
+        counts = self.tier.counts
+        result = {'l1_entries': len(self.tier.entries)}
+        for tier in ('l1', 'l2'):
+            hits, misses = counts[f'{tier}_hit'], counts[f'{tier}_miss']
+            result[f'{tier}_hits'] = hits
+            result[f'{tier}_misses'] = misses
+            total = hits + misses
+            result[f'{tier}_hit_ratio'] = hits / total if total else None
+        return result
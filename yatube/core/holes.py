@@ -0,0 +1,129 @@
+"""Страницы с дырками: тело кэшируется одно на всех пользователей.
+
+Все, что зависит от читателя (шапка, ссылки для автора, формы с CSRF),
+выносится в отдельные шаблоны-дырки: `{% hole 'шаблон' arg=... %}`.
+Обычно тег сразу отрисовывает шаблон с аргументами, текущим запросом и
+контекстом, который добавил `context` для этого шаблона. Если страница
+рендерится для кэша (`cached_page`), на месте дырки остается метка с
+именем шаблона и аргументами, и на каждый запрос `fill` дорисовывает
+метки для текущего пользователя. Аргументы должны сериализоваться в
+JSON. Подделать метку текст пользователя не может: автоэкранирование
+превращает `<!--` в `&lt;!--`.
+"""
+import json
+import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import wraps
+from hashlib import md5
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+from . import swr
+
+MARKER = re.compile(r'<!--hole:([\w=-]+)-->')
+KEY_PREFIX = 'page:'
+# Параметры запроса, от которых зависят кэшируемые страницы
+PAGE_PARAMS = ('page', 'cursor')
+
+# шаблон дырки -> функция(request, **args), дающая ей контекст
+_contexts = {}
+
+
+def context(template_name):
+    """Регистрирует функцию, которая добавляет контекст дырке."""
+    def decorator(func):
+        _contexts[template_name] = func
+        return func
+    return decorator
+
+
+def render(request, template_name, args):
+    data = dict(args)
+    if template_name in _contexts:
+        data.update(_contexts[template_name](request, **args))
+    return render_to_string(template_name, data, request)
+
+
+def marker(template_name, args):
+    payload = json.dumps({'template': template_name, 'args': args})
+    return f'<!--hole:{urlsafe_b64encode(payload.encode()).decode()}-->'
+
+
+def punching(request):
+    return getattr(request, 'punch_holes', False)
+
+
+def dont_cache(request):
+    """Страница вышла временной (например, превью еще в очереди): ее
+    отдадут, но в кэш не положат."""
+    if punching(request):
+        request.page_not_cacheable = True
+
+
+def fill(content, request):
+    def replace(match):
+        data = json.loads(urlsafe_b64decode(match.group(1)))
+        return render(request, data['template'], data['args'])
+
+    return MARKER.sub(replace, content)
+
+
+class _NotCacheable(Exception):
+    def __init__(self, response):
+        super().__init__()
+        self.response = response
+
+
+def _render_body(view, request, args, kwargs):
+    request.punch_holes = True
+    try:
+        response = view(request, *args, **kwargs)
+    finally:
+        request.punch_holes = False
+    if (response.status_code != 200 or response.streaming
+            or getattr(request, 'page_not_cacheable', False)):
+        raise _NotCacheable(response)
+    return response.content.decode(response.charset), response['Content-Type']
+
+
+def cached_page(state, timeout=None, params=PAGE_PARAMS):
+    """Кэширует GET-страницу одну на всех, кроме дырок.
+
+    `state(request, *args, **kwargs)` возвращает то, из чего собрана
+    страница (версии, штампы), оно входит в ключ вместе с путем и
+    значениями `params`; None - страницу не кэшировать. Запросы с другими
+    параметрами отдаются мимо кэша, чтобы мусорные строки запроса не
+    забивали его копиями страницы. Ответы не 200 и страницы, отметившие
+    себя `dont_cache`, не кэшируются.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (not settings.PAGE_CACHE_ENABLED
+                    or request.method not in ('GET', 'HEAD')
+                    or not set(request.GET).issubset(params)):
+                return view(request, *args, **kwargs)
+            parts = state(request, *args, **kwargs)
+            if parts is None:
+                return view(request, *args, **kwargs)
+            position = [request.GET.get(name, '') for name in params]
+            source = repr((view.__module__, view.__qualname__,
+                           request.path, position, parts))
+            key = KEY_PREFIX + md5(source.encode()).hexdigest()
+            try:
+                content, content_type = swr.get_or_set(
+                    key, lambda: _render_body(view, request, args, kwargs),
+                    settings.PAGE_CACHE_TIMEOUT if timeout is None
+                    else timeout)
+            except _NotCacheable as error:
+                response = error.response
+                if not response.streaming:
+                    response.content = fill(
+                        response.content.decode(response.charset), request)
+                return response
+            return HttpResponse(fill(content, request),
+                                content_type=content_type)
+        return wrapper
+    return decorator
@@ -0,0 +1,150 @@
+"""Память по запросам и снимки tracemalloc.
+
+Режим включается настройкой MEMORY_TRACKING: под tracemalloc выделение
+памяти заметно медленнее, поэтому его включают на время расследования.
+Для каждого запроса пишется пик выделенной памяти сверх уже занятой и
+сколько из нее осталось занятым после ответа, сводка копится по имени
+URL. Пик у tracemalloc один на процесс, поэтому в многопоточном воркере
+одновременные запросы попадают в пики друг друга. Сбросить пик отдельно
+от трасс можно только с Python 3.9; на более старых пик запроса не
+меряется (None в сводке), иначе пришлось бы стирать и снимки.
+
+Снимки (`take_snapshot`) хранятся в памяти процесса, последние
+MEMORY_SNAPSHOTS штук; разница двух снимков показывает места в коде,
+память которых выросла между ними.
+"""
+import os
+import threading
+import tracemalloc
+from collections import deque
+from itertools import count
+
+from django.conf import settings
+from django.utils import timezone
+
+FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+KEY_TYPES = ('lineno', 'filename', 'traceback')
+PEAK_PER_REQUEST = hasattr(tracemalloc, 'reset_peak')
+
+_lock = threading.Lock()
+_numbers = count(1)
+# имя URL -> [запросов, максимальный пик, сумма пиков, сумма остатков]
+views = {}
+snapshots = deque()
+
+
+def start():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(settings.MEMORY_TRACE_FRAMES)
+
+
+def stop():
+    tracemalloc.stop()
+    with _lock:
+        views.clear()
+        snapshots.clear()
+
+
+def begin():
+    """Сбрасывает пик; возвращает занятую сейчас память."""
+    if PEAK_PER_REQUEST:
+        tracemalloc.reset_peak()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def end(view, before):
+    current, peak = tracemalloc.get_traced_memory()
+    peak = peak - before if PEAK_PER_REQUEST else None
+    retained = current - before
+    with _lock:
+        stats = views.setdefault(view, [0, 0, 0, 0])
+        stats[0] += 1
+        if peak is not None:
+            stats[1] = max(stats[1], peak)
+            stats[2] += peak
+        stats[3] += retained
+    return peak, retained
+
+
+def rss():
+    """Резидентная память процесса в байтах, если ее можно узнать."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def take_snapshot():
+    snapshot = tracemalloc.take_snapshot().filter_traces(FILTERS)
+    with _lock:
+        number = next(_numbers)
+        snapshots.append((number, timezone.now(), snapshot))
+        while len(snapshots) > settings.MEMORY_SNAPSHOTS:
+            snapshots.popleft()
+    return number
+
+
+def _site(traceback, key_type):
+    if key_type == 'filename':
+        return traceback[0].filename
+    return ' <- '.join(f'{frame.filename}:{frame.lineno}'
+                       for frame in traceback)
+
+
+def diff(old, new, key_type='lineno', limit=20):
+    """Места с наибольшим ростом памяти от снимка `old` к `new`."""
+    stats = new.compare_to(old, key_type)
+    return [{
+        'site': _site(stat.traceback, key_type),
+        'size': stat.size,
+        'size_diff': stat.size_diff,
+        'count': stat.count,
+        'count_diff': stat.count_diff,
+    } for stat in stats[:limit]]
+
+
+def view_report():
+    with _lock:
+        rows = [{
+            'view': view,
+            'requests': requests,
+            'peak_max': peak_max if PEAK_PER_REQUEST else None,
+            'peak_avg': peak_total // requests if PEAK_PER_REQUEST else None,
+            'retained_avg': retained_total // requests,
+        } for view, (requests, peak_max, peak_total, retained_total)
+            in views.items()]
+    return sorted(rows, key=lambda row: (row['peak_max'] or 0,
+                                         row['retained_avg']), reverse=True)
+
+
+def report(since=None, key_type='lineno', limit=20):
+    """Сводка по процессу и разница снимка `since` (по умолчанию
+    предпоследнего) с последним."""
+    current, peak = tracemalloc.get_traced_memory()
+    with _lock:
+        taken = list(snapshots)
+    data = {
+        'pid': os.getpid(),
+        'tracing': tracemalloc.is_tracing(),
+        'traced': current,
+        'traced_peak': peak,
+        'rss': rss(),
+        'views': view_report(),
+        'snapshots': [{'id': number, 'taken': when.isoformat()}
+                      for number, when, snapshot in taken],
+    }
+    if len(taken) >= 2:
+        old = next((item for item in taken if item[0] == since), taken[-2])
+        new = taken[-1]
+        data['diff'] = {
+            'from': old[0],
+            'to': new[0],
+            'sites': diff(old[2], new[2], key_type, limit),
+        }
+    return data
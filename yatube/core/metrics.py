@@ -0,0 +1,288 @@
+"""Метрики процессов сайта в текстовом формате Prometheus.
+
+Счетчики, измерители и гистограммы с фиксированными корзинами копятся в
+памяти процесса, а раз в METRICS_FLUSH_INTERVAL секунд их приращения
+добавляются к суммам в общем SQLite-файле METRICS_SPOOL. Поэтому
+страница /metrics/ любого воркера отдает сумму по всем воркерам.
+Измерители с функцией `collect` (например, глубина очередей задач)
+ничего не копят и считаются в момент запроса страницы.
+"""
+import atexit
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS samples (
+        name TEXT NOT NULL,
+        suffix TEXT NOT NULL,
+        labels TEXT NOT NULL,
+        le TEXT NOT NULL,
+        value REAL NOT NULL,
+        PRIMARY KEY (name, suffix, labels, le)
+    )
+'''
+ADD = '''
+    INSERT INTO samples VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (name, suffix, labels, le)
+    DO UPDATE SET value = value + excluded.value
+'''
+SET = 'INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?)'
+SUFFIXES = ('_bucket', '_sum', '_count')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def _escape(value):
+    return (str(value).replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def _number(value):
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+@contextmanager
+def spool(path=None):
+    db = sqlite3.connect(path or settings.METRICS_SPOOL, timeout=5)
+    try:
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute(SCHEMA)
+        with db:
+            yield db
+    finally:
+        db.close()
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, help_text, labels=(), collect=None):
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self.collect = collect
+
+    def labels(self, values):
+        return ','.join(f'{name}="{_escape(values[name])}"'
+                        for name in self.label_names)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry.add([((self.name, '', self.labels(labels), ''),
+                            amount)])
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        self.registry.set((self.name, '', self.labels(labels), ''), value)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, *args, buckets=LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = [(format(bound, 'g'), bound)
+                        for bound in sorted(buckets)]
+
+    def observe(self, value, **labels):
+        key = self.labels(labels)
+        # Корзины хранятся сразу накопленными, как их отдает Prometheus
+        updates = [((self.name, '_bucket', key, le), 1)
+                   for le, bound in self.buckets if value <= bound]
+        updates += [
+            ((self.name, '_bucket', key, '+Inf'), 1),
+            ((self.name, '_sum', key, ''), value),
+            ((self.name, '_count', key, ''), 1),
+        ]
+        self.registry.add(updates)
+
+
+class Registry:
+    def __init__(self, path=None):
+        self.path = path
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.pending = defaultdict(float)
+        self.gauges = {}
+        self.flushed = time.monotonic()
+
+    def _register(self, cls, *args, **kwargs):
+        metric = cls(self, *args, **kwargs)
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self._register(Counter, *args, **kwargs)
+
+    def gauge(self, *args, **kwargs):
+        return self._register(Gauge, *args, **kwargs)
+
+    def histogram(self, *args, **kwargs):
+        return self._register(Histogram, *args, **kwargs)
+
+    def add(self, updates):
+        with self.lock:
+            for key, amount in updates:
+                self.pending[key] += amount
+
+    def set(self, key, value):
+        with self.lock:
+            self.gauges[key] = value
+
+    def flush(self):
+        """Дописывает накопленное процессом в общий файл."""
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(float)
+            gauges, self.gauges = self.gauges, {}
+            self.flushed = time.monotonic()
+        if not pending and not gauges:
+            return
+        try:
+            with spool(self.path) as db:
+                db.executemany(ADD, [(*key, value)
+                                     for key, value in pending.items()])
+                db.executemany(SET, [(*key, value)
+                                     for key, value in gauges.items()])
+        except sqlite3.Error:
+            logger.exception('Не удалось записать метрики')
+            # Вернем приращения, чтобы не потерять их до следующей попытки
+            self.add(pending.items())
+            with self.lock:
+                for key, value in gauges.items():
+                    self.gauges.setdefault(key, value)
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flushed >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def samples(self):
+        """{метрика: [(суффикс, метки, le, значение)]} по всем воркерам."""
+        self.flush()
+        with spool(self.path) as db:
+            rows = db.execute(
+                'SELECT name, suffix, labels, le, value FROM samples')
+            samples = defaultdict(list)
+            for name, *sample in rows:
+                samples[name].append(tuple(sample))
+        for metric in self.metrics.values():
+            if metric.collect is not None:
+                samples[metric.name] = [
+                    ('', metric.labels(labels), '', value)
+                    for labels, value in metric.collect(samples)
+                ]
+        return samples
+
+    def exposition(self):
+        """Все метрики в текстовом формате Prometheus 0.0.4."""
+        samples = self.samples()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {name} {_escape(metric.help_text)}')
+            lines.append(f'# TYPE {name} {metric.kind}')
+            for suffix, labels, le, value in sorted(
+                    samples.get(name, ()), key=_order):
+                if le:
+                    labels = ','.join(filter(None, (labels, f'le="{le}"')))
+                labels = f'{{{labels}}}' if labels else ''
+                lines.append(f'{name}{suffix}{labels} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _order(sample):
+    suffix, labels, le, value = sample
+    return (labels, SUFFIXES.index(suffix) if suffix in SUFFIXES else 0,
+            float(le) if le else 0)
+
+
+def hit_ratio(counter):
+    """`collect` для доли hit среди hit и miss счетчика с меткой result,
+    отдельно по каждому набору остальных меток."""
+    def collect(samples):
+        totals = defaultdict(lambda: {'hit': 0, 'miss': 0})
+        for suffix, labels, le, value in samples.get(counter.name, ()):
+            values = dict(LABEL.findall(labels))
+            result = values.pop('result', None)
+            if result in ('hit', 'miss'):
+                totals[tuple(sorted(values.items()))][result] += value
+        for group, counts in totals.items():
+            total = counts['hit'] + counts['miss']
+            if total:
+                yield dict(group), counts['hit'] / total
+    return collect
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+REQUESTS = registry.counter(
+    'yatube_http_requests_total', 'Ответы по имени URL, методу и коду',
+    ('view', 'method', 'status'))
+LATENCY = registry.histogram(
+    'yatube_http_request_duration_seconds', 'Время ответа по имени URL',
+    ('view',))
+DB_TIME = registry.histogram(
+    'yatube_http_request_db_seconds', 'Время SQL за ответ по имени URL',
+    ('view',))
+DB_QUERIES = registry.counter(
+    'yatube_db_queries_total', 'SQL-запросы по имени URL', ('view',))
+CACHE_REQUESTS = registry.counter(
+    'yatube_cache_requests_total', 'Чтения ключей кэша: hit или miss',
+    ('result',))
+CACHE_HIT_RATIO = registry.gauge(
+    'yatube_cache_hit_ratio', 'Доля чтений кэша, нашедших ключ',
+    collect=hit_ratio(CACHE_REQUESTS))
+TIER_REQUESTS = registry.counter(
+    'yatube_cache_tier_requests_total',
+    'Чтения уровней кэша: l1 - память процесса, l2 - общий кэш',
+    ('tier', 'result'))
+TIER_HIT_RATIO = registry.gauge(
+    'yatube_cache_tier_hit_ratio', 'Доля попаданий по уровням кэша',
+    ('tier',), collect=hit_ratio(TIER_REQUESTS))
+QUERY_CACHE_REQUESTS = registry.counter(
+    'yatube_query_cache_requests_total',
+    'Выборки через кэш запросов ORM по модели: hit или miss',
+    ('model', 'result'))
+QUERY_CACHE_HIT_RATIO = registry.gauge(
+    'yatube_query_cache_hit_ratio', 'Доля выборок, взятых из кэша',
+    ('model',), collect=hit_ratio(QUERY_CACHE_REQUESTS))
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+def record(request, response, seconds, request_timing=None):
+    view = view_name(request)
+    REQUESTS.inc(view=view, method=request.method,
+                 status=response.status_code)
+    LATENCY.observe(seconds, view=view)
+    if request_timing is None:
+        return
+    queries, sql_seconds = request_timing.metrics.get('sql', (0, 0.0))
+    DB_TIME.observe(sql_seconds, view=view)
+    if queries:
+        DB_QUERIES.inc(queries, view=view)
+    for result, count in request_timing.cache.items():
+        if count:
+            CACHE_REQUESTS.inc(count, result=result)
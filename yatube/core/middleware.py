@@ -0,0 +1,117 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import memory, metrics, nplusone, profiler, timing
+
+logger = logging.getLogger('core.nplusone')
+timing_logger = logging.getLogger('core.timing')
+
+
+class ServerTimingMiddleware:
+    """Время ответа, SQL, кэша, превью и шаблонов в Server-Timing и лог.
+
+    Стоит первым, чтобы `total` покрывал все остальные middleware.
+    """
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING_ENABLED:
+            raise MiddlewareNotUsed
+        timing.install(settings.CACHES)
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_timing = timing.RequestTiming()
+        with ExitStack() as stack:
+            stack.enter_context(request_timing.active())
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(request_timing))
+            response = self.get_response(request)
+        response['Server-Timing'] = timing.header(request_timing)
+        timing_logger.info(json.dumps(
+            timing.log_record(request, response, request_timing),
+            ensure_ascii=False))
+        return response
+
+
+class MetricsMiddleware:
+    """Время, коды ответов, SQL и чтения кэша по имени URL в метрики.
+
+    SQL и кэш берутся из замеров `ServerTimingMiddleware`, поэтому стоит
+    после него; без него пишутся только время и коды ответов.
+    """
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        metrics.record(request, response, time.perf_counter() - started,
+                       timing.current())
+        metrics.registry.maybe_flush()
+        return response
+
+
+class ProfilerMiddleware:
+    """Отмечает, какой URL обрабатывает поток, для `core.profiler`."""
+
+    def __init__(self, get_response):
+        if not settings.PROFILER_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            return self.get_response(request)
+        finally:
+            profiler.leave()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        profiler.enter(request.resolver_match.view_name)
+
+
+class MemoryMiddleware:
+    """Пик и остаток памяти каждого запроса по имени URL."""
+
+    def __init__(self, get_response):
+        if not settings.MEMORY_TRACKING:
+            raise MiddlewareNotUsed
+        memory.start()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        before = memory.begin()
+        response = self.get_response(request)
+        memory.end(metrics.view_name(request), before)
+        return response
+
+
+class NPlusOneMiddleware:
+    """Пишет в лог запросы, повторенные больше NPLUSONE_THRESHOLD раз."""
+
+    def __init__(self, get_response):
+        if not settings.NPLUSONE_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        collector = nplusone.QueryCollector()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(collector))
+            response = self.get_response(request)
+        repeated = collector.repeated(settings.NPLUSONE_THRESHOLD)
+        if repeated:
+            logger.warning(nplusone.report(request.path, repeated))
+            if settings.NPLUSONE_HEADER:
+                response['X-N-Plus-One'] = nplusone.header(repeated)
+        return response
@@ -0,0 +1,86 @@
+"""Поиск N+1: одинаковых запросов, повторенных за один ответ.
+
+Запросы группируются по форме (`core.budgets.shape`), а для каждого
+запоминается место вызова: кадры кода проекта и цепочка узлов шаблона -
+`{% include %}`, `{% for %}` и переменная, из-за которой ушел запрос.
+Обход стека на каждый запрос не бесплатен, поэтому сборщик включают
+только при разработке и на стенде.
+"""
+import os
+import sys
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.template.base import Node
+
+from .budgets import shape
+
+RENDER_CODE = Node.render_annotated.__code__
+THIS_FILE = os.path.abspath(__file__)
+
+
+def _template_frame(node):
+    origin = getattr(node, 'origin', None)
+    token = getattr(node, 'token', None)
+    if origin is None or token is None:
+        return None
+    name = origin.template_name or origin.name
+    return f'{name}:{token.lineno} {{{token.contents[:60]}}}'
+
+
+def call_site(frame):
+    """(кадры проекта, узлы шаблонов) от места запроса наружу."""
+    python, template = [], []
+    while frame is not None:
+        code = frame.f_code
+        if code is RENDER_CODE:
+            location = _template_frame(frame.f_locals.get('self'))
+            if location and (not template or template[-1] != location):
+                template.append(location)
+        elif (code.co_filename.startswith(settings.BASE_DIR)
+              and os.path.abspath(code.co_filename) != THIS_FILE):
+            path = os.path.relpath(code.co_filename, settings.BASE_DIR)
+            python.append(f'{path}:{frame.f_lineno} in {code.co_name}')
+        frame = frame.f_back
+    return tuple(python), tuple(template)
+
+
+class QueryCollector:
+    """Обертка `connection.execute_wrapper`, считающая формы запросов."""
+
+    def __init__(self):
+        self.counts = Counter()
+        self.sites = defaultdict(Counter)
+
+    def __call__(self, execute, sql, params, many, context):
+        statement = shape(sql)
+        self.counts[statement] += 1
+        self.sites[statement][call_site(sys._getframe(1))] += 1
+        return execute(sql, params, many, context)
+
+    def repeated(self, threshold):
+        """[(форма, сколько раз, самое частое место вызова)]."""
+        return [
+            (statement, count,
+             self.sites[statement].most_common(1)[0][0])
+            for statement, count in self.counts.most_common()
+            if count > threshold
+        ]
+
+
+def report(path, repeated):
+    lines = [f'N+1 в {path}:']
+    for statement, count, (python, template) in repeated:
+        lines.append(f'  {count} раз: {statement}')
+        lines.extend(f'    шаблон {frame}' for frame in template)
+        lines.extend(f'    код {frame}' for frame in python)
+    return '\n'.join(lines)
+
+
+def header(repeated, limit=3):
+    """Короткая сводка для заголовка ответа, только ASCII."""
+    parts = []
+    for statement, count, (python, template) in repeated[:limit]:
+        where = template[0] if template else (python[0] if python else '?')
+        parts.append(f'{count}x {statement[:80]} @ {where}')
+    return '; '.join(parts).encode('ascii', 'backslashreplace').decode()
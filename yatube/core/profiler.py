@@ -0,0 +1,151 @@
+"""Статистический профилировщик работающего воркера.
+
+Пока идет сеанс, отдельный поток раз в PROFILER_INTERVAL секунд снимает
+стеки потоков, которые сейчас обрабатывают запрос (если задан `view` -
+только запросы к этому URL), и считает одинаковые стеки. Результат -
+свернутые стеки в PROFILER_DIR: строки «кадр;кадр;...;кадр число»,
+которые понимают flamegraph.pl и speedscope. Вне сеанса профилировщик
+обходится записью имени URL текущего запроса в словарь.
+"""
+import os
+import re
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+
+# id потока -> имя URL запроса, который он сейчас обрабатывает
+_requests = {}
+_lock = threading.Lock()
+_session = None
+SUFFIX = '.collapsed'
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def enter(view):
+    _requests[threading.get_ident()] = view
+
+
+def leave():
+    _requests.pop(threading.get_ident(), None)
+
+
+@lru_cache(maxsize=None)
+def _short(path):
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and path.startswith(prefix + os.sep):
+            return path[len(prefix) + 1:]
+    return path
+
+
+def collapse(frame, root):
+    """Стек кадра от корня к вершине одной строкой через `;`."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} '
+                     f'({_short(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    names.append(root)
+    return ';'.join(reversed(names))
+
+
+class Session(threading.Thread):
+    def __init__(self, seconds, view=None, interval=None, directory=None):
+        super().__init__(name='profiler', daemon=True)
+        self.seconds = seconds
+        self.view = view
+        self.interval = interval or settings.PROFILER_INTERVAL
+        self.directory = directory or settings.PROFILER_DIR
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        target = re.sub(r'\W', '_', view or 'all')
+        self.profile = f'{stamp}-{os.getpid()}-{target}'
+        self.stacks = Counter()
+        self.ticks = 0
+
+    def sample(self):
+        frames = sys._current_frames()
+        own = threading.get_ident()
+        for ident, view in list(_requests.items()):
+            if ident == own or (self.view and view != self.view):
+                continue
+            frame = frames.get(ident)
+            if frame is not None:
+                self.stacks[collapse(frame, view)] += 1
+        self.ticks += 1
+
+    def run(self):
+        deadline = time.monotonic() + self.seconds
+        while time.monotonic() < deadline:
+            self.sample()
+            time.sleep(self.interval)
+        self.save()
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, self.profile + SUFFIX)
+        with open(path + '.tmp', 'w', encoding='utf-8') as target:
+            for stack, count in self.stacks.most_common():
+                target.write(f'{stack} {count}\n')
+        os.replace(path + '.tmp', path)
+        return path
+
+
+def start(seconds, view=None, interval=None):
+    """Запускает сеанс в фоне; в процессе идет не больше одного сеанса."""
+    global _session
+    # Без ожидания: обработчик сигнала не должен ждать прерванный им поток
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusy('')
+    try:
+        if _session is not None and _session.is_alive():
+            raise ProfilerBusy(_session.profile)
+        _session = Session(min(seconds, settings.PROFILER_MAX_SECONDS),
+                           view, interval)
+        _session.start()
+        return _session
+    finally:
+        _lock.release()
+
+
+def profiles():
+    """Готовые профили, новые первыми."""
+    try:
+        names = os.listdir(settings.PROFILER_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted((name[:-len(SUFFIX)] for name in names
+                   if name.endswith(SUFFIX)), reverse=True)
+
+
+def read(profile):
+    if profile not in profiles():
+        raise FileNotFoundError(profile)
+    path = os.path.join(settings.PROFILER_DIR, profile + SUFFIX)
+    with open(path, encoding='utf-8') as source:
+        return source.read()
+
+
+def _on_signal(signum, frame):
+    try:
+        start(settings.PROFILER_SIGNAL_SECONDS)
+    except ProfilerBusy:
+        pass
+
+
+def install_signal():
+    """`kill -USR2 <pid>` профилирует все запросы воркера."""
+    if not settings.PROFILER_SIGNAL:
+        return
+    try:
+        signal.signal(getattr(signal, settings.PROFILER_SIGNAL), _on_signal)
+    except ValueError:
+        # Сигналы ставятся только из главного потока
+        pass
@@ -0,0 +1,246 @@
+"""Кэш результатов запросов ORM со сбросом по таблицам.
+
+Кэшируются только выборки, обернутые в `cached(queryset)`, и только для
+моделей из QUERY_CACHE_MODELS; для остальных `cached` ничего не меняет.
+Ключ - хеш SQL с параметрами и версий всех таблиц, которые читает
+запрос: из FROM и JOIN самого SQL (вместе с подзапросами) и таблиц
+prefetch_related. Версии ведутся только для таблиц, которые могут читать
+кэшируемые модели: их собственных, связанных через ForeignKey,
+OneToOne и ManyToMany; запрос, задевший другую таблицу (например, через
+обратный ForeignKey), в кэш не идет. Версии лежат в общем кэше, как у
+фрагментов лент, и растут при записи в такую таблицу: обертка курсора
+узнает таблицу по INSERT, UPDATE и DELETE, поэтому кэш сбрасывают и
+массовые update() и delete(), и bulk_create, и F-выражения счетчиков.
+В транзакции версия растет один раз, после коммита: то, что другие
+воркеры до него закэшируют под старой версией, станет недоступно, а сама
+транзакция после записи читает мимо кэша.
+"""
+import hashlib
+import re
+import time
+from collections import Counter
+from functools import lru_cache
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, FieldDoesNotExist
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models import Prefetch, prefetch_related_objects
+from django.db.models.constants import LOOKUP_SEP
+
+from . import metrics, swr
+
+KEY_PREFIX = 'query:'
+VERSION_PREFIX = 'query_table:'
+READ_TABLES = re.compile(r'\b(?:FROM|JOIN)\s+[`"]?(\w+)', re.IGNORECASE)
+WRITE_TABLE = re.compile(
+    r'\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO'
+    r'|UPDATE(?:\s+OR\s+\w+)?|DELETE\s+FROM)\s+[`"]?(\w+)',
+    re.IGNORECASE)
+
+# (модель, hit или miss) -> чтений в этом процессе
+stats = Counter()
+_classes = {}
+
+
+def enabled(model):
+    return model._meta.label in settings.QUERY_CACHE_MODELS
+
+
+@lru_cache(maxsize=None)
+def _tables_of(labels):
+    tables = set()
+    for label in labels:
+        model = apps.get_model(label)
+        tables.add(model._meta.db_table)
+        for field in model._meta.get_fields(include_hidden=True):
+            related = field.related_model
+            if related is None or field.one_to_many:
+                continue
+            if field.many_to_many:
+                relation = field if field.auto_created else field.remote_field
+                tables.add(relation.through._meta.db_table)
+            tables.add(related._meta.db_table)
+    return frozenset(tables)
+
+
+def tracked_tables():
+    """Таблицы, которые могут читать выборки моделей QUERY_CACHE_MODELS."""
+    return _tables_of(tuple(settings.QUERY_CACHE_MODELS))
+
+
+def _version_key(table):
+    return VERSION_PREFIX + table
+
+
+def _fresh_version():
+    # Со времени, чтобы после потери кэша не совпасть со старыми ключами
+    return int(time.time() * 1000)
+
+
+def versions(tables):
+    keys = [_version_key(table) for table in tables]
+    found = cache.get_many(keys)
+    missing = {key: _fresh_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def bump(tables):
+    for table in tables:
+        try:
+            cache.incr(_version_key(table))
+        except ValueError:
+            cache.set(_version_key(table), _fresh_version(), timeout=None)
+
+
+class _BumpOnCommit:
+    def __init__(self):
+        self.tables = set()
+
+    def __call__(self):
+        bump(self.tables)
+
+
+def _commit_bump(connection):
+    """Сброс после коммита текущей транзакции, если она уже писала."""
+    callback = getattr(connection, 'query_cache_bump', None)
+    if callback is None or not connection.in_atomic_block:
+        return None
+    # После отката Django выбрасывает колбэки, а с ними и наш
+    if any(entry[1] is callback for entry in connection.run_on_commit):
+        return callback
+    return None
+
+
+def track_writes(execute, sql, params, many, context):
+    result = execute(sql, params, many, context)
+    match = WRITE_TABLE.match(sql)
+    if match and match.group(1) in tracked_tables():
+        table = match.group(1)
+        connection = context['connection']
+        if not connection.in_atomic_block:
+            bump([table])
+            return result
+        callback = _commit_bump(connection)
+        if callback is None:
+            callback = connection.query_cache_bump = _BumpOnCommit()
+            connection.on_commit(callback)
+        callback.tables.add(table)
+    return result
+
+
+def _attach(sender=None, connection=None, **kwargs):
+    if track_writes not in connection.execute_wrappers:
+        connection.execute_wrappers.append(track_writes)
+
+
+def install():
+    """Ставит отслеживание записей на все соединения, и будущие тоже."""
+    connection_created.connect(_attach)
+    for connection in connections.all():
+        _attach(connection=connection)
+
+
+def prefetch_tables(model, lookups):
+    """Таблицы, которые прочитает prefetch_related, или None, если их
+    не узнать по полям (GenericForeignKey и т.п.)."""
+    tables = set()
+    for lookup in lookups:
+        if isinstance(lookup, Prefetch):
+            lookup = lookup.prefetch_through
+        current = model
+        for name in lookup.split(LOOKUP_SEP):
+            try:
+                field = current._meta.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if field.many_to_many:
+                relation = field if field.auto_created else field.remote_field
+                tables.add(relation.through._meta.db_table)
+            current = field.related_model
+            if current is None:
+                return None
+            tables.add(current._meta.db_table)
+    return tables
+
+
+class CachedQuerySetMixin:
+    query_cache_timeout = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone.query_cache_timeout = self.query_cache_timeout
+        return clone
+
+    def _query_cache_key(self):
+        if not enabled(self.model) or self.query.select_for_update:
+            return None
+        if _commit_bump(connections[self.db]) is not None:
+            return None
+        try:
+            sql, params = self.query.get_compiler(self.db).as_sql()
+        except EmptyResultSet:
+            return None
+        tables = prefetch_tables(self.model, self._prefetch_related_lookups)
+        if tables is None:
+            return None
+        tables = tables.union(READ_TABLES.findall(sql))
+        if not tables <= tracked_tables():
+            # Записи в эти таблицы кэш не сбрасывают
+            return None
+        tables = sorted(tables)
+        source = repr((
+            self.db, self._iterable_class.__name__, self._fields,
+            ' '.join(sql.split()), params, tables, versions(tables),
+        ))
+        return KEY_PREFIX + hashlib.md5(source.encode()).hexdigest()
+
+    def _fetch_uncached(self):
+        self._query_cache_miss = True
+        results = list(self._iterable_class(self))
+        if self._prefetch_related_lookups:
+            prefetch_related_objects(results, *self._prefetch_related_lookups)
+        return results
+
+    def _fetch_all(self):
+        key = None if self._result_cache is not None else (
+            self._query_cache_key())
+        if key is not None:
+            self._query_cache_miss = False
+            timeout = self.query_cache_timeout
+            self._result_cache = swr.get_or_set(
+                key, self._fetch_uncached,
+                settings.QUERY_CACHE_TIMEOUT if timeout is None else timeout,
+                wait=False)
+            self._prefetch_done = True
+            result = 'miss' if self._query_cache_miss else 'hit'
+            label = self.model._meta.label
+            stats[label, result] += 1
+            metrics.QUERY_CACHE_REQUESTS.inc(model=label, result=result)
+        super()._fetch_all()
+
+
+def _cached_class(cls):
+    if cls not in _classes:
+        _classes[cls] = type(
+            'Cached' + cls.__name__, (CachedQuerySetMixin, cls), {})
+    return _classes[cls]
+
+
+def cached(queryset, timeout=None):
+    """Копия выборки (или менеджера), результаты которой берутся из кэша.
+
+    Годится и для `get_object_or_404`: `get()` вычисляет выборку так же.
+    """
+    queryset = queryset.all()
+    if not enabled(queryset.model):
+        return queryset
+    if not isinstance(queryset, CachedQuerySetMixin):
+        queryset.__class__ = _cached_class(type(queryset))
+    queryset.query_cache_timeout = timeout
+    return queryset
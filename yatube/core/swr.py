@@ -0,0 +1,125 @@
+"""Мягкий и жесткий сроки записей кэша против лавины пересчетов.
+
+Запись лежит в кэше до жесткого срока (мягкий плюс SWR_GRACE), но после
+мягкого считается устаревшей. Первый запрос, заметивший это, берет
+блокировку (`cache.add`, общую для всех воркеров) и пересчитывает
+значение, а остальные до конца пересчета получают устаревшее. Чтобы
+пересчеты не собирались ровно на мягком сроке, пересчет начинается
+раньше с вероятностью, которая растет к сроку и с временем прошлого
+пересчета (XFetch: now - delta * beta * ln(rand) >= срок). При полном
+промахе запросы без блокировки ждут значение до SWR_LOCK_WAIT секунд, а
+потом считают сами.
+"""
+import math
+import random
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+
+LOCK_PREFIX = 'swr-lock:'
+POLL_INTERVAL = 0.05
+
+Envelope = namedtuple('Envelope', 'value soft_expires delta')
+Lookup = namedtuple('Lookup', 'value found refresh')
+
+# Блокировки, взятые этим потоком: ключ -> когда истекут
+_local = threading.local()
+
+
+def _held():
+    if not hasattr(_local, 'locks'):
+        _local.locks = {}
+    return _local.locks
+
+
+def _due(envelope, beta):
+    if envelope.soft_expires is None:
+        return False
+    early = envelope.delta * beta * -math.log(1 - random.random())
+    return time.time() + early >= envelope.soft_expires
+
+
+def _lock(cache, key):
+    now = time.monotonic()
+    if _held().get(key, 0) > now:
+        return True
+    timeout = settings.SWR_LOCK_TIMEOUT
+    if cache.add(LOCK_PREFIX + key, 1, timeout):
+        _held()[key] = now + timeout
+        return True
+    return False
+
+
+def _release(cache, key):
+    if _held().pop(key, None) is not None:
+        cache.delete(LOCK_PREFIX + key)
+
+
+def _get(cache, key):
+    envelope = cache.get(key)
+    # Значения, записанные не через store, считаем промахом
+    return envelope if isinstance(envelope, Envelope) else None
+
+
+def lookup(key, cache=default_cache, wait=True, beta=None):
+    """Значение и нужно ли его пересчитать этому запросу.
+
+    `refresh` означает, что запрос держит блокировку (или не дождался
+    чужого пересчета) и должен вызвать `store`. Без `wait` промах при
+    чужой блокировке сразу возвращает refresh, не дожидаясь значения.
+    Повторный вызов в потоке, который уже держит блокировку ключа, тоже
+    возвращает refresh.
+    """
+    beta = settings.SWR_BETA if beta is None else beta
+    envelope = _get(cache, key)
+    if _held().get(key, 0) > time.monotonic():
+        # Поток уже взял блокировку (представление до шаблона): решение
+        # не перебрасываем, иначе она провисит до SWR_LOCK_TIMEOUT
+        return Lookup(envelope and envelope.value, envelope is not None,
+                      True)
+    if envelope is not None:
+        if not _due(envelope, beta):
+            return Lookup(envelope.value, True, False)
+        return Lookup(envelope.value, True, _lock(cache, key))
+    if _lock(cache, key) or not wait:
+        return Lookup(None, False, True)
+    deadline = time.monotonic() + settings.SWR_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        envelope = _get(cache, key)
+        if envelope is not None:
+            return Lookup(envelope.value, True, False)
+    return Lookup(None, False, True)
+
+
+def store(key, value, timeout, delta=0, cache=default_cache):
+    """Записывает значение с мягким сроком `timeout` и снимает блокировку.
+
+    `delta` - сколько секунд заняло вычисление, от него зависит, насколько
+    рано начнется следующий пересчет.
+    """
+    if timeout is None:
+        soft_expires = hard_timeout = None
+    else:
+        soft_expires = time.time() + timeout
+        hard_timeout = timeout + settings.SWR_GRACE
+    cache.set(key, Envelope(value, soft_expires, delta), hard_timeout)
+    _release(cache, key)
+
+
+def get_or_set(key, compute, timeout, cache=default_cache, wait=True):
+    found = lookup(key, cache, wait)
+    if not found.refresh:
+        return found.value
+    started = time.perf_counter()
+    try:
+        value = compute()
+    except Exception:
+        # Пусть пересчитает следующий запрос, а не ждет конца блокировки
+        _release(cache, key)
+        raise
+    store(key, value, timeout, time.perf_counter() - started, cache)
+    return value
@@ -0,0 +1,21 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core import holes
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, template_name, **args):
+    """Часть страницы, своя у каждого пользователя.
+
+        {% hole 'posts/includes/comment_form.html' post_id=post.pk %}
+
+    При рендеринге для `cached_page` оставляет метку, которую потом
+    заполняет `holes.fill`, иначе сразу отрисовывает шаблон.
+    """
+    request = context.get('request')
+    if holes.punching(request):
+        return mark_safe(holes.marker(template_name, args))
+    return mark_safe(holes.render(request, template_name, args))
@@ -0,0 +1,40 @@
+from django import template
+from django.core.cache.utils import make_template_fragment_key
+
+from core import swr
+
+register = template.Library()
+
+
+class StaleCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        timeout = self.timeout.resolve(context)
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        return swr.get_or_set(
+            key, lambda: self.nodelist.render(context),
+            None if timeout is None else int(timeout))
+
+
+@register.tag
+def swrcache(parser, token):
+    """Как `{% cache %}`, но после срока отдает устаревший фрагмент, пока
+    один запрос его пересчитывает.
+
+        {% swrcache timeout fragment_name var1 var2 %}...{% endswrcache %}
+    """
+    nodelist = parser.parse(('endswrcache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]} требует срок и имя фрагмента')
+    return StaleCacheNode(
+        nodelist, parser.compile_filter(tokens[1]), tokens[2],
+        [parser.compile_filter(token) for token in tokens[3:]])
@@ -1,6 +1,29 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
 from http import HTTPStatus
+from unittest import mock
 
-from django.test import TestCase, Client
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template import engines
+from django.db import transaction
+from django.test import (TestCase, TransactionTestCase, Client,
+                         override_settings)
+from django.urls import path
+
+from posts.models import Comment, Follow, Group, Post
+from tasks.models import Task
+
+from . import memory, profiler, querycache, swr
+from .budgets import Budget, query_budget
+from .cache import LocalTier, SQLiteCache, TieredCache
+from .metrics import Registry
 
 
 class PostURLTests(TestCase):
@@ -11,3 +34,525 @@ class PostURLTests(TestCase):
         response = self.guest_client.get('/nowhere_address/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class QueryBudgetTests(TestCase):
+    def test_exceeded_budget_lists_repeated_queries(self):
+        User = get_user_model()
+        ids = [User.objects.create_user(username=f'user{number}').pk
+               for number in range(3)]
+        with self.assertRaisesMessage(AssertionError, '[повторяется 3 раз]'):
+            with query_budget('n+1', Budget(queries=2, sql_ms=1000)):
+                for pk in ids:
+                    User.objects.get(pk=pk)
+        with query_budget('ok', Budget(queries=1, sql_ms=1000)):
+            User.objects.filter(pk__in=ids).count()
+
+
+def authors_view(request):
+    template = engines['django'].from_string(
+        '{% for author in authors %}{{ author.stats.posts_count }}'
+        '{% endfor %}')
+    authors = get_user_model().objects.order_by('pk')
+    return HttpResponse(template.render({'authors': authors}))
+
+
+def cached_authors_view(request):
+    cache.get_or_set('authors', lambda: list(
+        get_user_model().objects.values_list('username', flat=True)))
+    return authors_view(request)
+
+
+urlpatterns = [
+    path('authors/', authors_view),
+    path('cached-authors/', cached_authors_view),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__, NPLUSONE_THRESHOLD=2,
+                   MIDDLEWARE=['core.middleware.NPlusOneMiddleware'])
+class NPlusOneMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for number in range(3):
+            get_user_model().objects.create_user(username=f'user{number}')
+
+    @override_settings(NPLUSONE_ENABLED=True, NPLUSONE_HEADER=True)
+    def test_repeated_query_reported_with_template_and_code(self):
+        with self.assertLogs('core.nplusone', 'WARNING') as logs:
+            response = Client().get('/authors/')
+        self.assertIn('3x SELECT', response['X-N-Plus-One'])
+        self.assertIn('{author.stats.posts_count}', response['X-N-Plus-One'])
+        report = logs.output[0]
+        self.assertIn('шаблон <unknown source>:1 {author.stats.posts_count}',
+                      report)
+        self.assertIn('in authors_view', report)
+
+    @override_settings(NPLUSONE_ENABLED=True, NPLUSONE_HEADER=True,
+                       NPLUSONE_THRESHOLD=3)
+    def test_below_threshold_is_quiet(self):
+        response = Client().get('/authors/')
+        self.assertNotIn('X-N-Plus-One', response)
+
+
+@override_settings(ROOT_URLCONF=__name__, MIDDLEWARE=[
+    'core.middleware.ServerTimingMiddleware'])
+class ServerTimingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        get_user_model().objects.create_user(username='author')
+
+    def test_header_and_log_line(self):
+        cache.clear()
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            response = Client().get('/cached-authors/')
+        metrics = {part.split(';')[0]: part
+                   for part in response['Server-Timing'].split(', ')}
+        self.assertIn('total', metrics)
+        self.assertIn('sql;desc="3"', metrics['sql'])
+        self.assertIn('cache-get;desc="2"', metrics['cache-get'])
+        self.assertIn('cache-set;desc="1"', metrics['cache-set'])
+        self.assertIn('tpl1', metrics)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], '/cached-authors/')
+        self.assertEqual(record['sql_count'], 3)
+        self.assertEqual(len(record['templates']), 1)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.spool = os.path.join(directory.name, 'metrics.sqlite3')
+
+    def worker(self):
+        registry = Registry(self.spool)
+        counter = registry.counter('hits_total', 'Запросы', ('view',))
+        histogram = registry.histogram('latency_seconds', 'Время',
+                                       buckets=(0.1, 1))
+        return registry, counter, histogram
+
+    def test_workers_are_summed_through_spool(self):
+        first, first_counter, first_histogram = self.worker()
+        second, second_counter, second_histogram = self.worker()
+        first_counter.inc(view='posts:index')
+        second_counter.inc(2, view='posts:index')
+        first_histogram.observe(0.05)
+        second_histogram.observe(0.5)
+        second.flush()
+        lines = first.exposition().splitlines()
+        self.assertIn('# TYPE hits_total counter', lines)
+        self.assertIn('hits_total{view="posts:index"} 3', lines)
+        self.assertEqual(lines[-5:], [
+            'latency_seconds_bucket{le="0.1"} 1',
+            'latency_seconds_bucket{le="1"} 2',
+            'latency_seconds_bucket{le="+Inf"} 2',
+            'latency_seconds_sum 0.55',
+            'latency_seconds_count 2',
+        ])
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_endpoint_reports_views_and_queues(self):
+        Task.objects.create(name='tests.remember', queue='mail')
+        with override_settings(METRICS_SPOOL=self.spool):
+            Client().get('/about/author/')
+            response = Client().get(
+                '/metrics/', HTTP_AUTHORIZATION='Bearer scrape-me')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        text = response.content.decode()
+        self.assertIn('yatube_http_requests_total{view="about:author",'
+                      'method="GET",status="200"}', text)
+        self.assertIn('yatube_http_request_duration_seconds_bucket{'
+                      'view="about:author",le="+Inf"}', text)
+        self.assertIn('yatube_task_queue_depth{queue="mail",state="ready"} 1',
+                      text)
+
+    @override_settings(METRICS_TOKEN='scrape-me')
+    def test_endpoint_hidden_without_token(self):
+        # Локальный прокси не дает доступа сам по себе
+        for headers in ({}, {'HTTP_AUTHORIZATION': 'Bearer wrong'}):
+            with self.subTest(headers=headers):
+                response = Client().get('/metrics/', **headers)
+                self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.5'])
+    def test_endpoint_open_to_configured_addresses(self):
+        with override_settings(METRICS_SPOOL=self.spool):
+            response = Client(REMOTE_ADDR='10.0.0.5').get('/metrics/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = Client(REMOTE_ADDR='10.0.0.1').get('/metrics/')
+        self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
+
+
+def busy_view_code(view, stop):
+    profiler.enter(view)
+    try:
+        while not stop.is_set():
+            sum(range(1000))
+    finally:
+        profiler.leave()
+
+
+class ProfilerTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_override = override_settings(
+            PROFILER_DIR=directory.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def run_busy(self, *views):
+        stop = threading.Event()
+        threads = [threading.Thread(target=busy_view_code, args=(view, stop))
+                   for view in views]
+        for thread in threads:
+            thread.start()
+        self.addCleanup(stop.set)
+        return stop
+
+    def test_samples_only_requested_view(self):
+        self.run_busy('posts:index', 'posts:profile')
+        session = profiler.Session(0.1, view='posts:index', interval=0.001)
+        session.run()
+        self.assertGreater(session.ticks, 0)
+        self.assertTrue(session.stacks)
+        for stack in session.stacks:
+            self.assertTrue(stack.startswith('posts:index;'))
+            self.assertIn(';busy_view_code (core/tests.py:', stack)
+        text = profiler.read(session.profile)
+        stack, count = text.splitlines()[0].rsplit(' ', 1)
+        self.assertEqual(session.stacks[stack], int(count))
+
+    def test_staff_starts_session_and_reads_result(self):
+        staff = get_user_model().objects.create_user(
+            username='staff', is_staff=True)
+        client = Client()
+        client.force_login(staff)
+        self.run_busy('about:author')
+        response = client.post('/profiler/', {'seconds': 0.05})
+        self.assertEqual(response.status_code, HTTPStatus.ACCEPTED)
+        profile = response.json()['profile']
+        self.assertEqual(client.post('/profiler/').status_code,
+                         HTTPStatus.CONFLICT)
+        profiler._session.join()
+        self.assertIn(profile, client.get('/profiler/').json()['profiles'])
+        response = client.get(f'/profiler/{profile}/')
+        self.assertIn('about:author;', response.content.decode())
+        self.assertEqual(client.get('/profiler/missing/').status_code,
+                         HTTPStatus.NOT_FOUND)
+
+    def test_guest_cannot_profile(self):
+        response = Client().post('/profiler/', {'seconds': 1})
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.assertEqual(profiler.profiles(), [])
+
+
+@override_settings(MEMORY_TRACKING=True)
+class MemoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = get_user_model().objects.create_user(
+            username='staff', is_staff=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.staff)
+        self.addCleanup(memory.stop)
+
+    def test_peaks_collected_per_view(self):
+        for _ in range(2):
+            Client().get('/about/author/')
+        report = self.client.get('/memory/').json()
+        self.assertTrue(report['tracing'])
+        views = {row['view']: row for row in report['views']}
+        self.assertEqual(views['about:author']['requests'], 2)
+        self.assertGreater(views['about:author']['peak_max'], 0)
+
+    @mock.patch.object(memory, 'PEAK_PER_REQUEST', False)
+    def test_peaks_unknown_without_reset_peak(self):
+        # Python 3.7 и 3.8: tracemalloc.reset_peak еще нет
+        with mock.patch.object(tracemalloc, 'reset_peak',
+                               side_effect=AssertionError, create=True):
+            Client().get('/about/author/')
+        views = {row['view']: row
+                 for row in self.client.get('/memory/').json()['views']}
+        self.assertEqual(views['about:author']['requests'], 1)
+        self.assertIsNone(views['about:author']['peak_max'])
+        self.assertIn('retained_avg', views['about:author'])
+
+    def test_snapshot_diff_points_to_allocation_site(self):
+        memory.start()
+        first = self.client.post('/memory/').json()['snapshot']
+        leak = [bytes(1000) for _ in range(1000)]
+        self.client.post('/memory/')
+        report = self.client.get(
+            '/memory/', {'since': first, 'limit': 5}).json()
+        self.assertEqual(report['diff']['from'], first)
+        top = report['diff']['sites'][0]
+        self.assertIn('core/tests.py', top['site'])
+        self.assertGreaterEqual(top['size_diff'], 1000 * len(leak))
+
+    @override_settings(MEMORY_TRACKING=False)
+    def test_report_hidden_when_tracking_off(self):
+        self.assertEqual(self.client.get('/memory/').status_code,
+                         HTTPStatus.NOT_FOUND)
+
+
+class SQLiteCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def test_processes_share_entries(self):
+        first, second = self.make_cache(), self.make_cache()
+        first.set_many({'a': 1, 'b': [2]})
+        self.assertEqual(second.get_many(['a', 'b', 'c']),
+                         {'a': 1, 'b': [2]})
+        self.assertEqual(second.incr('a', 5), 6)
+        self.assertEqual(first.get('a'), 6)
+        with self.assertRaises(ValueError):
+            first.incr('missing')
+        self.assertFalse(second.add('b', 3))
+        self.assertTrue(second.add('c', 3))
+        second.delete_many(['a', 'c'])
+        self.assertEqual(first.get_many(['a', 'b', 'c']), {'b': [2]})
+
+    def test_expired_entries_are_invisible_and_replaceable(self):
+        cache = self.make_cache()
+        cache.set('key', 'old', timeout=-1)
+        self.assertIsNone(cache.get('key'))
+        self.assertFalse(cache.has_key('key'))
+        self.assertTrue(cache.add('key', 'new'))
+        self.assertEqual(cache.get('key'), 'new')
+
+    def test_least_recently_read_entries_are_culled(self):
+        cache = self.make_cache(MAX_ENTRIES=3, CULL_FREQUENCY=3,
+                                ACCESS_RESOLUTION=0)
+        for key in 'abc':
+            cache.set(key, key)
+            time.sleep(0.01)
+        cache.get('a')
+        cache.set('d', 'd')
+        self.assertEqual(cache.stats()['entries'], 2)
+        self.assertEqual(cache.get_many('abcd'), {'a': 'a', 'd': 'd'})
+
+    def test_size_limit(self):
+        cache = self.make_cache(MAX_SIZE=10000)
+        for number in range(10):
+            cache.set(number, 'x' * 2000)
+        stats = cache.stats()
+        self.assertLessEqual(stats['bytes'], 10000)
+        self.assertEqual(stats['entries'], len(cache.get_many(range(10))))
+        self.assertIn(9, cache.get_many(range(10)))
+
+
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.bus = os.path.join(directory.name, 'bus.sqlite3')
+        shared = {'BACKEND': 'core.cache.SQLiteCache',
+                  'LOCATION': os.path.join(directory.name, 'l2.sqlite3')}
+        self.settings_override = override_settings(
+            CACHES={'default': settings.CACHES['default'], 'shared': shared})
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def worker(self, **options):
+        """Кэш отдельного процесса: своя L1 при общих L2 и шине."""
+        cache = TieredCache(self.bus, {'OPTIONS': {
+            'L2': 'shared', 'BUS_INTERVAL': 0, **options}})
+        cache.tier = LocalTier(options.get('L1_MAX_ENTRIES', 100))
+        return cache
+
+    def test_writes_invalidate_other_workers(self):
+        first, second = self.worker(), self.worker()
+        first.set('group', {'title': 'old'})
+        self.assertEqual(second.get('group'), {'title': 'old'})
+        self.assertEqual(second.get('group'), {'title': 'old'})
+        first.set('group', {'title': 'new'})
+        self.assertEqual(second.get('group'), {'title': 'new'})
+        first.delete('group')
+        self.assertIsNone(second.get('group'))
+        first.set('version', 1)
+        second.get('version')
+        first.incr('version')
+        self.assertEqual(second.get('version'), 2)
+        second.get('version')
+        first.clear()
+        self.assertIsNone(second.get('version'))
+        stats = second.stats()
+        self.assertEqual((stats['l1_hits'], stats['l2_hits']), (2, 4))
+
+    def test_stale_value_lives_until_bus_is_read(self):
+        first, second = self.worker(), self.worker(BUS_INTERVAL=60)
+        first.set('key', 'old')
+        self.assertEqual(second.get('key'), 'old')
+        first.set('key', 'new')
+        self.assertEqual(second.get('key'), 'old')
+        second.tier.polled -= 60
+        self.assertEqual(second.get('key'), 'new')
+
+    def test_l1_is_bounded_and_returns_copies(self):
+        cache = self.worker(L1_MAX_ENTRIES=2)
+        cache.set_many({'a': [1], 'b': [2], 'c': [3]})
+        self.assertEqual(list(cache.tier.entries), [
+            cache.make_key('b'), cache.make_key('c')])
+        cache.get('c').append(4)
+        self.assertEqual(cache.get('c'), [3])
+        self.assertEqual(cache.get_many(['a', 'b']), {'a': [1], 'b': [2]})
+
+
+@override_settings(SWR_LOCK_WAIT=1)
+class StaleWhileRevalidateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_stale_value_served_while_other_worker_recomputes(self):
+        swr.store('key', 'old', timeout=-1)
+        cache.add(swr.LOCK_PREFIX + 'key', 1)
+        self.assertEqual(swr.lookup('key'), swr.Lookup('old', True, False))
+        self.assertEqual(swr.get_or_set('key', lambda: 'new', 60), 'old')
+        cache.delete(swr.LOCK_PREFIX + 'key')
+        self.assertEqual(swr.get_or_set('key', lambda: 'new', 60), 'new')
+        self.assertFalse(cache.has_key(swr.LOCK_PREFIX + 'key'))
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        threads = [threading.Thread(target=lambda: results.append(
+            swr.get_or_set('key', compute, 60))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 5)
+
+    @mock.patch('core.swr.random.random', return_value=0.5)
+    def test_early_refresh_grows_with_recompute_time(self, random):
+        soon = time.time() + 1
+        self.assertFalse(swr._due(swr.Envelope('', soon, 0), beta=1))
+        self.assertTrue(swr._due(swr.Envelope('', soon, 1000), beta=1))
+        self.assertFalse(swr._due(swr.Envelope('', None, 1000), beta=1))
+
+    def test_failed_recompute_releases_lock(self):
+        def explode():
+            raise RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            swr.get_or_set('key', explode, 60)
+        self.assertFalse(cache.has_key(swr.LOCK_PREFIX + 'key'))
+
+    def test_second_lookup_keeps_refresh_decision(self):
+        swr.store('key', 'old', timeout=60)
+        with mock.patch('core.swr._due', side_effect=[True, False]):
+            self.assertTrue(swr.lookup('key', wait=False).refresh)
+            self.assertEqual(swr.get_or_set('key', lambda: 'new', 60),
+                             'new')
+        self.assertFalse(cache.has_key(swr.LOCK_PREFIX + 'key'))
+        self.assertNotIn('key', swr._held())
+
+    def test_fragment_tag(self):
+        template = engines['django'].from_string(
+            '{% load swr_cache %}{% swrcache 60 fragment version %}'
+            '{{ text }}{% endswrcache %}')
+        self.assertEqual(template.render({'text': 'a', 'version': 1}), 'a')
+        self.assertEqual(template.render({'text': 'b', 'version': 1}), 'a')
+        self.assertEqual(template.render({'text': 'b', 'version': 2}), 'b')
+
+
+@override_settings(
+    QUERY_CACHE_MODELS=['posts.Group', 'posts.Post', 'posts.Comment'])
+class QueryCacheTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        querycache.stats.clear()
+        self.author = get_user_model().objects.create_user(username='auth')
+        self.group = Group.objects.create(
+            title='Группа', slug='group', description='Описание')
+
+    def get_group(self):
+        return querycache.cached(Group.objects).get(slug='group')
+
+    def test_repeated_lookup_served_from_cache(self):
+        self.get_group()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_group(), self.group)
+        self.assertEqual(querycache.stats, {
+            ('posts.Group', 'miss'): 1, ('posts.Group', 'hit'): 1})
+
+    def test_writes_invalidate_table(self):
+        self.get_group()
+        self.group.title = 'Сохранена'
+        self.group.save()
+        self.assertEqual(self.get_group().title, 'Сохранена')
+        Group.objects.filter(pk=self.group.pk).update(title='Обновлена')
+        self.assertEqual(self.get_group().title, 'Обновлена')
+        Group.objects.filter(pk=self.group.pk).delete()
+        with self.assertRaises(Group.DoesNotExist):
+            self.get_group()
+
+    def test_prefetched_tables_are_dependencies(self):
+        post = Post.objects.create(text='Пост', author=self.author)
+
+        def comments():
+            return list(querycache.cached(
+                Post.objects.prefetch_related('comments')
+            ).get(pk=post.pk).comments.all())
+
+        self.assertEqual(comments(), [])
+        comment = Comment.objects.create(
+            post=post, author=self.author, text='Комментарий')
+        with self.assertNumQueries(2):
+            self.assertEqual(comments(), [comment])
+
+    def test_queries_reading_untracked_tables_not_cached(self):
+        inbox = querycache.cached(
+            Post.objects.filter(inbox_entries__user=self.author))
+        list(inbox)
+        with self.assertNumQueries(1):
+            list(inbox.all())
+        self.assertNotIn('posts_inboxentry', querycache.tracked_tables())
+        Follow.objects.create(user=self.author, author=get_user_model()
+                              .objects.create_user(username='other'))
+        self.assertIsNone(
+            cache.get(querycache.VERSION_PREFIX + 'posts_follow'))
+
+    def test_transaction_bumps_once_on_commit(self):
+        self.get_group()
+        key = querycache.VERSION_PREFIX + 'posts_group'
+        before = cache.get(key)
+        with transaction.atomic():
+            Group.objects.filter(pk=self.group.pk).update(title='Раз')
+            Group.objects.filter(pk=self.group.pk).update(title='Два')
+            self.assertEqual(cache.get(key), before)
+        self.assertEqual(cache.get(key), before + 1)
+
+    def test_transaction_reads_past_cache_after_write(self):
+        self.get_group()
+        with transaction.atomic():
+            with self.assertNumQueries(0):
+                self.get_group()
+            Group.objects.filter(pk=self.group.pk).update(title='Новая')
+            with self.assertNumQueries(1):
+                self.assertEqual(self.get_group().title, 'Новая')
+        self.assertEqual(self.get_group().title, 'Новая')
+
+    def test_models_outside_list_not_cached(self):
+        users = querycache.cached(get_user_model().objects)
+        users.get(username='auth')
+        with self.assertNumQueries(1):
+            users.get(username='auth')
+        self.assertFalse(querycache.stats)
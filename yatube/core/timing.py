@@ -0,0 +1,170 @@
+"""Легкие замеры времени внутри запроса для заголовка Server-Timing.
+
+`ServerTimingMiddleware` заводит на запрос `RequestTiming` в contextvar, а
+шаблоны, кэш и SQL пишут в него счетчики и время. Вне запроса замеры
+ничего не стоят, кроме чтения contextvar. Шаблоны и кэш оборачиваются
+один раз при старте (`install`), SQL - через `execute_wrapper`
+соединения на время запроса.
+"""
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.core.cache import caches
+from django.template.base import Template
+
+_current = ContextVar('request_timing', default=None)
+
+# get_or_set не оборачивается: он сам вызывает get и add
+CACHE_READS = ('get', 'get_many')
+CACHE_METHODS = {
+    'get': 'cache-get',
+    'get_many': 'cache-get',
+    'set': 'cache-set',
+    'set_many': 'cache-set',
+    'add': 'cache-set',
+    'incr': 'cache-set',
+    'decr': 'cache-set',
+    'delete': 'cache-set',
+    'delete_many': 'cache-set',
+}
+
+
+class RequestTiming:
+    def __init__(self):
+        self.started = time.perf_counter()
+        # метрика: [число вызовов, суммарное время в секундах]
+        self.metrics = defaultdict(lambda: [0, 0.0])
+        self.templates = defaultdict(lambda: [0, 0.0])
+        self.cache = Counter()
+        self._active = set()
+
+    def add(self, name, seconds, kind='metrics'):
+        metric = getattr(self, kind)[name]
+        metric[0] += 1
+        metric[1] += seconds
+
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add('sql', time.perf_counter() - started)
+
+    def count_reads(self, name, keys, args, kwargs, result):
+        if name == 'get':
+            default = kwargs.get('default', args[0] if args else None)
+            hits = int(result is not default)
+            self.cache['hit'] += hits
+            self.cache['miss'] += 1 - hits
+        else:
+            self.cache['hit'] += len(result)
+            self.cache['miss'] += len(keys) - len(result)
+
+    @contextmanager
+    def active(self):
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def measure(name, kind='metrics'):
+    """Время блока в метрику `name`; вложенные замеры той же метрики
+    не считаются второй раз. Внешний замер получает `RequestTiming`,
+    вложенный и замер вне запроса - None."""
+    timing = _current.get()
+    key = (kind, name)
+    if timing is None or key in timing._active:
+        yield None
+        return
+    timing._active.add(key)
+    started = time.perf_counter()
+    try:
+        yield timing
+    finally:
+        timing._active.discard(key)
+        timing.add(name, time.perf_counter() - started, kind)
+
+
+def _timed_render(render):
+    @wraps(render)
+    def wrapper(self, context):
+        with measure(self.origin.template_name or self.origin.name,
+                     'templates'):
+            return render(self, context)
+    wrapper.timed = True
+    return wrapper
+
+
+def _timed_cache_method(method, metric):
+    @wraps(method)
+    def wrapper(cache, keys, *args, **kwargs):
+        if method.__name__ == 'get_many':
+            keys = list(keys)
+        with measure(metric) as timing:
+            result = method(cache, keys, *args, **kwargs)
+        # get_many базового кэша сам вызывает get: считаем только внешний
+        if timing is not None and method.__name__ in CACHE_READS:
+            timing.count_reads(method.__name__, keys, args, kwargs, result)
+        return result
+    wrapper.timed = True
+    return wrapper
+
+
+def install(cache_aliases):
+    """Оборачивает рендер шаблонов и методы бэкендов кэша."""
+    if not getattr(Template.render, 'timed', False):
+        Template.render = _timed_render(Template.render)
+    for alias in cache_aliases:
+        backend = type(caches[alias])
+        for name, metric in CACHE_METHODS.items():
+            method = getattr(backend, name)
+            if not getattr(method, 'timed', False):
+                setattr(backend, name, _timed_cache_method(method, metric))
+
+
+def header(timing, templates=5):
+    """Значение Server-Timing: итог, SQL, кэш, превью и самые долгие
+    шаблоны."""
+    parts = [f'total;dur={timing.total() * 1000:.1f}']
+    for name, (count, seconds) in sorted(timing.metrics.items()):
+        parts.append(f'{name};desc="{count}";dur={seconds * 1000:.1f}')
+    slowest = sorted(timing.templates.items(),
+                     key=lambda item: item[1][1], reverse=True)[:templates]
+    for number, (name, (count, seconds)) in enumerate(slowest, 1):
+        desc = name.encode('ascii', 'replace').decode().replace('"', "'")
+        parts.append(f'tpl{number};desc="{desc}";dur={seconds * 1000:.1f}')
+    return ', '.join(parts)
+
+
+def log_record(request, response, timing):
+    return {
+        'method': request.method,
+        'path': request.path,
+        'status': response.status_code,
+        'total_ms': round(timing.total() * 1000, 2),
+        **{
+            f'{name}_{field}': value
+            for name, (count, seconds) in timing.metrics.items()
+            for field, value in (
+                ('count', count), ('ms', round(seconds * 1000, 2)))
+        },
+        'cache_hits': timing.cache['hit'],
+        'cache_misses': timing.cache['miss'],
+        'templates': {
+            name: round(seconds * 1000, 2)
+            for name, (count, seconds) in timing.templates.items()
+        },
+    }
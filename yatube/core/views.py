@@ -1,4 +1,12 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_http_methods
+
+from . import memory, profiler
+from .metrics import registry
 
 
 def page_not_found(request, exception):
@@ -11,3 +19,76 @@ def csrf_failure(request, reason=''):
 
 def internal_server_error(request, reason=''):
     return render(request, 'core/500.html')
+
+
+def _metrics_allowed(request):
+    if request.user.is_staff:
+        return True
+    token = settings.METRICS_TOKEN
+    if token and constant_time_compare(
+            request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+def metrics(request):
+    """Метрики всех воркеров для Prometheus."""
+    if not _metrics_allowed(request):
+        raise Http404
+    return HttpResponse(registry.exposition(),
+                        content_type='text/plain; version=0.0.4')
+
+
+@staff_member_required
+@require_http_methods(['GET', 'POST'])
+def profiler_sessions(request):
+    """GET - готовые профили, POST - сеанс на `seconds` секунд в этом
+    воркере, только для запросов к `view`, если он задан."""
+    if request.method == 'GET':
+        return JsonResponse({'profiles': profiler.profiles()})
+    try:
+        seconds = float(request.POST.get('seconds', 10))
+    except ValueError:
+        return JsonResponse({'error': 'seconds - число секунд'}, status=400)
+    try:
+        session = profiler.start(seconds, request.POST.get('view') or None)
+    except profiler.ProfilerBusy as busy:
+        return JsonResponse({'error': 'Сеанс уже идет', 'profile': str(busy)},
+                            status=409)
+    return JsonResponse({'profile': session.profile,
+                         'seconds': session.seconds}, status=202)
+
+
+@staff_member_required
+def profiler_result(request, profile):
+    """Свернутые стеки для flamegraph.pl или speedscope."""
+    try:
+        return HttpResponse(profiler.read(profile),
+                            content_type='text/plain; charset=utf-8')
+    except FileNotFoundError:
+        raise Http404
+
+
+@staff_member_required
+@require_http_methods(['GET', 'POST'])
+def memory_report(request):
+    """GET - память по URL и разница снимков этого воркера, POST - снимок.
+
+    Параметры GET: since - id снимка для сравнения с последним,
+    group - lineno, filename или traceback, limit - число мест.
+    """
+    if not settings.MEMORY_TRACKING:
+        raise Http404
+    if request.method == 'POST':
+        return JsonResponse({'snapshot': memory.take_snapshot()},
+                            status=201)
+    group = request.GET.get('group', 'lineno')
+    if group not in memory.KEY_TYPES:
+        group = 'lineno'
+    try:
+        since = int(request.GET['since']) if 'since' in request.GET else None
+        limit = int(request.GET.get('limit', 20))
+    except ValueError:
+        return JsonResponse({'error': 'since и limit - целые числа'},
+                            status=400)
+    return JsonResponse(memory.report(since, group, limit))
@@ -1,10 +1,45 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import SEARCH_VAR
+
+from search import index as search_index
 
 from .models import Post, Group, Comment, Follow
 
 
+class FullTextSearchMixin:
+    """Поиск в списке объектов через FTS5 вместо LIKE '%...%'.
+
+    Найденное по умолчанию упорядочено по релевантности; сортировка по
+    столбцу в списке ее заменяет.
+    """
+    search_kind = None
+
+    def full_text_search(self, request):
+        return bool(request.GET.get(SEARCH_VAR)) and search_index.available()
+
+    def get_ordering(self, request):
+        if self.full_text_search(request):
+            return ('search_rank',)
+        return super().get_ordering(request)
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.full_text_search(request):
+            # Аннотация нужна раньше поиска: по ней сортирует get_ordering
+            queryset = search_index.ranked(
+                queryset, request.GET[SEARCH_VAR], self.search_kind)
+        return queryset
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not self.full_text_search(request):
+            return super().get_search_results(
+                request, queryset, search_term)
+        return queryset, False
+
+
 @admin.register(Post)
-class PostAdmin(admin.ModelAdmin):
+class PostAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    search_kind = search_index.POST
     list_display = (
         'pk',
         'text',
@@ -30,7 +65,8 @@ class GroupAdmin(admin.ModelAdmin):
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(FullTextSearchMixin, admin.ModelAdmin):
+    search_kind = search_index.COMMENT
     list_display = (
         'post',
         'author',
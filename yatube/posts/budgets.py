@@ -0,0 +1,31 @@
+"""Сколько SQL может стоить каждое представление постов.
+
+Бюджеты заданы для холодного кэша и данных формы `DATASET` (параметры
+`manage.py seed_data`); их проверяет `posts/tests/test_budgets.py`.
+Если представлению честно нужно больше запросов, бюджет меняют здесь
+вместе с ним - и это видно в ревью.
+"""
+from core.budgets import Budget
+
+DATASET = {
+    'users': 30,
+    'groups': 3,
+    'posts': 120,
+    'follows': 8,
+    'comments': 300,
+    'seed': 0,
+}
+
+# Запросы сессии, пользователя и SAVEPOINT/RELEASE тоже в счете
+BUDGETS = {
+    'posts:index': Budget(queries=1, sql_ms=50),
+    'posts:follow_index': Budget(queries=5, sql_ms=50),
+    'posts:group_list': Budget(queries=3, sql_ms=50),
+    'posts:profile': Budget(queries=3, sql_ms=50),
+    'posts:post_detail': Budget(queries=6, sql_ms=50),
+    'posts:post_create': Budget(queries=10, sql_ms=50),
+    'posts:post_edit': Budget(queries=8, sql_ms=50),
+    'posts:add_comment': Budget(queries=8, sql_ms=50),
+    'posts:profile_follow': Budget(queries=14, sql_ms=50),
+    'posts:profile_unfollow': Budget(queries=11, sql_ms=50),
+}
@@ -0,0 +1,111 @@
+"""Версионированные ключи кэша для фрагментов лент.
+
+Каждая лента зависит от набора областей: главная, группа, автор и общая
+область групп. У области есть номер версии в кэше; сигналы записи
+увеличивают его, и старые фрагменты просто перестают находиться.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from core import swr
+
+INDEX = ('index',)
+GROUPS = ('groups',)
+
+
+def group_scope(group_id):
+    return ('group', group_id)
+
+
+def author_scope(author_id):
+    return ('author', author_id)
+
+
+def post_scope(post_id):
+    # Страница поста помимо его строки зависит от готовности превью
+    return ('post', post_id)
+
+
+def user_scope(user_id):
+    # Имя и адрес автора в карточках постов, в отличие от author_scope
+    # не меняется от новых постов и комментариев
+    return ('user', user_id)
+
+
+def _key(scope):
+    return 'feed_version:' + ':'.join(map(str, scope))
+
+
+def _fresh_version():
+    # Версии начинаются со времени, чтобы после потери кэша
+    # не совпасть со старыми ключами
+    return int(time.time() * 1000)
+
+
+def versions(*scopes):
+    keys = [_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    missing = {key: _fresh_version() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def bump(*scopes):
+    for scope in scopes:
+        if scope[-1] is None:
+            continue
+        try:
+            cache.incr(_key(scope))
+        except ValueError:
+            cache.set(_key(scope), _fresh_version(), timeout=None)
+
+
+def feed_fragment(fragment_name, params, *scopes):
+    """Возвращает ключ фрагмента ленты и его HTML, если он уже в кэше.
+
+    Ключ передается в шаблон как единственный аргумент тега `swrcache`,
+    поэтому представление и шаблон читают одну и ту же запись. Если
+    фрагмент пора пересчитать этому запросу, HTML не возвращается, и
+    фрагмент отрисует шаблон: `swr.lookup` в теге увидит блокировку,
+    взятую здесь, и не станет решать заново.
+    """
+    vary_on = ':'.join([
+        *map(str, versions(GROUPS, *scopes)),
+        params.get('page', ''),
+        params.get('cursor', ''),
+    ])
+    fragment = swr.lookup(
+        make_template_fragment_key(fragment_name, [vary_on]), wait=False)
+    return {
+        'feed_vary_on': vary_on,
+        'feed_html': None if fragment.refresh else fragment.value,
+        'feed_cache_timeout': settings.FEED_CACHE_TIMEOUT,
+    }
+
+
+def card_keys(posts, group=None):
+    """Ключи карточек постов из `includes/posts.html`.
+
+    Карточка зависит от самого поста (его `updated`), от имени автора и
+    от адресов групп, а на странице группы ссылки на группу в ней нет.
+    """
+    authors = sorted({post.author_id for post in posts})
+    found = dict(zip(
+        [None, *authors],
+        versions(GROUPS, *map(user_scope, authors)),
+    ))
+    return [
+        'post_card:' + ':'.join(map(str, (
+            post.pk,
+            post.updated.timestamp() if post.updated else '',
+            found[post.author_id],
+            found[None] if post.group_id else '',
+            int(bool(post.group_id and not group)),
+        )))
+        for post in posts
+    ]
@@ -0,0 +1,100 @@
+"""Валидаторы ETag для условных GET-запросов.
+
+Штампы собираются из версий лент в кэше и индексированных столбцов,
+без рендеринга страницы. В ETag входит читатель: шапка и формы
+у каждого пользователя свои, поэтому Last-Modified, общий для всех
+читателей, не отдаем. У вошедшего читателя в ETag входит и CSRF-токен:
+вход его меняет, и сохраненная браузером страница с формой старого
+токена отправиться уже не сможет. Состояние страницы без читателя
+(`*_state`) служит и ключом страницы в кэше `core.holes.cached_page`.
+"""
+import inspect
+from functools import wraps
+from hashlib import md5
+
+from django.contrib.auth import get_user_model
+
+from .caching import (
+    GROUPS, INDEX, author_scope, group_scope, post_scope, user_scope,
+    versions,
+)
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+def _etag(request, *parts):
+    viewer = 'anon'
+    if request.user.is_authenticated:
+        # CsrfViewMiddleware кладет сюда токен из cookie до вызова view
+        viewer = (request.user.pk, request.META.get('CSRF_COOKIE', ''))
+    position = (request.GET.get('page', ''), request.GET.get('cursor', ''))
+    raw = ':'.join(map(str, (*parts, *position, viewer)))
+    return md5(raw.encode()).hexdigest()
+
+
+def _per_request(func):
+    # Состояние нужно и ETag, и ключу кэша: читаем его раз за запрос
+    signature = inspect.signature(func)
+
+    @wraps(func)
+    def wrapper(request, *args, **kwargs):
+        states = request.__dict__.setdefault('page_states', {})
+        arguments = signature.bind(request, *args, **kwargs).arguments
+        key = (func.__name__, *list(arguments.items())[1:])
+        if key not in states:
+            states[key] = func(request, *args, **kwargs)
+        return states[key]
+    return wrapper
+
+
+@_per_request
+def index_state(request):
+    return tuple(versions(GROUPS, INDEX))
+
+
+def index_etag(request):
+    return _etag(request, *index_state(request))
+
+
+def group_etag(request, slug):
+    group = Group.objects.filter(slug=slug).values_list(
+        'pk', 'posts_count').first()
+    if group is None:
+        return None
+    return _etag(request, *group, *versions(GROUPS, group_scope(group[0])))
+
+
+def profile_etag(request, username):
+    author = User.objects.filter(username=username).values_list(
+        'pk', 'first_name', 'last_name', 'stats__posts_count',
+        'stats__followers_count', 'stats__following_count').first()
+    if author is None:
+        return None
+    following = (request.user.is_authenticated
+                 and Follow.objects.filter(
+                     user=request.user, author_id=author[0]).exists())
+    return _etag(request, *author, following,
+                 *versions(GROUPS, author_scope(author[0])))
+
+
+@_per_request
+def post_state(request, post_id):
+    post = Post.objects.filter(pk=post_id).values_list(
+        'updated', 'comments_count', 'author_id', 'author__first_name',
+        'author__last_name', 'author__stats__posts_count').first()
+    if post is None:
+        return None
+    # Правки комментариев сбрасывают post_scope, переименования их
+    # авторов и автора поста - user_scope
+    users = {post[2]}.union(Comment.objects.filter(
+        post_id=post_id).values_list('author_id', flat=True))
+    return (*post, *versions(GROUPS, post_scope(post_id),
+                             *map(user_scope, sorted(users))))
+
+
+def post_etag(request, post_id):
+    state = post_state(request, post_id)
+    if state is None:
+        return None
+    return _etag(request, *state)
@@ -0,0 +1,171 @@
+"""Лента подписок: рассылка при записи с подтягиванием для популярных.
+
+Посты обычных авторов раскладываются по `InboxEntry` подписчиков в момент
+публикации, поэтому `follow_index` читает ключи страницы из одной таблицы
+по индексу, а сами посты - по pk. Посты авторов, у которых подписчиков не
+меньше `FEED_FANOUT_LIMIT`, никуда не копируются и подтягиваются при
+чтении. Когда подписчиков снова становится меньше, посты, написанные за
+это время, раскладываются по лентам задачей `refill_inboxes`.
+"""
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import AuthorStats, Follow, InboxEntry, Post
+from .paginators import CursorPaginator
+
+
+def is_pulled(author_id):
+    return AuthorStats.objects.filter(
+        user_id=author_id,
+        followers_count__gte=settings.FEED_FANOUT_LIMIT,
+    ).exists()
+
+
+def _bulk_insert(entries):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= settings.FEED_BATCH_SIZE:
+            InboxEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        InboxEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def _entries(user_ids, author_id):
+    posts = (Post.objects.filter(author_id=author_id)
+             .values_list('pk', 'pub_date')
+             .iterator(chunk_size=settings.FEED_BATCH_SIZE))
+    for post_id, pub_date in posts:
+        for user_id in user_ids:
+            yield InboxEntry(user_id=user_id, post_id=post_id,
+                             author_id=author_id, pub_date=pub_date)
+
+
+def fan_out(post):
+    """Кладет новый пост в ленты всех подписчиков автора."""
+    if is_pulled(post.author_id):
+        return
+    followers = (Follow.objects.filter(author_id=post.author_id)
+                 .values_list('user_id', flat=True)
+                 .iterator(chunk_size=settings.FEED_BATCH_SIZE))
+    _bulk_insert(
+        InboxEntry(user_id=user_id, post_id=post.pk,
+                   author_id=post.author_id, pub_date=post.pub_date)
+        for user_id in followers
+    )
+
+
+def dropped_below_limit(author_id):
+    """Автор только что перестал быть популярным: подписчиков на одного
+    меньше порога."""
+    return AuthorStats.objects.filter(
+        user_id=author_id,
+        followers_count=settings.FEED_FANOUT_LIMIT - 1,
+    ).exists()
+
+
+def refill(author_id):
+    """Раскладывает все посты автора по лентам его подписчиков.
+
+    Нужна, когда автор перестал быть популярным: посты, написанные, пока
+    их подтягивали при чтении, ни в одну ленту не попали. Уже лежащие в
+    лентах записи пропускаются.
+    """
+    if is_pulled(author_id):
+        return
+    followers = list(Follow.objects.filter(author_id=author_id)
+                     .values_list('user_id', flat=True))
+    if followers:
+        _bulk_insert(_entries(followers, author_id))
+
+
+def backfill(user_id, author_id):
+    """Заполняет ленту постами автора, на которого только что подписались."""
+    if not is_pulled(author_id):
+        _bulk_insert(_entries([user_id], author_id))
+
+
+def prune(user_id, author_id):
+    InboxEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def pulled_authors(user):
+    return list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__followers_count__gte=settings.FEED_FANOUT_LIMIT,
+        ).values_list('author_id', flat=True)
+    )
+
+
+def follow_feed(user, pulled=None):
+    """Посты из ленты подписок пользователя, без сортировки и связей."""
+    if pulled is None:
+        pulled = pulled_authors(user)
+    if not pulled:
+        return Post.objects.filter(inbox_entries__user=user)
+    inbox = InboxEntry.objects.filter(user=user).values('post_id')
+    return Post.objects.filter(Q(pk__in=inbox) | Q(author_id__in=pulled))
+
+
+class FollowFeedPaginator(CursorPaginator):
+    """Курсорная пагинация ленты подписок по `InboxEntry`.
+
+    Ключи страницы (pub_date, post_id) читаются из ленты пользователя по
+    индексу `inbox_feed_idx`, без соединения с постами и сортировки всей
+    ленты; посты популярных авторов добирают таким же запросом по индексу
+    постов и сливают. Сами посты грузятся одним запросом по pk. Выборка
+    `object_list` нужна только для `count` и старых ссылок `?page=N`.
+    """
+
+    def __init__(self, object_list, per_page, user, pulled=None):
+        super().__init__(object_list, per_page)
+        self.user = user
+        self.pulled = pulled_authors(user) if pulled is None else pulled
+
+    def _keys(self, queryset, pk_field, pub_date, pk, older, limit):
+        sign = '-' if older else ''
+        queryset = queryset.order_by(
+            f'{sign}{self.date_field}', f'{sign}{pk_field}')
+        if pub_date is not None:
+            queryset = queryset.filter(
+                self._seek(pub_date, pk, older, pk_field))
+        return list(
+            queryset.values_list(self.date_field, pk_field)[:limit])
+
+    def _rows(self, pub_date, pk, older, limit):
+        keys = self._keys(InboxEntry.objects.filter(user=self.user),
+                          'post_id', pub_date, pk, older, limit)
+        if self.pulled:
+            keys += self._keys(Post.objects.filter(author_id__in=self.pulled),
+                               'pk', pub_date, pk, older, limit)
+        keys = sorted(set(keys), reverse=older)[:limit]
+        posts = (Post.objects.select_related('author', 'group')
+                 .in_bulk([post_id for _, post_id in keys]))
+        return [posts[post_id] for _, post_id in keys if post_id in posts]
+
+
+def rebuild(user_ids=None):
+    """Пересобирает ленты с нуля; возвращает число записей в них."""
+    entries = InboxEntry.objects.all()
+    follows = Follow.objects.order_by('author_id')
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+        follows = follows.filter(user_id__in=user_ids)
+    entries.delete()
+    pulled = set(
+        AuthorStats.objects.filter(
+            followers_count__gte=settings.FEED_FANOUT_LIMIT,
+        ).values_list('user_id', flat=True)
+    )
+    pairs = (follows.values_list('author_id', 'user_id')
+             .iterator(chunk_size=settings.FEED_BATCH_SIZE))
+    for author_id, group in groupby(pairs, key=itemgetter(0)):
+        if author_id not in pulled:
+            _bulk_insert(_entries([user_id for _, user_id in group],
+                                  author_id))
+    return entries.count()
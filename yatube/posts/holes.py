@@ -0,0 +1,9 @@
+"""Контекст дырок страниц постов (см. core.holes)."""
+from core import holes
+
+from .forms import CommentForm
+
+
+@holes.context('posts/includes/comment_form.html')
+def comment_form(request, post_id):
+    return {'form': CommentForm()}
@@ -0,0 +1,410 @@
+"""Потоковая загрузка групп, постов, комментариев и подписок.
+
+Записи читаются генераторами из JSONL или CSV и пишутся `bulk_create`
+пачками по одному виду записей. Сигналы при этом не срабатывают, поэтому
+счетчики, ленты подписок и поисковый индекс пересчитываются один раз в
+`finish` - только для затронутых импортом авторов, постов и подписчиков,
+а индексы лент можно снять на время загрузки. После каждой пачки номер
+последней записанной строки сохраняется в файл прогресса, и упавший
+импорт продолжается с этого места; что записал прошлый запуск, тогда
+неизвестно, и `finish` пересчитывает все.
+
+Поля записей:
+    group   - slug, title, description
+    post    - author, text, group, pub_date, image, id
+    comment - post, author, text, created
+    follow  - user, author
+Авторы и подписчики указываются по username и создаются, если их нет,
+группы - по slug, посты - по id. В JSONL вид записи задается полем
+`kind`, в CSV - для всего файла.
+"""
+import csv
+import json
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+from itertools import groupby, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from search import index as search_index
+
+from . import caching, feeds, stats
+from .models import Comment, Follow, Group, InboxEntry, Post
+from .tasks import generate_thumbnail
+
+User = get_user_model()
+
+KINDS = ('group', 'post', 'comment', 'follow')
+# Индексы лент нужны только при чтении, без них вставка заметно быстрее
+DEFERRABLE_INDEXES = (Post, InboxEntry)
+
+
+def read_jsonl(path, kind=None):
+    with open(path, encoding='utf-8') as source:
+        for line in source:
+            if line.strip():
+                record = json.loads(line)
+                if kind:
+                    record.setdefault('kind', kind)
+                yield record
+
+
+def read_csv(path, kind):
+    with open(path, encoding='utf-8', newline='') as source:
+        for record in csv.DictReader(source):
+            record['kind'] = kind
+            yield record
+
+
+def read_records(path, kind=None):
+    if path.endswith('.csv'):
+        return read_csv(path, kind)
+    return read_jsonl(path, kind)
+
+
+def batches(records, size):
+    """Пачки до `size` подряд идущих записей одного вида."""
+    for kind, group in groupby(records, key=lambda record: record['kind']):
+        while True:
+            batch = list(islice(group, size))
+            if not batch:
+                break
+            yield kind, batch
+
+
+def _date(value):
+    if not value:
+        return timezone.now()
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f'Неверная дата: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+@contextmanager
+def explicit_dates(model, *field_names):
+    """Даты из файла не подменяются auto_now/auto_now_add."""
+    fields = [model._meta.get_field(name) for name in field_names]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _index_names(model):
+    with connection.cursor() as cursor:
+        return set(connection.introspection.get_constraints(
+            cursor, model._meta.db_table))
+
+
+def _feed_indexes(present):
+    for model in DEFERRABLE_INDEXES:
+        existing = _index_names(model)
+        for index in model._meta.indexes:
+            if (index.name in existing) == present:
+                yield model, index
+
+
+def drop_feed_indexes():
+    indexes = list(_feed_indexes(present=True))
+    if indexes:
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.remove_index(model, index)
+
+
+def restore_feed_indexes():
+    # Индексы могли остаться снятыми и после упавшего импорта
+    indexes = list(_feed_indexes(present=False))
+    if indexes:
+        with connection.schema_editor() as editor:
+            for model, index in indexes:
+                editor.add_index(model, index)
+
+
+@contextmanager
+def deferred_feed_indexes(enabled=True):
+    """Снимает индексы лент на время блока и возвращает их, даже если
+    загрузка упала."""
+    if not enabled:
+        yield
+        return
+    drop_feed_indexes()
+    try:
+        yield
+    finally:
+        restore_feed_indexes()
+
+
+def _chunks(ids, size):
+    ids = sorted(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _last_pk(model):
+    return model.objects.aggregate(last=Max('pk'))['last'] or 0
+
+
+class Progress:
+    """Номер последней записанной строки входного файла."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as source:
+                return json.load(source)['done']
+        except FileNotFoundError:
+            return 0
+
+    def save(self, done):
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as target:
+            json.dump({'done': done}, target)
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class Importer:
+    def __init__(self, batch_size=500, check_images=True):
+        self.batch_size = batch_size
+        self.check_images = check_images
+        self.counts = Counter()
+        # Справочники: username -> id, slug -> id
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        self.touched_authors = set()
+        self.touched_groups = set()
+        # Посты с id из файла; остальные новые посты и комментарии - с id
+        # больше, чем были до загрузки
+        self.new_post_ids = set()
+        self.last_post = _last_pk(Post)
+        self.last_comment = _last_pk(Comment)
+        self.new_followers = set()
+        self.resumed = False
+
+    def run(self, records, progress=None, on_batch=None):
+        """Пишет записи пачками; возвращает число прочитанных строк."""
+        done = progress.load() if progress else 0
+        self.resumed = self.resumed or done > 0
+        records = islice(records, done, None)
+        for kind, batch in batches(records, self.batch_size):
+            if kind not in KINDS:
+                raise ValueError(f'Неизвестный вид записи: {kind}')
+            with transaction.atomic():
+                getattr(self, f'import_{kind}s')(batch)
+            done += len(batch)
+            if progress:
+                progress.save(done)
+            if on_batch:
+                on_batch(kind, done)
+        return done
+
+    def user_ids(self, usernames):
+        missing = {name for name in usernames if name not in self.users}
+        if missing:
+            User.objects.bulk_create(
+                [User(username=name, password=make_password(None))
+                 for name in missing],
+                ignore_conflicts=True)
+            self.users.update(User.objects.filter(username__in=missing)
+                              .values_list('username', 'pk'))
+            self.counts['user'] += len(missing)
+            # Новым пользователям нужна строка AuthorStats
+            self.touched_authors.update(self.users[name] for name in missing)
+        return [self.users[name] for name in usernames]
+
+    def import_groups(self, batch):
+        fresh = {record['slug']: record for record in batch
+                 if record['slug'] not in self.groups}
+        Group.objects.bulk_create(
+            [Group(slug=slug, title=record['title'],
+                   description=record.get('description', ''))
+             for slug, record in fresh.items()],
+            ignore_conflicts=True)
+        self.groups.update(Group.objects.filter(slug__in=fresh)
+                           .values_list('slug', 'pk'))
+        self.counts['group'] += len(fresh)
+        self.counts['existing_group'] += len(batch) - len(fresh)
+
+    def _image(self, name):
+        if not name:
+            return ''
+        if self.check_images and not default_storage.exists(name):
+            self.counts['missing_image'] += 1
+            return ''
+        return name
+
+    def import_posts(self, batch):
+        authors = self.user_ids([record['author'] for record in batch])
+        posts = []
+        for record, author_id in zip(batch, authors):
+            pub_date = _date(record.get('pub_date'))
+            posts.append(Post(
+                pk=int(record['id']) if record.get('id') else None,
+                author_id=author_id,
+                group_id=self.groups.get(record.get('group')),
+                text=record['text'],
+                pub_date=pub_date,
+                updated=pub_date,
+                image=self._image(record.get('image')),
+            ))
+        # Посты с уже занятым id пропускаются, их и не считаем
+        explicit = {post.pk for post in posts if post.pk is not None}
+        taken = set(Post.objects.filter(pk__in=explicit)
+                    .values_list('pk', flat=True))
+        fresh = []
+        for post in posts:
+            if post.pk is not None:
+                if post.pk in taken:
+                    continue
+                taken.add(post.pk)
+                self.new_post_ids.add(post.pk)
+            fresh.append(post)
+        with explicit_dates(Post, 'pub_date', 'updated'):
+            Post.objects.bulk_create(fresh, ignore_conflicts=True)
+        self.touched_authors.update(post.author_id for post in fresh)
+        self.touched_groups.update(post.group_id for post in fresh)
+        self.counts['post'] += len(fresh)
+        self.counts['existing_post'] += len(posts) - len(fresh)
+        with_image = [post for post in fresh if post.image]
+        if with_image:
+            post_ids = self._inserted_ids(with_image)
+            generate_thumbnail.enqueue_many(
+                [(post.image.name, post.author_id, post.group_id,
+                  post_id)
+                 for post, post_id in zip(with_image, post_ids)],
+                unique_key=lambda args: f'thumbnail:{args[0]}')
+
+    def _inserted_ids(self, posts):
+        """id постов после `bulk_create`: SQLite не возвращает id
+        вставленных строк, и посты без id из файла ищутся по автору,
+        дате и картинке среди новых."""
+        implicit = [post for post in posts if post.pk is None]
+        found = {}
+        if implicit:
+            found = {
+                (author_id, pub_date, image): pk
+                for pk, author_id, pub_date, image in Post.objects.filter(
+                    pk__gt=self.last_post,
+                    author_id__in={post.author_id for post in implicit},
+                    image__in={post.image.name for post in implicit},
+                ).values_list('pk', 'author_id', 'pub_date', 'image')
+            }
+        return [
+            post.pk if post.pk is not None else found.get(
+                (post.author_id, post.pub_date, post.image.name))
+            for post in posts
+        ]
+
+    def import_comments(self, batch):
+        post_ids = {int(record['post']) for record in batch}
+        existing = set(Post.objects.filter(pk__in=post_ids)
+                       .values_list('pk', flat=True))
+        valid = [record for record in batch
+                 if int(record['post']) in existing]
+        authors = self.user_ids([record['author'] for record in valid])
+        comments = [
+            Comment(post_id=int(record['post']), author_id=author_id,
+                    text=record['text'], created=_date(record.get('created')))
+            for record, author_id in zip(valid, authors)
+        ]
+        with explicit_dates(Comment, 'created'):
+            Comment.objects.bulk_create(comments)
+        self.counts['comment'] += len(comments)
+        self.counts['orphan_comment'] += len(batch) - len(valid)
+
+    def import_follows(self, batch):
+        users = self.user_ids([record['user'] for record in batch])
+        authors = self.user_ids([record['author'] for record in batch])
+        # restrict_self_follow и повторы внутри пачки
+        pairs = {pair for pair in zip(users, authors) if pair[0] != pair[1]}
+        # unique_following: уже существующие подписки
+        existing = set(
+            Follow.objects.filter(user_id__in={user for user, _ in pairs},
+                                  author_id__in={a for _, a in pairs})
+            .values_list('user_id', 'author_id'))
+        fresh = pairs - existing
+        Follow.objects.bulk_create(
+            [Follow(user_id=user, author_id=author)
+             for user, author in fresh],
+            ignore_conflicts=True)
+        self.touched_authors.update(user for user, _ in fresh)
+        self.touched_authors.update(author for _, author in fresh)
+        self.new_followers.update(user for user, _ in fresh)
+        self.counts['follow'] += len(fresh)
+        self.counts['rejected_follow'] += len(batch) - len(fresh)
+
+    def _new_post_ids(self):
+        return self.new_post_ids.union(
+            Post.objects.filter(pk__gt=self.last_post)
+            .values_list('pk', flat=True))
+
+    def _feed_readers(self):
+        """Подписчики, чьи ленты мог изменить импорт: новые подписки,
+        новые посты и авторы, ставшие популярными."""
+        readers = set(self.new_followers)
+        for authors in _chunks(self.touched_authors, self.batch_size):
+            readers.update(Follow.objects.filter(author_id__in=authors)
+                           .values_list('user_id', flat=True))
+        return readers
+
+    def _index_new_documents(self, post_ids):
+        comments = Comment.objects.filter(pk__gt=self.last_comment)
+        search_index.index_many(
+            search_index.COMMENT,
+            comments.values_list('pk', 'post_id', 'text').iterator())
+        for ids in _chunks(post_ids, self.batch_size):
+            search_index.index_many(
+                search_index.POST,
+                Post.objects.filter(pk__in=ids)
+                .values_list('pk', 'pk', 'text'))
+
+    def finish(self):
+        """Пересчитывает то, что при обычной записи делают сигналы."""
+        restore_feed_indexes()
+        if self.resumed:
+            stats.reconcile()
+            feeds.rebuild()
+            if search_index.available():
+                search_index.rebuild()
+        else:
+            post_ids = self._new_post_ids()
+            commented = set(
+                Comment.objects.filter(pk__gt=self.last_comment)
+                .values_list('post_id', flat=True))
+            stats.reconcile(users=self.touched_authors, posts=commented,
+                            groups=self.touched_groups - {None})
+            for readers in _chunks(self._feed_readers(), self.batch_size):
+                feeds.rebuild(readers)
+            self._index_new_documents(post_ids)
+        caching.bump(
+            caching.INDEX,
+            caching.GROUPS,
+            *map(caching.author_scope, self.touched_authors),
+            *map(caching.group_scope, self.touched_groups),
+        )
+
+
+def throughput(rows, started):
+    elapsed = time.monotonic() - started
+    return rows / elapsed if elapsed else float(rows)
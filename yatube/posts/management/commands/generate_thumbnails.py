@@ -0,0 +1,42 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+def _setup_worker():
+    # Нужно при запуске процессов через spawn; после fork ничего не делает
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = 'Готовит превью для уже загруженных картинок постов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=None,
+            help='Число процессов (по умолчанию - по числу ядер)',
+        )
+
+    def handle(self, *args, processes, **options):
+        names = [
+            name for name in Post.objects.exclude(image='').order_by()
+            .values_list('image', flat=True).distinct()
+            if thumbnails.lookup(name) is None
+        ]
+        # Дочерние процессы не должны делить соединения с родителем
+        connections.close_all()
+        started = time.monotonic()
+        with ProcessPoolExecutor(max_workers=processes,
+                                 initializer=_setup_worker) as pool:
+            results = list(pool.map(thumbnails.generate, names,
+                                    chunksize=16))
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'Готово превью: {sum(results)} из {len(names)} '
+            f'за {elapsed:.1f} с')
@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import importer
+
+
+class Command(BaseCommand):
+    help = ('Загружает группы, посты, комментарии и подписки '
+            'из JSONL или CSV')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .jsonl или .csv')
+        parser.add_argument(
+            '--kind', choices=importer.KINDS,
+            help='Вид записей файла; для CSV обязателен',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько строк писать одним INSERT',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать сначала, а не с места прошлого запуска',
+        )
+        parser.add_argument(
+            '--defer-indexes', action='store_true',
+            help='Снять индексы лент на время загрузки',
+        )
+        parser.add_argument(
+            '--skip-image-check', action='store_true',
+            help='Не проверять, что картинки постов есть в хранилище',
+        )
+
+    def handle(self, *args, path, kind, batch_size, restart,
+               defer_indexes, skip_image_check, **options):
+        if path.endswith('.csv') and not kind:
+            raise CommandError('Для CSV укажите --kind')
+        progress = importer.Progress(f'{path}.progress')
+        if restart:
+            progress.clear()
+        resumed_from = progress.load()
+        if resumed_from:
+            self.stdout.write(f'Продолжаем со строки {resumed_from + 1}')
+        loader = importer.Importer(batch_size=batch_size,
+                                   check_images=not skip_image_check)
+        started = time.monotonic()
+
+        def report(batch_kind, done):
+            rate = importer.throughput(done - resumed_from, started)
+            self.stdout.write(
+                f'{batch_kind}: строк {done}, {rate:.0f} строк/с')
+
+        with importer.deferred_feed_indexes(defer_indexes):
+            try:
+                done = loader.run(
+                    importer.read_records(path, kind), progress,
+                    on_batch=report if options['verbosity'] > 1 else None)
+            except (KeyError, ValueError) as error:
+                raise CommandError(f'Неверная запись: {error}')
+        rate = importer.throughput(done - resumed_from, started)
+        self.stdout.write('Пересчитываем счетчики, ленты и индексы...')
+        loader.finish()
+        progress.clear()
+        for name, count in sorted(loader.counts.items()):
+            self.stdout.write(f'{name}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено строк: {done - resumed_from}, {rate:.0f} строк/с, '
+            f'всего {time.monotonic() - started:.1f} с'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts import feeds
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок с нуля'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='user_ids',
+            help='id пользователя, чью ленту пересобрать (можно повторять)',
+        )
+
+    def handle(self, *args, user_ids=None, **options):
+        total = feeds.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {total}'))
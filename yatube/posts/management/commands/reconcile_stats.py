@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts import stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает денормализованные счетчики и чинит расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Сколько строк пересчитывать за одну транзакцию',
+        )
+
+    def handle(self, *args, chunk_size, **options):
+        repaired = stats.reconcile(chunk_size)
+        for label, count in repaired.items():
+            self.stdout.write(f'{label}: исправлено {count}')
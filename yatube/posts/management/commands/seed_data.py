@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import importer
+from posts.seeding import Seeder
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, группами, '
+            'постами, подписками и комментариями')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок на пользователя',
+        )
+        parser.add_argument('--comments', type=int, default=10000)
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней распределить посты',
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель степенного закона популярности',
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Одинаковый seed дает одинаковые данные',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Сколько строк писать одним INSERT',
+        )
+        parser.add_argument(
+            '--defer-indexes', action='store_true',
+            help='Снять индексы лент на время загрузки',
+        )
+
+    def handle(self, *args, batch_size, defer_indexes, **options):
+        seeder = Seeder(**{
+            name: options[name] for name in (
+                'users', 'groups', 'posts', 'follows', 'comments',
+                'days', 'skew', 'seed')
+        })
+        loader = importer.Importer(batch_size=batch_size, check_images=False)
+        started = time.monotonic()
+
+        def report(kind, done):
+            rate = importer.throughput(done, started)
+            self.stdout.write(f'{kind}: строк {done}, {rate:.0f} строк/с')
+
+        with importer.deferred_feed_indexes(defer_indexes):
+            done = loader.run(seeder.records(), on_batch=report
+                              if options['verbosity'] > 1 else None)
+        rate = importer.throughput(done, started)
+        self.stdout.write('Пересчитываем счетчики, ленты и индексы...')
+        loader.finish()
+        for name, count in sorted(loader.counts.items()):
+            self.stdout.write(f'{name}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано строк: {done}, {rate:.0f} строк/с, '
+            f'всего {time.monotonic() - started:.1f} с'))
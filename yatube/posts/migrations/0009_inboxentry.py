@@ -0,0 +1,70 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:05
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def fill_inboxes(apps, schema_editor):
+    # Один INSERT ... SELECT на автора; авторов, у которых подписчиков
+    # не меньше FEED_FANOUT_LIMIT, лента подтягивает при чтении
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    InboxEntry = apps.get_model('posts', 'InboxEntry')
+    quote = schema_editor.quote_name
+    inbox = quote(InboxEntry._meta.db_table)
+    follow = quote(Follow._meta.db_table)
+    post = quote(Post._meta.db_table)
+    sql = (
+        f'INSERT INTO {inbox} (user_id, post_id, author_id, pub_date) '
+        f'SELECT {follow}.user_id, {post}.id, {post}.author_id, '
+        f'{post}.pub_date FROM {follow} '
+        f'INNER JOIN {post} ON {post}.author_id = {follow}.author_id '
+        f'WHERE {follow}.author_id = %s'
+    )
+    authors = (Follow.objects.order_by().values('author_id')
+               .annotate(followers=Count('pk'))
+               .filter(followers__lt=settings.FEED_FANOUT_LIMIT)
+               .values_list('author_id', flat=True))
+    with schema_editor.connection.cursor() as cursor:
+        for author_id in authors.iterator():
+            cursor.execute(sql, [author_id])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0008_post_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboxEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox_entries', to='posts.Post', verbose_name='Пост')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='inbox', to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты подписок',
+                'verbose_name_plural': 'Ленты подписок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='inboxentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='inbox_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='inboxentry',
+            index=models.Index(fields=['user', 'author'], name='inbox_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='inboxentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='unique_inbox_entry'),
+        ),
+        migrations.RunPython(fill_inboxes, migrations.RunPython.noop),
+    ]
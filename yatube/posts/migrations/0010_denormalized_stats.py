@@ -0,0 +1,72 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:07
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def count_of(model, field, outer='pk'):
+    """Подзапрос COUNT(*) строк `model`, ссылающихся на внешнюю строку."""
+    rows = (model.objects.filter(**{field: OuterRef(outer)})
+            .order_by().values(field).annotate(total=Count('*'))
+            .values('total'))
+    return Coalesce(Subquery(rows), 0)
+
+
+def fill_counters(apps, schema_editor):
+    # По одному UPDATE ... = (SELECT COUNT(*) ...) на таблицу
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    AuthorStats = apps.get_model('posts', 'AuthorStats')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    AuthorStats.objects.bulk_create(
+        (AuthorStats(user_id=user_id) for user_id in
+         User.objects.values_list('pk', flat=True).iterator()),
+        batch_size=1000,
+    )
+    AuthorStats.objects.update(
+        posts_count=count_of(Post, 'author', 'user_id'),
+        followers_count=count_of(Follow, 'author', 'user_id'),
+        following_count=count_of(Follow, 'user', 'user_id'),
+    )
+    Group.objects.update(posts_count=count_of(Post, 'group'))
+    Post.objects.update(comments_count=count_of(Comment, 'post'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0009_inboxentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Число постов')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Число подписчиков')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Число подписок')),
+            ],
+            options={
+                'verbose_name': 'Статистика автора',
+                'verbose_name_plural': 'Статистика авторов',
+            },
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число постов'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
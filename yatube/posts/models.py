@@ -19,6 +19,11 @@ class Group(models.Model):
         verbose_name='Описание',
         help_text='Укажите описание группы'
     )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число постов',
+    )
 
     def __str__(self):  # Меняем отображение объекта Group
         return self.title
@@ -36,6 +41,11 @@ class Post(models.Model):
         verbose_name='Дата публикации',
         help_text='Введите дату публикации'
     )
+    updated = models.DateTimeField(
+        auto_now=True,
+        db_index=True,
+        verbose_name='Дата изменения',
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -57,9 +67,23 @@ class Post(models.Model):
         verbose_name='Картинка',
         help_text='Картинка, удачно дополняющая пост',
     )
+    comments_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Число комментариев',
+    )
 
     class Meta:
-        ordering = ('-pub_date',)
+        # id разрешает совпадения pub_date при пагинации по ключу
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_feed_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_feed_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_feed_idx'),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
@@ -115,3 +139,71 @@ class Follow(models.Model):
                 name='restrict_self_follow',
             ),
         ]
+
+
+class AuthorStats(models.Model):
+    """Счетчики пользователя, которые поддерживаются при записи."""
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+    )
+    posts_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число постов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число подписчиков',
+    )
+    following_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Число подписок',
+    )
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+
+class InboxEntry(models.Model):
+    """Пост в материализованной ленте подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        related_name='inbox',
+        verbose_name='Читатель',
+        on_delete=models.CASCADE,
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name='inbox_entries',
+        verbose_name='Пост',
+        on_delete=models.CASCADE,
+    )
+    author = models.ForeignKey(
+        User,
+        related_name='+',
+        verbose_name='Автор',
+        on_delete=models.CASCADE,
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_inbox_entry',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='inbox_feed_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='inbox_author_idx'),
+        ]
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Ленты подписок'
@@ -0,0 +1,118 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+FORWARD = 'n'
+BACKWARD = 'p'
+
+
+def encode_cursor(direction, post=None):
+    """Упаковывает позицию в ленте в непрозрачный токен."""
+    anchor = f'{post.pub_date.isoformat()}|{post.pk}' if post else ''
+    token = urlsafe_b64encode(f'{direction}{anchor}'.encode())
+    return token.decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (направление, pub_date, pk) или None для битого токена."""
+    try:
+        raw = urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+    except (Base64Error, UnicodeDecodeError, ValueError):
+        return None
+    direction, anchor = raw[:1], raw[1:]
+    if direction not in (FORWARD, BACKWARD):
+        return None
+    if not anchor:
+        # Якорь не нужен только для перехода на последнюю страницу.
+        return (direction, None, None) if direction == BACKWARD else None
+    pub_date, _, pk = anchor.partition('|')
+    try:
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except ValueError:
+        return None
+    if pub_date is None:
+        return None
+    return direction, pub_date, pk
+
+
+class CursorPaginator(Paginator):
+    """Пагинация по ключу (pub_date, id) без COUNT и OFFSET.
+
+    Страница ищется по индексу от позиции, закодированной в токене,
+    поэтому новые посты не сдвигают уже открытые страницы. Состояние
+    навигации хранится в пагинаторе: страница остается обычной `Page`,
+    а `count` и `num_pages` считаются только если к ним обратиться.
+    """
+    keyset = True
+
+    def __init__(self, object_list, per_page, date_field='pub_date'):
+        super().__init__(object_list, per_page)
+        self.date_field = date_field
+        self.cursor = ''
+        self.next_cursor = None
+        self.previous_cursor = None
+        self.last_cursor = encode_cursor(BACKWARD)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def _ordered(self, descending=True):
+        sign = '-' if descending else ''
+        return self.object_list.order_by(
+            f'{sign}{self.date_field}', f'{sign}pk')
+
+    def _seek(self, pub_date, pk, older, pk_field='pk'):
+        lookup = 'lt' if older else 'gt'
+        return (
+            Q(**{f'{self.date_field}__{lookup}': pub_date})
+            | Q(**{self.date_field: pub_date, f'{pk_field}__{lookup}': pk})
+        )
+
+    def _rows(self, pub_date, pk, older, limit):
+        """До `limit` объектов за позицией (или с края ленты, если
+        позиции нет): к старым, если `older`, иначе к новым."""
+        queryset = self._ordered(descending=older)
+        if pub_date is not None:
+            queryset = queryset.filter(self._seek(pub_date, pk, older))
+        return list(queryset[:limit])
+
+    def get_page(self, cursor):
+        position = decode_cursor(cursor) if cursor else None
+        if position is None:
+            return self._forward(None, None, from_start=True)
+        direction, pub_date, pk = position
+        self.cursor = cursor
+        if direction == FORWARD:
+            return self._forward(pub_date, pk)
+        return self._backward(pub_date, pk)
+
+    def _forward(self, pub_date, pk, from_start=False):
+        rows = self._rows(pub_date, pk, older=True, limit=self.per_page + 1)
+        items = rows[:self.per_page]
+        if len(rows) > self.per_page:
+            self.next_cursor = encode_cursor(FORWARD, items[-1])
+        if items and not from_start:
+            self.previous_cursor = encode_cursor(BACKWARD, items[0])
+        return self._get_page(items, 1, self)
+
+    def _backward(self, pub_date, pk):
+        rows = self._rows(pub_date, pk, older=False,
+                          limit=self.per_page + 1)
+        if len(rows) <= self.per_page:
+            # Дошли до начала ленты: показываем полную первую страницу.
+            self.cursor = ''
+            return self._forward(None, None, from_start=True)
+        items = rows[:self.per_page][::-1]
+        self.previous_cursor = encode_cursor(BACKWARD, items[0])
+        if pub_date is not None:
+            self.next_cursor = encode_cursor(FORWARD, items[-1])
+        return self._get_page(items, 1, self)
@@ -0,0 +1,132 @@
+"""Синтетические данные с перекосами, как на боевом сайте.
+
+Популярность авторов, групп и постов подчиняется степенному закону:
+у немногих авторов большая часть подписчиков и постов, несколько
+горячих групп собирают почти всю ленту, а комментарии скапливаются под
+небольшой долей постов. Все случайное берется из генераторов с общим
+`seed`, поэтому одинаковые параметры дают одинаковые данные. Записи
+имеют тот же вид, что и у `importer`, и пишутся его пачками.
+"""
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from django.utils import timezone
+from faker import Faker
+
+from .models import Post
+
+# Лента заканчивается в фиксированный момент, а не «сейчас»,
+# иначе два прогона с одним seed дали бы разные даты
+END_DATE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+SENTENCE_POOL = 5000
+NO_GROUP_SHARE = 0.3
+
+
+def power_law_weights(count, skew, rng):
+    """Кумулятивные веса 1 / rank ** skew в случайном порядке рангов."""
+    weights = [1 / rank ** skew for rank in range(1, count + 1)]
+    rng.shuffle(weights)
+    return list(accumulate(weights))
+
+
+class Seeder:
+    def __init__(self, users=1000, groups=20, posts=10000, follows=20,
+                 comments=10000, days=365, skew=1.1, seed=0):
+        self.users = users
+        self.groups = groups
+        self.posts = posts
+        self.follows = follows
+        self.comments = comments
+        self.days = days
+        self.skew = skew
+        self.rng = random.Random(seed)
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(seed)
+        self.sentences = [self.fake.sentence()
+                          for _ in range(SENTENCE_POOL)]
+        self.usernames = [f'{self.fake.user_name()}_{number}'
+                          for number in range(users)]
+        self.slugs = [f'group-{number}' for number in range(groups)]
+        self.first_post_id = None
+
+    def text(self, low, high):
+        return ' '.join(self.rng.choices(
+            self.sentences, k=self.rng.randint(low, high)))
+
+    def post_date(self, number):
+        # Посты идут по порядку id, с небольшим разбросом внутри шага
+        step = timedelta(days=self.days) / max(self.posts, 1)
+        start = END_DATE - timedelta(days=self.days)
+        return start + step * (number + self.rng.random())
+
+    def records(self, first_post_id=None):
+        """Записи в порядке загрузки: группы, посты, подписки, комментарии.
+
+        `first_post_id` - с какого id нумеровать посты, по умолчанию
+        следующий после последнего поста в базе.
+        """
+        if first_post_id is None:
+            last = Post.objects.order_by('-pk').values_list('pk', flat=True)
+            first_post_id = (last.first() or 0) + 1
+        yield from self.group_records()
+        yield from self.post_records(first_post_id)
+        yield from self.follow_records()
+        yield from self.comment_records(first_post_id)
+
+    def group_records(self):
+        for slug in self.slugs:
+            yield {
+                'kind': 'group',
+                'slug': slug,
+                'title': self.fake.sentence(nb_words=3).rstrip('.'),
+                'description': self.text(1, 3),
+            }
+
+    def post_records(self, first_post_id):
+        authors = power_law_weights(self.users, self.skew, self.rng)
+        groups = power_law_weights(self.groups, self.skew, self.rng)
+        for number in range(self.posts):
+            author = self.rng.choices(self.usernames, cum_weights=authors)[0]
+            group = None
+            if self.slugs and self.rng.random() >= NO_GROUP_SHARE:
+                group = self.rng.choices(self.slugs, cum_weights=groups)[0]
+            yield {
+                'kind': 'post',
+                'id': first_post_id + number,
+                'author': author,
+                'group': group,
+                'text': self.text(1, 8),
+                'pub_date': self.post_date(number).isoformat(),
+            }
+
+    def follow_records(self):
+        if self.users < 2 or not self.follows:
+            return
+        popularity = power_law_weights(self.users, self.skew, self.rng)
+        # Число подписок тоже с длинным хвостом, в среднем `follows`
+        alpha = 2
+        scale = self.follows * (alpha - 1) / alpha
+        for user in self.usernames:
+            count = min(round(scale * self.rng.paretovariate(alpha)),
+                        self.users - 1)
+            for author in self.rng.choices(
+                    self.usernames, cum_weights=popularity, k=count):
+                yield {'kind': 'follow', 'user': user, 'author': author}
+
+    def comment_records(self, first_post_id):
+        if not self.posts:
+            return
+        hot = power_law_weights(self.posts, self.skew, self.rng)
+        for _ in range(self.comments):
+            number = self.rng.choices(
+                range(self.posts), cum_weights=hot)[0]
+            created = self.post_date(number) + timedelta(
+                hours=self.rng.expovariate(1 / 12))
+            yield {
+                'kind': 'comment',
+                'post': first_post_id + number,
+                'author': self.rng.choice(self.usernames),
+                'text': self.text(1, 3),
+                'created': created.isoformat(),
+            }
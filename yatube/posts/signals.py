@@ -0,0 +1,129 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import caching, feeds, stats, tasks
+from .models import AuthorStats, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def create_author_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, raw=False, update_fields=None,
+                 **kwargs):
+    # Вход пользователя сохраняет только last_login
+    if created or raw or update_fields == frozenset(['last_login']):
+        return
+    # Имя автора есть и в карточках, и в закэшированных фрагментах лент
+    group_ids = (Post.objects.filter(author=instance)
+                 .exclude(group=None).order_by()
+                 .values_list('group_id', flat=True).distinct())
+    caching.bump(
+        caching.user_scope(instance.pk),
+        caching.INDEX,
+        caching.author_scope(instance.pk),
+        *map(caching.group_scope, group_ids),
+    )
+
+
+def image_name(post):
+    # Через __dict__, чтобы не загружать отложенное поле
+    image = post.__dict__.get('image')
+    return getattr(image, 'name', image)
+
+
+@receiver(post_init, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    instance._loaded_group_id = instance.__dict__.get('group_id')
+    instance._loaded_image = image_name(instance)
+
+
+def bump_post_feeds(post, *group_ids):
+    caching.bump(
+        caching.INDEX,
+        caching.author_scope(post.author_id),
+        *(caching.group_scope(group_id) for group_id in group_ids),
+    )
+
+
+def bump_comment_feeds(comment):
+    try:
+        post = comment.post
+    except Post.DoesNotExist:
+        # Пост удаляется вместе с комментариями и сам сбросит ленты
+        return
+    bump_post_feeds(post, post.group_id)
+    caching.bump(caching.post_scope(post.pk))
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    bump_post_feeds(instance, instance._loaded_group_id, instance.group_id)
+    if created:
+        stats.change_author(instance.author_id, posts_count=1)
+        stats.change_group(instance.group_id, posts_count=1)
+        feeds.fan_out(instance)
+    elif instance._loaded_group_id != instance.group_id:
+        stats.change_group(instance._loaded_group_id, posts_count=-1)
+        stats.change_group(instance.group_id, posts_count=1)
+    if instance.image and image_name(instance) != instance._loaded_image:
+        # Превью готовится при записи, а не при первом показе
+        tasks.schedule_thumbnail(instance)
+    instance._loaded_group_id = instance.group_id
+    instance._loaded_image = image_name(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    bump_post_feeds(instance, instance.group_id)
+    stats.change_author(instance.author_id, posts_count=-1)
+    stats.change_group(instance.group_id, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.change_post(instance.post_id, comments_count=1)
+    if not raw:
+        bump_comment_feeds(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    stats.change_post(instance.post_id, comments_count=-1)
+    bump_comment_feeds(instance)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, raw=False, **kwargs):
+    # Название и адрес группы есть в карточках всех лент
+    if not raw:
+        caching.bump(caching.GROUPS)
+
+
+@receiver(post_save, sender=Follow)
+def follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        stats.change_author(instance.author_id, followers_count=1)
+        stats.change_author(instance.user_id, following_count=1)
+        feeds.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    stats.change_author(instance.author_id, followers_count=-1)
+    stats.change_author(instance.user_id, following_count=-1)
+    feeds.prune(instance.user_id, instance.author_id)
+    if feeds.dropped_below_limit(instance.author_id):
+        tasks.refill_inboxes.schedule(
+            (instance.author_id,),
+            unique_key=f'refill_inboxes:{instance.author_id}')
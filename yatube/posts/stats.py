@@ -0,0 +1,121 @@
+"""Денормализованные счетчики постов, подписок и комментариев.
+
+Счетчики меняются атомарными UPDATE ... SET n = n + 1 из сигналов
+записи, а `reconcile` пересчитывает их пачками и чинит расхождения.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
+
+from .models import AuthorStats, Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# поле счетчика: (что считаем, по какому столбцу группируем)
+AUTHOR_COUNTERS = {
+    'posts_count': (Post, 'author_id'),
+    'followers_count': (Follow, 'author_id'),
+    'following_count': (Follow, 'user_id'),
+}
+POST_COUNTERS = {
+    'comments_count': (Comment, 'post_id'),
+}
+GROUP_COUNTERS = {
+    'posts_count': (Post, 'group_id'),
+}
+
+
+def _change(queryset, **deltas):
+    return queryset.update(**{
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    })
+
+
+def change_author(user_id, **deltas):
+    updated = _change(AuthorStats.objects.filter(user_id=user_id), **deltas)
+    if not updated and max(deltas.values()) > 0:
+        # Строки еще нет: считаем с нуля, запись уже есть в базе
+        AuthorStats.objects.get_or_create(
+            user_id=user_id,
+            defaults={field: actual.get(user_id, 0)
+                      for field, actual
+                      in _actual(AUTHOR_COUNTERS, [user_id]).items()},
+        )
+
+
+def change_post(post_id, **deltas):
+    _change(Post.objects.filter(pk=post_id), **deltas)
+
+
+def change_group(group_id, **deltas):
+    if group_id is not None:
+        _change(Group.objects.filter(pk=group_id), **deltas)
+
+
+def _actual(counters, ids):
+    return {
+        field: dict(
+            model.objects.filter(**{f'{column}__in': ids})
+            .order_by()
+            .values_list(column)
+            .annotate(total=Count('pk'))
+        )
+        for field, (model, column) in counters.items()
+    }
+
+
+def _id_chunks(model, chunk_size, ids=None):
+    if ids is not None:
+        ids = sorted(ids)
+        for start in range(0, len(ids), chunk_size):
+            yield ids[start:start + chunk_size]
+        return
+    last = 0
+    while True:
+        ids = list(model.objects.filter(pk__gt=last).order_by('pk')
+                   .values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def _repair(model, counters, ids):
+    actual = _actual(counters, ids)
+    stored = {
+        row[0]: row[1:]
+        for row in model.objects.filter(pk__in=ids)
+        .values_list('pk', *counters)
+    }
+    missing, drifted = [], []
+    for pk in ids:
+        values = {field: actual[field].get(pk, 0) for field in counters}
+        if pk not in stored:
+            missing.append(model(pk=pk, **values))
+        elif tuple(values.values()) != stored[pk]:
+            drifted.append(model(pk=pk, **values))
+    model.objects.bulk_create(missing)
+    model.objects.bulk_update(drifted, list(counters))
+    return len(missing) + len(drifted)
+
+
+def reconcile(chunk_size=1000, users=None, posts=None, groups=None):
+    """Пересчитывает счетчики; возвращает число исправленных строк.
+
+    `users`, `posts` и `groups` - id, которыми ограничить пересчет;
+    None - пересчитать все строки таблицы.
+    """
+    targets = [
+        (User, AuthorStats, AUTHOR_COUNTERS, users),
+        (Post, Post, POST_COUNTERS, posts),
+        (Group, Group, GROUP_COUNTERS, groups),
+    ]
+    repaired = {}
+    for source, model, counters, scope in targets:
+        repaired[model._meta.label] = 0
+        for ids in _id_chunks(source, chunk_size, scope):
+            with transaction.atomic():
+                repaired[model._meta.label] += _repair(model, counters, ids)
+    return repaired
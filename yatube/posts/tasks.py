@@ -0,0 +1,36 @@
+from sorl.thumbnail import default
+
+from core import timing
+from tasks.registry import task
+
+from . import caching, feeds, thumbnails
+
+
+@task(queue='images')
+def generate_thumbnail(name, author_id, group_id, post_id=None):
+    # Ошибка долетит до воркера, и задача будет повторена
+    with timing.measure('thumbnail'):
+        default.backend.get_thumbnail(
+            name, thumbnails.GEOMETRY, **thumbnails.OPTIONS)
+    # Ленты с заглушкой вместо превью больше не нужны
+    caching.bump(
+        caching.INDEX,
+        caching.author_scope(author_id),
+        caching.group_scope(group_id),
+        caching.post_scope(post_id),
+    )
+
+
+def schedule_thumbnail(post):
+    """Ставит превью картинки поста в очередь, если его там еще нет."""
+    if not post.image:
+        return None
+    return generate_thumbnail.schedule(
+        (post.image.name, post.author_id, post.group_id, post.pk),
+        unique_key=f'thumbnail:{post.image.name}',
+    )
+
+
+@task(queue='feeds')
+def refill_inboxes(author_id):
+    feeds.refill(author_id)
@@ -0,0 +1,44 @@
+from django import template
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from core import holes
+from posts import caching, thumbnails
+
+register = template.Library()
+
+CARD_TEMPLATE = 'includes/posts.html'
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, page):
+    """Пары (пост, HTML карточки) для страницы ленты.
+
+    Готовые карточки берутся из кэша одним `get_many`, отрисовываются
+    только промахи, и превью ищутся тоже только для них. Карточку с
+    превью в очереди не кэшируем: она изменится, когда превью появится.
+    """
+    posts = list(page)
+    group = context.get('group')
+    keys = caching.card_keys(posts, group)
+    cards = cache.get_many(keys)
+    missing = [(post, key) for post, key in zip(posts, keys)
+               if key not in cards]
+    if missing:
+        preloaded = thumbnails.preload([post for post, key in missing])
+        card_template = get_template(CARD_TEMPLATE)
+        rendered = {}
+        for post, key in missing:
+            cards[key] = card_template.render({
+                'post': post,
+                'group': group,
+                'post_thumbnails': preloaded,
+            })
+            if not post.image or preloaded.get(post.pk) is not None:
+                rendered[key] = cards[key]
+            else:
+                holes.dont_cache(context.get('request'))
+        cache.set_many(rendered, settings.POST_CARD_CACHE_TIMEOUT)
+    return [(post, mark_safe(cards[key])) for post, key in zip(posts, keys)]
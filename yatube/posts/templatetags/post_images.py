@@ -0,0 +1,33 @@
+from django import template
+
+from core import holes
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def preload_thumbnails(page):
+    """Заранее находит превью для всех постов страницы."""
+    return thumbnails.preload(page)
+
+
+@register.simple_tag(takes_context=True)
+def post_thumbnail(context, post):
+    """Готовое превью картинки поста или None, пока оно в очереди.
+
+    В очередь превью ставит сохранение поста; шаблон ничего не пишет.
+
+    Если на странице был `preload_thumbnails ... as post_thumbnails`,
+    берет превью оттуда, а не из хранилища.
+    """
+    if not post.image:
+        return None
+    preloaded = context.get('post_thumbnails') or {}
+    if post.pk in preloaded:
+        thumbnail = preloaded[post.pk]
+    else:
+        thumbnail = thumbnails.lookup(post.image)
+    if thumbnail is None:
+        holes.dont_cache(context.get('request'))
+    return thumbnail
@@ -6,6 +6,8 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase, Client, override_settings
 from django.conf import settings
 
+from tasks.worker import Worker
+
 from ..models import Post, Group
 
 
@@ -13,7 +15,11 @@ TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 User = get_user_model()
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+# С TASKS_EAGER задача превью выполняется внутри запроса, сохранившего
+# пост, и ее обращения к kvstore sorl-thumbnail детектор N+1 (по умолчанию
+# он включен вместе с DEBUG) засчитал бы этому запросу
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, TASKS_EAGER=True,
+                   NPLUSONE_ENABLED=False)
 class PostTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -65,6 +71,19 @@ class PostTests(TestCase):
         self.authorized_client = Client()
         self.authorized_client.force_login(self.auth_user)
 
+    def create_pending_post(self):
+        """Пост с картинкой, превью которой еще ждет воркера."""
+        with self.settings(TASKS_EAGER=False):
+            return Post.objects.create(
+                author=self.author_user,
+                text='Превью в очереди',
+                group=self.group,
+                image=self.uploaded_gif,
+            )
+
+    def run_thumbnail_tasks(self):
+        return Worker(queues=['images'], poll_interval=0).run(once=True)
+
     @classmethod
     def tearDownClass(cls):
         super().tearDownClass()
@@ -0,0 +1,79 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core.budgets import QueryBudgetMixin
+
+from ..budgets import BUDGETS, DATASET
+from ..models import AuthorStats, Group, Post
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    budgets = BUDGETS
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command('seed_data', stdout=StringIO(), **DATASET)
+        cls.reader = (AuthorStats.objects.order_by('-following_count')
+                      .first().user)
+        cls.author = (AuthorStats.objects.exclude(user=cls.reader)
+                      .order_by('-posts_count').first().user)
+        cls.group = Group.objects.order_by('-posts_count').first()
+        cls.post = Post.objects.order_by('-comments_count', '-pk').first()
+
+    def client_for(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def requests(self):
+        """URL name -> (клиент, метод, адрес, данные)."""
+        guest = Client()
+        reader = self.client_for(self.reader)
+        author = self.client_for(self.post.author)
+        username = {'username': self.author.username}
+        post_id = {'post_id': self.post.pk}
+        return {
+            'posts:index': (guest, 'get', reverse('posts:index'), None),
+            'posts:follow_index': (
+                reader, 'get', reverse('posts:follow_index'), None),
+            'posts:group_list': (
+                guest, 'get',
+                reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+                None),
+            'posts:profile': (
+                guest, 'get', reverse('posts:profile', kwargs=username),
+                None),
+            'posts:post_detail': (
+                guest, 'get', reverse('posts:post_detail', kwargs=post_id),
+                None),
+            'posts:post_create': (
+                reader, 'post', reverse('posts:post_create'),
+                {'text': 'Пост в пределах бюджета'}),
+            'posts:post_edit': (
+                author, 'post', reverse('posts:post_edit', kwargs=post_id),
+                {'text': 'Правка в пределах бюджета'}),
+            'posts:add_comment': (
+                reader, 'post', reverse('posts:add_comment', kwargs=post_id),
+                {'text': 'Комментарий в пределах бюджета'}),
+            'posts:profile_follow': (
+                reader, 'get', reverse('posts:profile_follow',
+                                       kwargs=username), None),
+            'posts:profile_unfollow': (
+                reader, 'get', reverse('posts:profile_unfollow',
+                                       kwargs=username), None),
+        }
+
+    def test_every_budget_has_a_request(self):
+        self.assertEqual(set(self.requests()), set(BUDGETS))
+
+    def test_views_stay_within_budget(self):
+        for url_name, (client, method, url, data) in self.requests().items():
+            with self.subTest(url_name=url_name):
+                cache.clear()
+                with self.assertWithinBudget(url_name):
+                    response = getattr(client, method)(url, data or {})
+                self.assertLess(response.status_code, 400)
@@ -0,0 +1,86 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Follow, InboxEntry, Post
+from .fixtures import PostTests
+
+
+class FollowFeedTests(PostTests):
+    def follow_page(self):
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_inbox_backfilled_on_follow_and_pruned_on_unfollow(self):
+        self.authorized_client.get(
+            reverse('posts:profile_follow',
+                    kwargs={'username': self.author_user.username}))
+        self.assertEqual(
+            InboxEntry.objects.filter(user=self.auth_user).count(),
+            self.POSTS_IN_GROUP)
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': self.author_user.username}))
+        self.assertFalse(
+            InboxEntry.objects.filter(user=self.auth_user).exists())
+
+    def test_new_post_fanned_out_to_followers(self):
+        Follow.objects.create(user=self.auth_user, author=self.author_user)
+        self.authorized_client.force_login(self.author_user)
+        self.authorized_client.post(
+            reverse('posts:post_create'), {'text': 'Рассылка'})
+        new_post = Post.objects.get(text='Рассылка')
+        self.assertTrue(
+            InboxEntry.objects.filter(
+                user=self.auth_user, post=new_post).exists())
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_popular_author_posts_pulled_on_read(self):
+        Follow.objects.create(user=self.auth_user, author=self.author_user)
+        Post.objects.create(author=self.author_user, text='Для миллиона')
+        self.assertFalse(InboxEntry.objects.exists())
+        self.assertEqual(
+            self.follow_page(),
+            list(self.author_user.posts.all()[:10]))
+
+    def test_rebuild_inboxes_command(self):
+        Follow.objects.create(user=self.auth_user, author=self.author_user)
+        Follow.objects.create(
+            user=self.auth_user, author=self.another_author_user)
+        expected = self.follow_page()
+        InboxEntry.objects.all().delete()
+        call_command('rebuild_inboxes', stdout=StringIO())
+        self.assertEqual(
+            InboxEntry.objects.count(),
+            self.POSTS_IN_GROUP + self.POSTS_IN_ANOTHER_GROUP)
+        self.assertEqual(self.follow_page(), expected)
+
+    def test_cursor_page_reads_inbox_by_index(self):
+        Follow.objects.create(user=self.auth_user, author=self.author_user)
+        with CaptureQueriesContext(connection) as captured:
+            posts = self.follow_page()
+        self.assertEqual(posts, list(self.author_user.posts.all()[:10]))
+        inbox_sql = [query['sql'] for query in captured
+                     if 'FROM "posts_inboxentry"' in query['sql']]
+        self.assertEqual(len(inbox_sql), 1)
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {inbox_sql[0]}')
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('inbox_feed_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    @override_settings(FEED_FANOUT_LIMIT=2)
+    def test_posts_refilled_when_author_drops_below_limit(self):
+        Follow.objects.create(user=self.auth_user, author=self.author_user)
+        Follow.objects.create(
+            user=self.another_author_user, author=self.author_user)
+        post = Post.objects.create(author=self.author_user, text='Пока звезда')
+        self.assertFalse(InboxEntry.objects.filter(post=post).exists())
+        Follow.objects.filter(user=self.another_author_user).delete()
+        self.assertTrue(
+            InboxEntry.objects.filter(user=self.auth_user, post=post).exists())
+        self.assertIn(post, self.follow_page())
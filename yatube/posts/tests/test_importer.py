@@ -0,0 +1,162 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+
+from search import index as search_index
+from tasks.models import Task
+from tasks.registry import loads
+
+from .. import importer
+from ..importer import Progress
+from ..models import AuthorStats, Comment, Follow, Group, InboxEntry, Post
+from .fixtures import PostTests
+
+
+class ImportTests(PostTests):
+    def write(self, records):
+        source = tempfile.NamedTemporaryFile(
+            'w', suffix='.jsonl', delete=False, encoding='utf-8')
+        with source:
+            for record in records:
+                source.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.addCleanup(os.remove, source.name)
+        return source.name
+
+    def write_csv(self, lines):
+        source = tempfile.NamedTemporaryFile(
+            'w', suffix='.csv', delete=False, encoding='utf-8')
+        with source:
+            source.write('\n'.join(lines) + '\n')
+        self.addCleanup(os.remove, source.name)
+        return source.name
+
+    def records(self):
+        return [
+            {'kind': 'group', 'slug': 'partners', 'title': 'Партнеры'},
+            {'kind': 'group', 'slug': self.group.slug, 'title': 'Повтор'},
+            {'kind': 'post', 'id': 1000, 'author': 'newcomer',
+             'group': 'partners', 'text': 'Первый импортированный',
+             'pub_date': '2020-01-02T03:04:05'},
+            {'kind': 'post', 'id': 1001, 'author': 'newcomer',
+             'text': 'Второй импортированный', 'image': 'posts/none.gif'},
+            {'kind': 'comment', 'post': 1000, 'author': 'reader',
+             'text': 'Комментарий'},
+            {'kind': 'comment', 'post': 999999, 'author': 'reader',
+             'text': 'К несуществующему посту'},
+            {'kind': 'follow', 'user': 'reader', 'author': 'newcomer'},
+            {'kind': 'follow', 'user': 'reader', 'author': 'newcomer'},
+            {'kind': 'follow', 'user': 'reader', 'author': 'reader'},
+        ]
+
+    def test_import_creates_rows_and_counters(self):
+        out = StringIO()
+        call_command('import_data', self.write(self.records()),
+                     batch_size=2, stdout=out)
+        partners = Group.objects.get(slug='partners')
+        first = Post.objects.get(pk=1000)
+        self.assertEqual(first.group, partners)
+        self.assertEqual(first.pub_date.year, 2020)
+        self.assertEqual(Post.objects.get(pk=1001).image, '')
+        self.assertEqual(first.comments_count, 1)
+        self.assertEqual(partners.posts_count, 1)
+        newcomer = AuthorStats.objects.get(user__username='newcomer')
+        self.assertEqual(newcomer.posts_count, 2)
+        self.assertEqual(newcomer.followers_count, 1)
+        self.assertEqual(Follow.objects.filter(
+            user__username='reader').count(), 1)
+        self.assertEqual(InboxEntry.objects.filter(
+            user__username='reader').count(), 2)
+        self.assertIn('rejected_follow: 2', out.getvalue())
+        self.assertIn('orphan_comment: 1', out.getvalue())
+        self.assertIn('missing_image: 1', out.getvalue())
+        self.assertEqual(
+            {hit.post.pk for hit
+             in search_index.search('импортированный').hits},
+            {1000, 1001})
+        self.assertEqual(
+            [(hit.kind, hit.post.pk) for hit
+             in search_index.search('комментарий').hits],
+            [(search_index.COMMENT, 1000)])
+
+    def test_import_resumes_after_crash(self):
+        path = self.write(self.records())
+        # Упали после первых трех строк: группы и первый пост уже в базе
+        call_command('import_data', self.write(self.records()[:3]),
+                     stdout=StringIO())
+        Progress(f'{path}.progress').save(3)
+        out = StringIO()
+        call_command('import_data', path, stdout=out)
+        self.assertIn('Продолжаем со строки 4', out.getvalue())
+        self.assertEqual(Post.objects.filter(pk__in=[1000, 1001]).count(), 2)
+        self.assertEqual(Comment.objects.filter(post_id=1000).count(), 1)
+        self.assertFalse(os.path.exists(f'{path}.progress'))
+
+    def test_skipped_posts_not_counted_and_unrelated_rows_untouched(self):
+        AuthorStats.objects.filter(user=self.another_author_user).update(
+            posts_count=999)
+        records = self.records() + [
+            {'kind': 'post', 'id': self.post.pk, 'author': 'newcomer',
+             'text': 'Занятый id'},
+        ]
+        out = StringIO()
+        call_command('import_data', self.write(records), stdout=out)
+        self.assertIn('post: 2', out.getvalue())
+        self.assertIn('existing_post: 1', out.getvalue())
+        self.assertNotEqual(Post.objects.get(pk=self.post.pk).text,
+                            'Занятый id')
+        # Пересчитываются только затронутые импортом строки
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.another_author_user)
+            .posts_count, 999)
+
+    def test_feed_indexes_restored_when_import_fails(self):
+        path = self.write(self.records()[:3] + [{'kind': 'unknown'}])
+        with mock.patch.object(importer, 'drop_feed_indexes') as drop, \
+                mock.patch.object(importer,
+                                  'restore_feed_indexes') as restore:
+            with self.assertRaises(CommandError):
+                call_command('import_data', path, defer_indexes=True,
+                             stdout=StringIO())
+        drop.assert_called_once_with()
+        restore.assert_called_once_with()
+
+    def test_csv_ids_are_numbers(self):
+        path = self.write_csv([
+            'id,author,text',
+            '2000,newcomer,Пост из CSV',
+            '2000,newcomer,Повтор id в файле',
+            f'{self.post.pk},newcomer,Занятый id',
+        ])
+        out = StringIO()
+        call_command('import_data', path, kind='post', stdout=out)
+        self.assertIn('post: 1', out.getvalue())
+        self.assertIn('existing_post: 2', out.getvalue())
+        self.assertEqual(Post.objects.get(pk=2000).text, 'Пост из CSV')
+        self.assertEqual(
+            [hit.post.pk for hit in search_index.search('CSV').hits],
+            [2000])
+
+    @override_settings(TASKS_EAGER=False)
+    def test_thumbnail_task_gets_id_of_post_without_one(self):
+        records = [
+            {'kind': 'post', 'author': 'newcomer', 'text': 'Без id',
+             'image': 'posts/imported.gif'},
+            {'kind': 'post', 'id': 3000, 'author': 'newcomer',
+             'text': 'С id', 'image': 'posts/explicit.gif'},
+        ]
+        call_command('import_data', self.write(records),
+                     skip_image_check=True, stdout=StringIO())
+        post = Post.objects.get(text='Без id')
+        calls = {
+            loads(payload)[0][0]: loads(payload)[0][3]
+            for payload in Task.objects.filter(
+                name='posts.tasks.generate_thumbnail')
+            .values_list('payload', flat=True)
+        }
+        self.assertEqual(calls, {'posts/imported.gif': post.pk,
+                                 'posts/explicit.gif': 3000})
@@ -0,0 +1,30 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase
+
+from ..models import Comment, Follow, Group, Post
+from ..seeding import Seeder
+
+
+class SeedingTests(TestCase):
+    options = {'users': 30, 'groups': 3, 'posts': 60, 'follows': 4,
+               'comments': 40}
+
+    def test_same_seed_same_records(self):
+        first = list(Seeder(seed=7, **self.options).records(1))
+        self.assertEqual(first, list(Seeder(seed=7, **self.options)
+                                     .records(1)))
+        self.assertNotEqual(first, list(Seeder(seed=8, **self.options)
+                                        .records(1)))
+
+    def test_seed_command(self):
+        call_command('seed_data', seed=7, stdout=StringIO(),
+                     **self.options)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertEqual(Comment.objects.count(), 40)
+        self.assertTrue(Follow.objects.exists())
+        self.assertFalse(Follow.objects.filter(
+            user=F('author')).exists())
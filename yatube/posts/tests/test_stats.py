@@ -0,0 +1,68 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.urls import reverse
+
+from ..models import AuthorStats, Comment, Follow, Group, Post
+from .fixtures import PostTests
+
+
+class StatsTests(PostTests):
+    def stats(self, user):
+        return AuthorStats.objects.get(user=user)
+
+    def test_post_counters(self):
+        self.assertEqual(
+            self.stats(self.author_user).posts_count, self.POSTS_IN_GROUP)
+        self.assertEqual(
+            Group.objects.get(pk=self.group.pk).posts_count,
+            self.POSTS_IN_GROUP)
+        post = Post.objects.filter(group=self.group).first()
+        post.group = self.another_group
+        post.save()
+        self.assertEqual(
+            Group.objects.get(pk=self.group.pk).posts_count,
+            self.POSTS_IN_GROUP - 1)
+        self.assertEqual(
+            Group.objects.get(pk=self.another_group.pk).posts_count,
+            self.POSTS_IN_ANOTHER_GROUP + 1)
+        post.delete()
+        self.assertEqual(
+            self.stats(self.author_user).posts_count,
+            self.POSTS_IN_GROUP - 1)
+        self.assertEqual(
+            Group.objects.get(pk=self.another_group.pk).posts_count,
+            self.POSTS_IN_ANOTHER_GROUP)
+
+    def test_follow_and_comment_counters(self):
+        self.authorized_client.get(
+            reverse('posts:profile_follow',
+                    kwargs={'username': self.author_user.username}))
+        self.assertEqual(self.stats(self.author_user).followers_count, 1)
+        self.assertEqual(self.stats(self.auth_user).following_count, 1)
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+            {'text': 'Комментарий'})
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).comments_count, 1)
+        Follow.objects.all().delete()
+        Comment.objects.all().delete()
+        self.assertEqual(self.stats(self.author_user).followers_count, 0)
+        self.assertEqual(self.stats(self.auth_user).following_count, 0)
+        self.assertEqual(
+            Post.objects.get(pk=self.post.pk).comments_count, 0)
+
+    def test_reconcile_stats_repairs_drift(self):
+        AuthorStats.objects.filter(user=self.author_user).update(
+            posts_count=0, followers_count=7)
+        AuthorStats.objects.filter(user=self.auth_user).delete()
+        Group.objects.update(posts_count=100)
+        call_command('reconcile_stats', chunk_size=2, stdout=StringIO())
+        stats = self.stats(self.author_user)
+        self.assertEqual(stats.posts_count, self.POSTS_IN_GROUP)
+        self.assertEqual(stats.followers_count, 0)
+        self.assertTrue(
+            AuthorStats.objects.filter(user=self.auth_user).exists())
+        self.assertEqual(
+            Group.objects.get(pk=self.group.pk).posts_count,
+            self.POSTS_IN_GROUP)
@@ -1,11 +1,17 @@
+from http import HTTPStatus
 from math import ceil
 
 from django.core.cache import cache
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.conf import settings
+from django.test import Client, override_settings
+from django.template import engines
 
-from ..models import Post, Follow
+from tasks.models import Task
+
+from .. import caching, tasks, thumbnails
+from ..models import Comment, Post, Follow
 from ..forms import PostForm
 from .fixtures import PostTests
 
@@ -21,19 +27,36 @@ class PostViewsTests(PostTests):
         )
         cache.clear()
         response_before_delete = self.guest_client.get(reverse('posts:index'))
-        temp_post.delete()
-        response_after_delete = self.guest_client.get(reverse('posts:index'))
+        with self.assertNumQueries(0):
+            response_cached = self.guest_client.get(reverse('posts:index'))
         self.assertEqual(
             response_before_delete.content,
-            response_after_delete.content
+            response_cached.content
         )
-        cache.clear()
-        response_cache_clear = self.guest_client.get(reverse('posts:index'))
+        temp_post.delete()
+        response_after_delete = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response_after_delete, temp_post.text)
         self.assertNotEqual(
             response_before_delete.content,
-            response_cache_clear.content
+            response_after_delete.content
         )
 
+    def test_group_and_profile_cache_invalidation(self):
+        cache.clear()
+        group_url = reverse('posts:group_list',
+                            kwargs={'slug': self.group.slug})
+        profile_url = reverse(
+            'posts:profile',
+            kwargs={'username': self.another_author_user.username})
+        self.guest_client.get(group_url)
+        self.guest_client.get(profile_url)
+        post = Post.objects.filter(group=self.another_group).first()
+        post.text = 'Перенесенный пост'
+        post.group = self.group
+        post.save()
+        self.assertContains(self.guest_client.get(group_url), post.text)
+        self.assertContains(self.guest_client.get(profile_url), post.text)
+
     def test_context_for_list_pages(self):
         cache.clear()
         list_pages = [
@@ -128,6 +151,134 @@ class PostViewsTests(PostTests):
                     num_posts_last_page
                 )
 
+    def test_cursor_paginator_walks_whole_feed(self):
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        seen = []
+        cursor = ''
+        while True:
+            response = self.guest_client.get(url, {'cursor': cursor})
+            paginator = response.context['page_obj'].paginator
+            seen.extend(response.context['page_obj'].object_list)
+            if not paginator.has_next:
+                break
+            cursor = paginator.next_cursor
+        self.assertEqual(seen, list(self.group.posts.all()))
+
+    def test_cursor_pages_stable_on_new_posts(self):
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        first_page = self.guest_client.get(url).context['page_obj']
+        first_page_posts = list(first_page)
+        next_cursor = first_page.paginator.next_cursor
+        second_page = list(
+            self.guest_client.get(url, {'cursor': next_cursor})
+            .context['page_obj'])
+        Post.objects.create(
+            author=self.author_user,
+            text='Свежий пост',
+            group=self.group,
+        )
+        response = self.guest_client.get(url, {'cursor': next_cursor})
+        self.assertEqual(list(response.context['page_obj']), second_page)
+        previous_cursor = response.context['page_obj'].paginator \
+            .previous_cursor
+        response = self.guest_client.get(url, {'cursor': previous_cursor})
+        self.assertEqual(list(response.context['page_obj']), first_page_posts)
+
+    def test_cursor_paginator_last_and_broken_cursor(self):
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        paginator = self.guest_client.get(url).context['page_obj'].paginator
+        response = self.guest_client.get(
+            url, {'cursor': paginator.last_cursor})
+        self.assertEqual(
+            list(response.context['page_obj']),
+            list(self.group.posts.all())[-settings.POSTS_PER_PAGE:]
+        )
+        self.assertFalse(response.context['page_obj'].paginator.has_next)
+        response = self.guest_client.get(url, {'cursor': 'не курсор'})
+        self.assertEqual(
+            list(response.context['page_obj']),
+            list(self.group.posts.all()[:settings.POSTS_PER_PAGE])
+        )
+
+    def test_conditional_get_for_feeds(self):
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': self.author_user.username}),
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                # Первый показ ставит превью в работу и меняет ленту
+                self.guest_client.get(url)
+                etag = self.guest_client.get(url)['ETag']
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+                self.assertNotEqual(
+                    self.authorized_client.get(url)['ETag'], etag)
+                Post.objects.create(
+                    author=self.author_user, text='Новый', group=self.group)
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_conditional_get_for_post_detail(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.guest_client.get(url)
+        etag = response['ETag']
+        # Общий для всех читателей штамп не отдаем: страница у каждого своя
+        self.assertFalse(response.has_header('Last-Modified'))
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+        self.authorized_client.force_login(self.post.author)
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.pk}),
+            {'text': 'Отредактированный текст'})
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(response, 'Отредактированный текст')
+
+    def test_post_detail_etag_changes_with_csrf_token_on_login(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        User.objects.create_user(username='reader', password='password')
+        reader = Client()
+        credentials = {'username': 'reader', 'password': 'password'}
+        reader.post(reverse('users:login'), credentials)
+        etag = reader.get(url)['ETag']
+        reader.get(reverse('users:logout'))
+        reader.post(reverse('users:login'), credentials)
+        response = reader.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+    def test_post_detail_etag_changes_with_comments(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        commenter = User.objects.create_user(username='commenter')
+        comment = Comment.objects.create(
+            post=self.post, author=commenter, text='Комментарий')
+        etag = self.guest_client.get(url)['ETag']
+        comment.text = 'Исправленный комментарий'
+        comment.save()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        etag = response['ETag']
+        commenter.first_name = 'Переименованный'
+        commenter.save()
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_post_detail_etag_changes_when_thumbnail_ready(self):
+        post_with_gif = self.create_pending_post()
+        url = reverse('posts:post_detail',
+                      kwargs={'post_id': post_with_gif.pk})
+        etag = self.guest_client.get(url)['ETag']
+        tasks.generate_thumbnail(
+            post_with_gif.image.name, post_with_gif.author_id,
+            post_with_gif.group_id, post_with_gif.pk)
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
     def test_context_for_post_detail(self):
         post_with_gif = Post.objects.exclude(image='').first()
         response = self.authorized_client.get(
@@ -135,6 +286,160 @@ class PostViewsTests(PostTests):
         )
         self.assertEqual(response.context.get('post'), post_with_gif)
 
+    def test_thumbnail_scheduled_on_save_not_on_render(self):
+        post_with_gif = self.create_pending_post()
+        self.assertEqual(
+            Task.objects.filter(
+                unique_key=f'thumbnail:{post_with_gif.image.name}').count(),
+            1)
+        url = reverse('posts:post_detail',
+                      kwargs={'post_id': post_with_gif.pk})
+        tasks_before = Task.objects.count()
+        response = self.guest_client.get(url)
+        self.assertContains(response, post_with_gif.image.url)
+        self.assertEqual(Task.objects.count(), tasks_before)
+        self.run_thumbnail_tasks()
+        thumbnail = thumbnails.lookup(post_with_gif.image)
+        self.assertIsNotNone(thumbnail)
+        self.assertContains(self.guest_client.get(url), thumbnail.url)
+
+    def test_thumbnails_preloaded_for_page(self):
+        posts = list(self.group.posts.all()[:settings.POSTS_PER_PAGE])
+        with_image = [post for post in posts if post.image]
+        # Записи kvstore из прошлых тестов откатились, а кэш остался.
+        cache.clear()
+        for post in with_image:
+            thumbnails.generate(post.image.name)
+        cache.clear()
+        thumbnails.lookup_stats.clear()
+
+        def names(preloaded):
+            return {pk: thumbnail.name
+                    for pk, thumbnail in preloaded.items() if thumbnail}
+
+        with self.assertNumQueries(1):
+            preloaded = names(thumbnails.preload(posts))
+        self.assertEqual(set(preloaded), {post.pk for post in with_image})
+        with self.assertNumQueries(0):
+            self.assertEqual(names(thumbnails.preload(posts)), preloaded)
+        self.assertEqual(thumbnails.lookup_stats['db_hits'], len(with_image))
+        self.assertEqual(thumbnails.hit_ratio(), 0.5)
+
+    def test_post_cards_shared_between_feeds(self):
+        cache.clear()
+        template = engines['django'].from_string(
+            '{% load post_cards %}{% post_cards posts as cards %}'
+            '{% for post, card in cards %}{{ card }}{% endfor %}')
+
+        def posts():
+            return list(self.another_group.posts.select_related(
+                'author', 'group')[:3])
+
+        group_url = reverse('posts:group_list',
+                            kwargs={'slug': self.another_group.slug})
+        html = template.render({'posts': posts()})
+        self.assertIn(group_url, html)
+        page = posts()
+        with self.assertNumQueries(0):
+            self.assertEqual(template.render({'posts': page}), html)
+        self.assertNotIn(group_url, template.render(
+            {'posts': posts(), 'group': self.another_group}))
+        self.another_author_user.first_name = 'Переименованный'
+        self.another_author_user.save()
+        self.assertIn('Переименованный', template.render({'posts': posts()}))
+
+    def test_feeds_show_renamed_author(self):
+        author = User.objects.create_user(username='renamed',
+                                          first_name='Старое')
+        Post.objects.create(author=author, text='Пост', group=self.group)
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'renamed'}),
+        ]
+        for url in urls:
+            self.assertContains(self.guest_client.get(url), 'Старое')
+        author.first_name = 'Новое'
+        author.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, 'Новое')
+                self.assertNotContains(response, 'Старое')
+
+    def test_post_card_with_pending_thumbnail_not_cached(self):
+        post_with_gif = self.create_pending_post()
+        template = engines['django'].from_string(
+            '{% load post_cards %}{% post_cards posts as cards %}'
+            '{% for post, card in cards %}{{ card }}{% endfor %}')
+        self.assertIn(post_with_gif.image.url,
+                      template.render({'posts': [post_with_gif]}))
+        self.assertFalse(cache.get_many(caching.card_keys([post_with_gif])))
+        self.run_thumbnail_tasks()
+        thumbnail = thumbnails.lookup(post_with_gif.image)
+        self.assertIn(thumbnail.url,
+                      template.render({'posts': [post_with_gif]}))
+        self.assertTrue(cache.get_many(caching.card_keys([post_with_gif])))
+
+    @override_settings(PAGE_CACHE_ENABLED=True)
+    def test_post_page_shared_by_readers_with_holes(self):
+        cache.clear()
+        post = Post.objects.filter(image='').first()
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        edit_url = reverse('posts:post_edit', kwargs={'post_id': post.pk})
+        author_client = Client()
+        author_client.force_login(post.author)
+        response = self.guest_client.get(url)
+        self.assertTemplateUsed(response, 'posts/post_detail.html')
+        self.assertNotContains(response, 'csrfmiddlewaretoken')
+        response = self.authorized_client.get(url)
+        self.assertTemplateNotUsed(response, 'posts/post_detail.html')
+        self.assertContains(response, f'Пользователь: {self.auth_user}')
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertNotContains(response, edit_url)
+        response = author_client.get(url)
+        self.assertTemplateNotUsed(response, 'posts/post_detail.html')
+        self.assertContains(response, edit_url)
+        self.assertNotContains(response, '<!--hole:')
+        Comment.objects.create(post=post, author=self.auth_user,
+                               text='Новый комментарий')
+        self.assertContains(self.guest_client.get(url), 'Новый комментарий')
+
+    @override_settings(PAGE_CACHE_ENABLED=True)
+    def test_index_shared_by_guests_and_readers(self):
+        cache.clear()
+        follow_url = reverse('posts:follow_index')
+        self.assertNotContains(
+            self.guest_client.get(reverse('posts:index')), follow_url)
+        response = self.authorized_client.get(reverse('posts:index'))
+        self.assertTemplateNotUsed(response, 'posts/index.html')
+        self.assertContains(response, follow_url)
+
+    @override_settings(PAGE_CACHE_ENABLED=True)
+    def test_page_cache_ignores_unknown_query_parameters(self):
+        cache.clear()
+        url = reverse('posts:index')
+        self.guest_client.get(url, {'page': 1})
+        response = self.guest_client.get(url, {'page': 1})
+        self.assertTemplateNotUsed(response, 'posts/index.html')
+        for params in ({'utm': 1}, {'utm': 1}, {'page': 1, 'utm': 2}):
+            response = self.guest_client.get(url, params)
+            self.assertTemplateUsed(response, 'posts/index.html')
+
+    @override_settings(PAGE_CACHE_ENABLED=True)
+    def test_page_with_pending_thumbnail_not_cached(self):
+        cache.clear()
+        post_with_gif = self.create_pending_post()
+        url = reverse('posts:post_detail',
+                      kwargs={'post_id': post_with_gif.pk})
+        self.assertContains(self.guest_client.get(url),
+                            post_with_gif.image.url)
+        self.run_thumbnail_tasks()
+        response = self.guest_client.get(url)
+        self.assertTemplateUsed(response, 'posts/post_detail.html')
+        self.assertContains(
+            response, thumbnails.lookup(post_with_gif.image).url)
+
     def test_context_for_post_create_and_edit(self):
         form_pages = [
             (reverse('posts:post_create'), None),
@@ -0,0 +1,118 @@
+"""Подготовка превью картинок постов вне запроса.
+
+Шаблоны не режут картинки сами: задачу `posts.tasks.generate_thumbnail`
+ставит в очередь сохранение поста или импорт, а тег `post_thumbnail` только
+ищет готовое превью в хранилище sorl-thumbnail и, пока его нет, показывает
+оригинал.
+"""
+import logging
+from collections import Counter
+
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import (
+    EMPTY_VALUE, KVStore as CachedDBKVStore,
+)
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core import timing
+
+logger = logging.getLogger(__name__)
+
+GEOMETRY = '960x339'
+OPTIONS = {'crop': 'center', 'upscale': True}
+
+# Счетчики пакетного поиска превью: cache_hits, db_hits, misses
+lookup_stats = Counter()
+
+
+class LookupBackend(ThumbnailBackend):
+    """Находит превью так же, как `get_thumbnail`, но не создает его."""
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def lookup(self, file_, geometry_string, **options):
+        return default.kvstore.get(
+            self.thumbnail_file(file_, geometry_string, **options))
+
+
+lookup_backend = LookupBackend()
+
+
+@timing.measure('thumbnail')
+def lookup(image):
+    return lookup_backend.lookup(image, GEOMETRY, **OPTIONS)
+
+
+@timing.measure('thumbnail')
+def preload(posts):
+    """Превью картинок всех постов страницы: {pk поста: ImageFile или None}.
+
+    Вместо запроса к хранилищу на каждый тег превью делает один
+    `get_many` к кэшу и один запрос к базе за тем, чего в кэше нет.
+    """
+    files = {
+        post.pk: lookup_backend.thumbnail_file(
+            post.image, GEOMETRY, **OPTIONS)
+        for post in posts if post.image
+    }
+    if not isinstance(default.kvstore, CachedDBKVStore):
+        return {pk: default.kvstore.get(file_)
+                for pk, file_ in files.items()}
+    keys = {pk: add_prefix(file_.key) for pk, file_ in files.items()}
+    kv_cache = default.kvstore.cache
+    found = kv_cache.get_many(keys.values())
+    lookup_stats['cache_hits'] += sum(
+        value != EMPTY_VALUE for value in found.values())
+    missing = [key for key in keys.values() if key not in found]
+    if missing:
+        from_db = dict(KVStoreModel.objects.filter(key__in=missing)
+                       .values_list('key', 'value'))
+        lookup_stats['db_hits'] += len(from_db)
+        # Как и sorl-thumbnail, запоминаем в кэше и отсутствие записи
+        from_db.update((key, EMPTY_VALUE)
+                       for key in missing if key not in from_db)
+        kv_cache.set_many(from_db, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        found.update(from_db)
+    preloaded = {}
+    for pk, key in keys.items():
+        value = found[key]
+        if value == EMPTY_VALUE:
+            lookup_stats['misses'] += 1
+            preloaded[pk] = None
+        else:
+            preloaded[pk] = deserialize_image_file(value)
+    logger.debug('Превью страницы: %s', dict(lookup_stats))
+    return preloaded
+
+
+def hit_ratio():
+    """Доля превью, найденных без обращения к базе."""
+    total = sum(lookup_stats.values())
+    return lookup_stats['cache_hits'] / total if total else None
+
+
+@timing.measure('thumbnail')
+def generate(name):
+    """Создает превью; True, если все прошло без ошибок."""
+    try:
+        default.backend.get_thumbnail(name, GEOMETRY, **OPTIONS)
+    except Exception:
+        logger.exception('Не удалось создать превью для %s', name)
+        return False
+    return True
@@ -1,42 +1,64 @@
+from functools import partial
+
 from django.core.paginator import Paginator
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
+from django.db import transaction
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.http import condition
+
+from core.holes import cached_page
+from core.querycache import cached
 
+from . import conditional
+from .caching import INDEX, author_scope, feed_fragment, group_scope
+from .feeds import FollowFeedPaginator, follow_feed, pulled_authors
 from .forms import PostForm, CommentForm
 from .models import Post, Group, Follow
+from .paginators import CursorPaginator
 
 User = get_user_model()
 
 
-def posts_page_splitter(page_number, post_list):
+def posts_page_splitter(params, post_list, cursor_paginator=CursorPaginator):
+    # Старые ссылки вида ?page=N продолжают работать через OFFSET
+    if settings.POSTS_PAGINATION == 'cursor' and 'page' not in params:
+        paginator = cursor_paginator(post_list, settings.POSTS_PER_PAGE)
+        return paginator.get_page(params.get('cursor'))
     paginator = Paginator(post_list, settings.POSTS_PER_PAGE)
-    return paginator.get_page(page_number)
+    return paginator.get_page(params.get('page'))
+
 
+def lazy_posts_page(params, post_list):
+    # Страница читается из базы, только если фрагмент ленты не в кэше
+    return SimpleLazyObject(lambda: posts_page_splitter(params, post_list))
 
+
+@condition(etag_func=conditional.index_etag)
+@cached_page(conditional.index_state)
 def index(request):
     post_list = Post.objects.select_related(
         'author', 'group')
-    page_obj = posts_page_splitter(
-        request.GET.get('page'),
-        post_list)
     context = {
-        'page_obj': page_obj,
+        'page_obj': lazy_posts_page(request.GET, post_list),
         'title': 'Последние обновления на сайте',
+        **feed_fragment('index_page', request.GET, INDEX),
     }
     return render(request, 'posts/index.html', context)
 
 
 @login_required
 def follow_index(request):
+    pulled = pulled_authors(request.user)
     follow_list = (
-        Post.objects.filter(
-            author__following__user=request.user)
+        follow_feed(request.user, pulled)
         .select_related('author', 'group'))
     page_obj = posts_page_splitter(
-        request.GET.get('page'),
-        follow_list)
+        request.GET,
+        follow_list,
+        partial(FollowFeedPaginator, user=request.user, pulled=pulled))
     context = {
         'page_obj': page_obj,
         'title': 'Лента подписок',
@@ -44,42 +66,44 @@ def follow_index(request):
     return render(request, 'posts/index.html', context)
 
 
+@condition(etag_func=conditional.group_etag)
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
+    group = get_object_or_404(cached(Group.objects), slug=slug)
     post_list = group.posts.select_related(
         'author')
-    page_obj = posts_page_splitter(
-        request.GET.get('page'),
-        post_list)
     context = {
         'group': group,
-        'page_obj': page_obj,
+        'page_obj': lazy_posts_page(request.GET, post_list),
+        **feed_fragment('group_page', request.GET, group_scope(group.pk)),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@condition(etag_func=conditional.profile_etag)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        cached(User.objects.select_related('stats')), username=username)
     following = (request.user.is_authenticated
                  and author.following.filter(user=request.user).exists()
                  )
     post_list = author.posts.select_related('group')
-    page_obj = posts_page_splitter(
-        request.GET.get('page'),
-        post_list)
     context = {
-        'page_obj': page_obj,
+        'page_obj': lazy_posts_page(request.GET, post_list),
         'author': author,
         'following': following,
+        **feed_fragment('profile_page', request.GET,
+                        author_scope(author.pk)),
     }
     return render(request, 'posts/profile.html', context)
 
 
+@condition(etag_func=conditional.post_etag)
+@cached_page(conditional.post_state)
 def post_detail(request, post_id):
     post = get_object_or_404(
-        Post.objects
-        .select_related('author', 'group')
-        .prefetch_related('comments', 'comments__author'),
+        cached(Post.objects
+               .select_related('author', 'author__stats', 'group')
+               .prefetch_related('comments', 'comments__author')),
         pk=post_id)
     context = {
         'post': post,
@@ -90,18 +114,20 @@ def post_detail(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def post_create(request):
     form = PostForm(request.POST or None,
                     files=request.FILES or None, )
     if form.is_valid():
-        form = form.save(commit=False)
-        form.author = request.user
-        form.save()
+        post = form.save(commit=False)
+        post.author = request.user
+        post.save()
         return redirect('posts:profile', request.user.username)
     return render(request, 'posts/create_post.html', {'form': form})
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     post = get_object_or_404(
         Post.objects.select_related('author', 'group', ),
@@ -122,8 +148,9 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(cached(Post.objects), pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -134,8 +161,9 @@ def add_comment(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(cached(User.objects), username=username)
     if request.user != author:
         Follow.objects.get_or_create(
             user=request.user,
@@ -145,10 +173,12 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     (Follow.objects.filter(
         user=request.user,
-        author=get_object_or_404(User, username=username))
+        author=get_object_or_404(cached(User.objects),
+                                 username=username))
      .delete()
      )
     return redirect('posts:profile', username)
@@ -0,0 +1,253 @@
+"""Полнотекстовый индекс постов и комментариев на SQLite FTS5.
+
+Текст хранится как есть (только ё заменяется на е), а слова запроса
+проходят через русский стеммер и ищутся как префиксы: «котами» находит
+«кот», «котов» и «коты». На других СУБД индекса нет, и поиск сводится
+к LIKE по постам.
+"""
+import re
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from collections import namedtuple
+
+from django.db import connection, transaction
+from django.db.models import FloatField
+from django.db.models.expressions import Col
+from django.db.models.sql.constants import INNER
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from posts.models import Comment, Post
+
+from .stemmer import stem
+
+TABLE = 'search_document'
+POST = 'post'
+COMMENT = 'comment'
+KINDS = {POST: 0, COMMENT: 1}
+WORD = re.compile(r'\w+')
+# Более короткие основы ищутся целым словом, иначе найдется все подряд
+MIN_PREFIX = 3
+SNIPPET_TOKENS = 24
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+Hit = namedtuple('Hit', 'kind post snippet')
+SearchPage = namedtuple('SearchPage', 'hits next_cursor')
+
+
+_available = False
+
+
+def available():
+    # Запоминаем только найденную таблицу: ее могут создать миграцией
+    # уже после первой проверки
+    global _available
+    if not _available:
+        _available = (connection.vendor == 'sqlite'
+                      and TABLE in connection.introspection.table_names())
+    return _available
+
+
+def normalize(text):
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def rowid(kind, pk):
+    return pk * len(KINDS) + KINDS[kind]
+
+
+def build_query(text):
+    """Переводит текст пользователя в выражение MATCH или None."""
+    terms = []
+    for word in WORD.findall(text.lower()):
+        term = stem(word)
+        terms.append(f'"{term}"*' if len(term) >= MIN_PREFIX
+                     else f'"{term}"')
+    return ' '.join(terms) or None
+
+
+def index_document(kind, pk, post_id, text):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {TABLE} (rowid, text, kind, post_id) '
+            'VALUES (%s, %s, %s, %s)',
+            [rowid(kind, pk), normalize(text), kind, post_id])
+
+
+def remove_document(kind, pk):
+    if not available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s',
+                       [rowid(kind, pk)])
+
+
+def _insert_batches(kind, rows, batch_size, replace=False):
+    batch = []
+    for pk, post_id, text in rows:
+        batch.append((rowid(kind, pk), normalize(text), kind, post_id))
+        if len(batch) >= batch_size:
+            _insert(batch, replace)
+            batch = []
+    if batch:
+        _insert(batch, replace)
+
+
+def _insert(batch, replace=False):
+    verb = 'INSERT OR REPLACE' if replace else 'INSERT'
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            f'{verb} INTO {TABLE} (rowid, text, kind, post_id) '
+            'VALUES (%s, %s, %s, %s)', batch)
+
+
+def index_many(kind, rows, batch_size=1000):
+    """Кладет в индекс документы из строк (pk, post_id, text), заменяя
+    уже проиндексированные."""
+    if available():
+        _insert_batches(kind, rows, batch_size, replace=True)
+
+
+def rebuild(batch_size=1000):
+    """Строит индекс заново; возвращает число документов."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    posts = Post.objects.order_by().values_list('pk', 'pk', 'text')
+    comments = Comment.objects.order_by().values_list(
+        'pk', 'post_id', 'text')
+    _insert_batches(POST, posts.iterator(chunk_size=batch_size),
+                    batch_size)
+    _insert_batches(COMMENT, comments.iterator(chunk_size=batch_size),
+                    batch_size)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT count(*) FROM {TABLE}')
+        return cursor.fetchone()[0]
+
+
+def encode_cursor(score, last_rowid):
+    return urlsafe_b64encode(
+        f'{score!r}|{last_rowid}'.encode()).decode()
+
+
+def decode_cursor(token):
+    try:
+        score, last_rowid = (urlsafe_b64decode(token.encode()).decode()
+                             .split('|'))
+        return float(score), int(last_rowid)
+    except (Base64Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def _highlight(snippet):
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>'))
+
+
+class _MatchJoin:
+    """INNER JOIN с подзапросом MATCH, который отдает id объекта и его
+    rank: индекс читается один раз на выборку, а не на каждую строку."""
+    join_type = INNER
+    nullable = False
+    filtered_relation = None
+    table_name = 'search_match'
+
+    def __init__(self, parent_alias, column, query, kind, table_alias=None):
+        self.parent_alias = parent_alias
+        self.column = column
+        self.query = query
+        self.kind = kind
+        self.table_alias = table_alias
+
+    def as_sql(self, compiler, connection):
+        quote = compiler.quote_name_unless_alias
+        alias = quote(self.table_alias)
+        sql = (
+            f'INNER JOIN (SELECT rowid / %s AS object_id, rank '
+            f'FROM {TABLE} WHERE {TABLE} MATCH %s AND kind = %s) {alias} '
+            f'ON {alias}.object_id = {quote(self.parent_alias)}.'
+            f'{connection.ops.quote_name(self.column)}'
+        )
+        return sql, [len(KINDS), self.query, self.kind]
+
+    def relabeled_clone(self, change_map):
+        return self.__class__(
+            change_map.get(self.parent_alias, self.parent_alias),
+            self.column, self.query, self.kind,
+            change_map.get(self.table_alias, self.table_alias))
+
+    def equals(self, other, with_filtered_relation):
+        return self is other
+
+    def promote(self):
+        return self
+
+    def demote(self):
+        return self
+
+
+def ranked(queryset, text, kind):
+    """Объекты одного вида из выборки, найденные по индексу, для админки.
+
+    Все совпадения отбираются и ранжируются в самом SQL, без выгрузки id:
+    релевантность лежит в `search_rank`, меньше - лучше.
+    """
+    query = build_query(text)
+    if query is None:
+        return queryset.none()
+    queryset = queryset.all()
+    sql_query = queryset.query
+    alias = sql_query.join(_MatchJoin(
+        sql_query.get_initial_alias(), queryset.model._meta.pk.column,
+        query, kind))
+    rank = FloatField()
+    rank.set_attributes_from_name('rank')
+    return queryset.annotate(search_rank=Col(alias, rank))
+
+
+def search(text, cursor=None, limit=10):
+    """Страница найденных постов и комментариев, лучшие сначала."""
+    query = build_query(text)
+    if query is None:
+        return SearchPage([], None)
+    if not available():
+        return _fallback_search(text, limit)
+    position = decode_cursor(cursor) if cursor else None
+    seek = ''
+    params = [MARK_START, MARK_END, query]
+    if position is not None:
+        seek = 'WHERE score > %s OR (score = %s AND rowid > %s)'
+        params += [position[0], position[0], position[1]]
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(
+            'SELECT rowid, kind, post_id, score, snippet FROM ('
+            f'  SELECT rowid, kind, post_id, bm25({TABLE}) AS score,'
+            f"  snippet({TABLE}, 0, %s, %s, '…', {SNIPPET_TOKENS})"
+            '   AS snippet'
+            f'  FROM {TABLE} WHERE {TABLE} MATCH %s'
+            f') {seek} ORDER BY score, rowid LIMIT %s',
+            params + [limit + 1])
+        rows = db_cursor.fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][3], rows[-1][0])
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        {row[2] for row in rows})
+    hits = [
+        Hit(kind, posts[post_id], _highlight(snippet))
+        for _, kind, post_id, _, snippet in rows
+        if post_id in posts
+    ]
+    return SearchPage(hits, next_cursor)
+
+
+def _fallback_search(text, limit):
+    posts = (Post.objects.select_related('author', 'group')
+             .filter(text__icontains=text)[:limit])
+    return SearchPage([Hit(POST, post, post.text) for post in posts], None)
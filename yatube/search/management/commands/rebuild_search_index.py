@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from search import index
+
+
+class Command(BaseCommand):
+    help = 'Строит полнотекстовый индекс постов и комментариев заново'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько документов вставлять за одну транзакцию',
+        )
+
+    def handle(self, *args, batch_size, **options):
+        if not index.available():
+            raise CommandError('Полнотекстовый индекс доступен только '
+                               'на SQLite с FTS5, примените миграции')
+        total = index.rebuild(batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Документов в индексе: {total}'))
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+CREATE_TABLE = (
+    'CREATE VIRTUAL TABLE search_document USING fts5('
+    ' text, kind UNINDEXED, post_id UNINDEXED,'
+    " tokenize = 'unicode61 remove_diacritics 2')"
+)
+FILL_TABLE = (
+    'INSERT INTO search_document (rowid, text, kind, post_id)'
+    " SELECT id * 2, replace(replace(text, 'ё', 'е'), 'Ё', 'Е'),"
+    " 'post', id FROM posts_post"
+    ' UNION ALL'
+    " SELECT id * 2 + 1, replace(replace(text, 'ё', 'е'), 'Ё', 'Е'),"
+    " 'comment', post_id FROM posts_comment"
+)
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(CREATE_TABLE)
+    schema_editor.execute(FILL_TABLE)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS search_document')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_updated'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
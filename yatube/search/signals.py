@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import index
+
+
+@receiver(post_save, sender='posts.Post')
+def post_saved(sender, instance, **kwargs):
+    index.index_document(
+        index.POST, instance.pk, instance.pk, instance.text)
+
+
+@receiver(post_delete, sender='posts.Post')
+def post_deleted(sender, instance, **kwargs):
+    index.remove_document(index.POST, instance.pk)
+
+
+@receiver(post_save, sender='posts.Comment')
+def comment_saved(sender, instance, **kwargs):
+    index.index_document(
+        index.COMMENT, instance.pk, instance.post_id, instance.text)
+
+
+@receiver(post_delete, sender='posts.Comment')
+def comment_deleted(sender, instance, **kwargs):
+    index.remove_document(index.COMMENT, instance.pk)
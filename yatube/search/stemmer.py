@@ -0,0 +1,65 @@
+"""Стеммер Портера для русского языка (алгоритм Snowball).
+
+Окончания отрезаются только в RV - части слова после первой гласной.
+"""
+import re
+
+VOWELS = 'аеиоуыэюя'
+RV = re.compile(rf'^(.*?[{VOWELS}])(.*)$')
+PERFECTIVE_GERUND = re.compile(
+    r'((ив|ивши|ившись|ыв|ывши|ывшись)'
+    r'|((?<=[ая])(в|вши|вшись)))$')
+REFLEXIVE = re.compile(r'(с[яь])$')
+ADJECTIVE = re.compile(
+    r'(ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому'
+    r'|их|ых|ую|юю|ая|яя|ою|ею)$')
+PARTICIPLE = re.compile(r'((ивш|ывш|ующ)|((?<=[ая])(ем|нн|вш|ющ|щ)))$')
+VERB = re.compile(
+    r'((ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло'
+    r'|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)'
+    r'|((?<=[ая])(ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)))$')
+NOUN = re.compile(
+    r'(а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием'
+    r'|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$')
+DERIVATIONAL_REGION = re.compile(
+    rf'.*[^{VOWELS}]+[{VOWELS}].*ость?$')
+DERIVATIONAL = re.compile(r'ость?$')
+SUPERLATIVE = re.compile(r'(ейше|ейш)$')
+
+
+def _cut(pattern, word):
+    return pattern.sub('', word, count=1)
+
+
+def _step1(rv):
+    stripped = _cut(PERFECTIVE_GERUND, rv)
+    if stripped != rv:
+        return stripped
+    rv = _cut(REFLEXIVE, rv)
+    stripped = _cut(ADJECTIVE, rv)
+    if stripped != rv:
+        return _cut(PARTICIPLE, stripped)
+    stripped = _cut(VERB, rv)
+    if stripped != rv:
+        return stripped
+    return _cut(NOUN, rv)
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    match = RV.match(word)
+    if not match:
+        return word
+    prefix, rv = match.groups()
+    rv = _step1(rv)
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    if DERIVATIONAL_REGION.match(rv):
+        rv = _cut(DERIVATIONAL, rv)
+    if rv.endswith('ь'):
+        rv = rv[:-1]
+    else:
+        rv = _cut(SUPERLATIVE, rv)
+        if rv.endswith('нн'):
+            rv = rv[:-1]
+    return prefix + rv
@@ -0,0 +1,112 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from posts.models import Comment, Post
+
+from . import index
+from .stemmer import stem
+
+User = get_user_model()
+
+
+class StemmerTests(TestCase):
+    def test_russian_word_forms_share_stem(self):
+        forms = [
+            ('котами', 'кот'),
+            ('котов', 'кот'),
+            ('красивейший', 'красив'),
+            ('Ёжиками', 'ежик'),
+            ('говорила', 'говор'),
+        ]
+        for word, expected in forms:
+            with self.subTest(word=word):
+                self.assertEqual(stem(word), expected)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader')
+        cls.post = Post.objects.create(
+            author=cls.user, text='Про котов и <script>ёжиков</script>')
+        cls.other = Post.objects.create(
+            author=cls.user, text='Совсем о другом')
+        cls.comment = Comment.objects.create(
+            post=cls.other, author=cls.user, text='А у меня живут коты')
+
+    def setUp(self):
+        self.client = Client()
+
+    def test_search_by_word_form_with_highlight(self):
+        response = self.client.get(reverse('search:search'), {'q': 'котами'})
+        hits = response.context['page'].hits
+        self.assertEqual(
+            {(hit.kind, hit.post) for hit in hits},
+            {(index.POST, self.post), (index.COMMENT, self.other)})
+        self.assertContains(response, '<mark>котов</mark>')
+        self.assertNotContains(response, '<script>')
+
+    def test_index_follows_edits_and_deletes(self):
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Теперь про собак'
+        post.save()
+        Comment.objects.filter(pk=self.comment.pk).delete()
+        self.assertEqual(index.search('коты').hits, [])
+        self.assertEqual(
+            [hit.post for hit in index.search('собаками').hits], [self.post])
+
+    def test_cursor_pagination(self):
+        for number in range(3):
+            Post.objects.create(author=self.user, text=f'Кошка номер {number}')
+        first = index.search('кошки', limit=2)
+        second = index.search('кошки', cursor=first.next_cursor, limit=2)
+        self.assertEqual(len(first.hits), 2)
+        self.assertEqual(len(second.hits), 1)
+        self.assertIsNone(second.next_cursor)
+        self.assertFalse(
+            {hit.post for hit in first.hits}
+            & {hit.post for hit in second.hits})
+
+    def test_missing_index_not_remembered(self):
+        with mock.patch.object(index, '_available', False), \
+                mock.patch.object(connection.introspection, 'table_names',
+                                  return_value=[]):
+            self.assertFalse(index.available())
+            connection.introspection.table_names.return_value = [index.TABLE]
+            self.assertTrue(index.available())
+
+    def test_rebuild_command(self):
+        call_command('rebuild_search_index', batch_size=1, stdout=StringIO())
+        self.assertEqual(
+            list(index.ranked(Post.objects.all(), 'ёжик', index.POST)),
+            [self.post])
+        self.assertEqual(
+            list(index.ranked(Comment.objects.all(), 'кот', index.COMMENT)),
+            [self.comment])
+
+    def test_ranked_matches_once(self):
+        Post.objects.create(author=self.user, text='Коты, коты и снова коты')
+        found = index.ranked(Post.objects.all(), 'коты', index.POST)
+        sql = str(found.query)
+        self.assertEqual(sql.count('MATCH'), 1)
+        self.assertIn('INNER JOIN (SELECT', sql)
+        self.assertEqual(found.count(), 2)
+        ranks = [post.search_rank for post in found.order_by('search_rank')]
+        self.assertEqual(ranks, sorted(ranks))
+
+    def test_admin_search_ranked_without_cap(self):
+        best = Post.objects.create(
+            author=self.user, text='Коты, коты и снова коты')
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'коты'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [best, self.post])
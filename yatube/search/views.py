@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.shortcuts import render
+
+from . import index
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page = index.search(
+        query,
+        cursor=request.GET.get('cursor'),
+        limit=settings.POSTS_PER_PAGE,
+    )
+    context = {
+        'query': query,
+        'page': page,
+    }
+    return render(request, 'search/results.html', context)
@@ -0,0 +1,28 @@
+from django.contrib import admin
+from django.utils import timezone
+
+from .models import Task
+
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'name',
+        'queue',
+        'priority',
+        'status',
+        'attempts',
+        'run_at',
+        'locked_by',
+    )
+    list_filter = ('status', 'queue', 'name')
+    search_fields = ('name', 'unique_key')
+    readonly_fields = ('locked_by', 'locked_at', 'last_error', 'created')
+    actions = ('retry',)
+
+    def retry(self, request, queryset):
+        updated = queryset.filter(status=Task.FAILED).update(
+            status=Task.QUEUED, attempts=0, run_at=timezone.now())
+        self.message_user(request, f'Возвращено в очередь: {updated}')
+    retry.short_description = 'Перезапустить упавшие задачи'
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class TasksConfig(AppConfig):
+    name = 'tasks'
+
+    def ready(self):
+        # Воркер должен знать все задачи, а не только импортированные
+        autodiscover_modules('tasks')
+        from . import metrics  # noqa: F401
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from tasks.worker import depth
+
+
+class Command(BaseCommand):
+    help = 'Показывает, сколько задач ждет в очередях'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--queue', action='append', dest='queues',
+            help='Показать только эту очередь (можно повторять)',
+        )
+
+    def handle(self, *args, queues, **options):
+        stats = depth(queues)
+        if not stats:
+            self.stdout.write('Очереди пусты')
+            return
+        for queue, row in sorted(stats.items()):
+            oldest = row['oldest'].isoformat() if row['oldest'] else '-'
+            self.stdout.write(
+                f"{queue}: готовы {row['ready']}, "
+                f"отложены {row['scheduled']}, "
+                f"выполняются {row['running']}, "
+                f"упали {row['failed']}, самая старая {oldest}")
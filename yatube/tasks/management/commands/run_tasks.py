@@ -0,0 +1,64 @@
+import signal
+from multiprocessing import Process
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from tasks.worker import Worker
+
+
+def _work(queues, batch_size, once):
+    # Нужно при запуске процессов через spawn; после fork ничего не делает
+    django.setup()
+    worker = Worker(queues=queues, batch_size=batch_size)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    return worker.run(once=once)
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркеры очереди фоновых задач'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Число процессов-воркеров',
+        )
+        parser.add_argument(
+            '--queue', action='append', dest='queues',
+            help='Брать задачи только из этой очереди (можно повторять)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Сколько задач воркер забирает за раз',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и выйти',
+        )
+
+    def handle(self, *args, processes, queues, batch_size, once, **options):
+        if processes <= 1:
+            done = _work(queues, batch_size, once)
+            self.stdout.write(f'Выполнено задач: {done}')
+            return
+        # Дочерние процессы не должны делить соединения с родителем
+        connections.close_all()
+        workers = [
+            Process(target=_work, args=(queues, batch_size, once))
+            for _ in range(processes)
+        ]
+        for worker in workers:
+            worker.start()
+
+        def stop(*args):
+            # SIGTERM воркеру - та же мягкая остановка, что и Ctrl+C
+            for worker in workers:
+                worker.terminate()
+
+        # Ctrl+C получат и воркеры: ждем, пока они доделают пачки
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, stop)
+        for worker in workers:
+            worker.join()
@@ -0,0 +1,29 @@
+from django.utils import timezone
+
+from core.metrics import registry
+
+from .worker import depth
+
+STATES = ('ready', 'scheduled', 'running', 'failed')
+
+
+def _depth(samples):
+    for queue, row in depth().items():
+        for state in STATES:
+            yield {'queue': queue, 'state': state}, row[state]
+
+
+def _oldest(samples):
+    now = timezone.now()
+    for queue, row in depth().items():
+        if row['oldest'] is not None:
+            yield {'queue': queue}, (now - row['oldest']).total_seconds()
+
+
+QUEUE_DEPTH = registry.gauge(
+    'yatube_task_queue_depth', 'Задачи в очереди по состоянию',
+    ('queue', 'state'), collect=_depth)
+QUEUE_OLDEST = registry.gauge(
+    'yatube_task_queue_oldest_seconds',
+    'Сколько ждет самая давняя готовая задача', ('queue',),
+    collect=_oldest)
@@ -0,0 +1,53 @@
+from django.db import models
+from django.db.models import Q
+from django.utils import timezone
+
+
+class Task(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUSES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Не выполнена'),
+    )
+
+    name = models.CharField('Задача', max_length=200)
+    payload = models.TextField('Аргументы', default='{}')
+    queue = models.CharField('Очередь', max_length=50, default='default')
+    priority = models.SmallIntegerField('Приоритет', default=0)
+    status = models.CharField(
+        'Состояние', max_length=10, choices=STATUSES, default=QUEUED)
+    run_at = models.DateTimeField('Запустить не раньше', default=timezone.now)
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField(
+        'Максимум попыток', default=3)
+    unique_key = models.CharField(
+        'Ключ уникальности', max_length=255, null=True, blank=True)
+    locked_by = models.CharField('Воркер', max_length=100, blank=True)
+    locked_at = models.DateTimeField('Взята в работу', null=True, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Поставлена', auto_now_add=True)
+
+    class Meta:
+        ordering = ('-priority', 'run_at', 'id')
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        indexes = [
+            models.Index(
+                fields=['status', 'queue', '-priority', 'run_at'],
+                name='task_claim_idx',
+            ),
+        ]
+        constraints = [
+            # Одна и та же работа не ставится дважды, пока не выполнена
+            models.UniqueConstraint(
+                fields=['unique_key'],
+                condition=Q(status__in=['queued', 'running']),
+                name='unique_pending_task',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.pk} ({self.status})'
@@ -0,0 +1,135 @@
+"""Объявление и постановка фоновых задач.
+
+Задача - обычная функция с декоратором `task`. Вызов `func.enqueue(...)`
+сохраняет имя задачи и аргументы в таблицу `Task`, а выполняют ее
+воркеры `manage.py run_tasks`. Аргументы должны сериализоваться в JSON.
+При `TASKS_EAGER = True` задача выполняется сразу, в том же потоке.
+"""
+import json
+import logging
+from datetime import timedelta
+from functools import update_wrapper
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+def dumps(args, kwargs):
+    return json.dumps({'args': list(args), 'kwargs': kwargs or {}},
+                      cls=DjangoJSONEncoder)
+
+
+def loads(payload):
+    data = json.loads(payload)
+    return data['args'], data['kwargs']
+
+
+class TaskFunction:
+    """Функция-задача: вызывается как обычно или ставится в очередь."""
+
+    def __init__(self, func, name, queue, priority, max_attempts):
+        update_wrapper(self, func)
+        self.func = func
+        self.name = name
+        self.queue = queue
+        self.priority = priority
+        self.max_attempts = max_attempts
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def __repr__(self):
+        return f'<task {self.name}>'
+
+    def enqueue(self, *args, **kwargs):
+        return self.schedule(args, kwargs)
+
+    def _build(self, args, kwargs, priority, run_at, delay, unique_key):
+        if run_at is None:
+            run_at = timezone.now()
+        if delay:
+            run_at += timedelta(seconds=delay)
+        return Task(
+            name=self.name,
+            payload=dumps(args, kwargs),
+            queue=self.queue,
+            priority=self.priority if priority is None else priority,
+            max_attempts=self.max_attempts,
+            run_at=run_at,
+            unique_key=unique_key,
+        )
+
+    def _run_eagerly(self, payload):
+        args, kwargs = loads(payload)
+        try:
+            self.func(*args, **kwargs)
+        except Exception:
+            logger.exception('Задача %s завершилась ошибкой', self.name)
+
+    def schedule(self, args=(), kwargs=None, *, priority=None, run_at=None,
+                 delay=None, unique_key=None):
+        """Ставит задачу в очередь.
+
+        `delay` - через сколько секунд запустить, `unique_key` - не
+        ставить задачу, если такая же еще не выполнена. Возвращает
+        `Task` или None, если задача с этим ключом уже ждет.
+        """
+        task = self._build(args, kwargs, priority, run_at, delay, unique_key)
+        if settings.TASKS_EAGER:
+            self._run_eagerly(task.payload)
+            return task
+        if unique_key is None:
+            task.save()
+            return task
+        try:
+            with transaction.atomic():
+                task.save()
+        except IntegrityError:
+            return None
+        return task
+
+    def enqueue_many(self, calls, *, priority=None, run_at=None, delay=None,
+                     unique_key=None):
+        """Ставит пачку задач одним INSERT.
+
+        `calls` - последовательность кортежей позиционных аргументов,
+        `unique_key` - функция от такого кортежа. Задачи с ключом,
+        который уже ждет в очереди, пропускаются.
+        """
+        tasks = [
+            self._build(args, None, priority, run_at, delay,
+                        unique_key(args) if unique_key else None)
+            for args in calls
+        ]
+        if settings.TASKS_EAGER:
+            for task in tasks:
+                self._run_eagerly(task.payload)
+            return len(tasks)
+        Task.objects.bulk_create(
+            tasks, batch_size=settings.TASKS_BATCH_SIZE * 10,
+            ignore_conflicts=unique_key is not None)
+        return len(tasks)
+
+
+def task(func=None, *, name=None, queue='default', priority=0,
+         max_attempts=3):
+    """Регистрирует функцию как фоновую задачу.
+
+    Чем больше `priority`, тем раньше задача попадет к воркеру.
+    """
+    def decorator(func):
+        task_name = name or f'{func.__module__}.{func.__name__}'
+        wrapper = TaskFunction(
+            func, task_name, queue, priority, max_attempts)
+        registry[task_name] = wrapper
+        return wrapper
+
+    return decorator(func) if func is not None else decorator
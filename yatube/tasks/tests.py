@@ -0,0 +1,111 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import worker
+from .models import Task
+from .registry import task
+
+User = get_user_model()
+
+calls = []
+
+
+@task(name='tests.remember')
+def remember(value):
+    calls.append(value)
+
+
+@task(name='tests.explode', max_attempts=2)
+def explode():
+    raise RuntimeError('Ошибка в задаче')
+
+
+@override_settings(TASKS_EAGER=False)
+class QueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def run_worker(self, **kwargs):
+        return worker.Worker(poll_interval=0, **kwargs).run(once=True)
+
+    def test_enqueued_task_runs_in_worker(self):
+        remember.enqueue('привет')
+        self.assertEqual(calls, [])
+        self.assertEqual(self.run_worker(), 1)
+        self.assertEqual(calls, ['привет'])
+        self.assertFalse(Task.objects.exists())
+
+    def test_priority_and_schedule(self):
+        remember.enqueue('обычная')
+        remember.schedule(('срочная',), priority=5)
+        remember.schedule(('отложенная',), delay=60)
+        self.run_worker()
+        self.assertEqual(calls, ['срочная', 'обычная'])
+        self.assertEqual(worker.depth()['default']['scheduled'], 1)
+
+    def test_failed_task_retried_with_backoff(self):
+        explode.enqueue()
+        self.assertEqual(self.run_worker(), 0)
+        failed = Task.objects.get()
+        self.assertEqual(failed.status, Task.QUEUED)
+        self.assertEqual(failed.attempts, 1)
+        self.assertGreater(failed.run_at, timezone.now())
+        self.assertIn('Ошибка в задаче', failed.last_error)
+        Task.objects.update(run_at=timezone.now())
+        self.run_worker()
+        self.assertEqual(Task.objects.get().status, Task.FAILED)
+
+    def test_unique_key_skips_pending_duplicates(self):
+        self.assertIsNotNone(remember.schedule((1,), unique_key='one'))
+        self.assertIsNone(remember.schedule((1,), unique_key='one'))
+        self.run_worker()
+        self.assertIsNotNone(remember.schedule((1,), unique_key='one'))
+
+    def test_batch_enqueue_and_claim(self):
+        remember.enqueue_many([(value,) for value in range(5)])
+        remember.enqueue_many([(value,) for value in range(5)],
+                              unique_key=lambda args: f'value:{args[0]}')
+        remember.enqueue_many([(value,) for value in range(5)],
+                              unique_key=lambda args: f'value:{args[0]}')
+        self.assertEqual(Task.objects.count(), 10)
+        claimed = worker.claim('test', limit=3)
+        self.assertEqual(len(claimed), 3)
+        self.assertEqual(worker.depth()['default']['running'], 3)
+        self.assertEqual(len(worker.claim('другой', limit=10)), 7)
+
+    def test_stale_tasks_requeued(self):
+        remember.enqueue('брошенная')
+        worker.claim('умерший', limit=1)
+        later = timezone.now() + timedelta(hours=1)
+        self.assertEqual(worker.requeue_stale(later), 1)
+        self.run_worker()
+        self.assertEqual(calls, ['брошенная'])
+
+    def test_queue_depth_command(self):
+        remember.enqueue(1)
+        remember.schedule((2,), delay=60)
+        out = StringIO()
+        call_command('queue_depth', stdout=out)
+        self.assertIn('default: готовы 1, отложены 1', out.getvalue())
+
+    def test_password_reset_email_sent_by_worker(self):
+        User.objects.create_user(username='forgetful',
+                                 email='forgetful@example.com',
+                                 password='forgotten-password')
+        Client().post(reverse('users:password_reset'),
+                      {'email': 'forgetful@example.com'})
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(worker.depth()['mail']['ready'], 1)
+        # Ссылка с токеном собирается воркером, в очереди ее нет
+        self.assertNotIn('/reset/', Task.objects.get().payload)
+        self.run_worker(queues=['mail'])
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['forgetful@example.com'])
+        self.assertIn('/reset/', mail.outbox[0].body)
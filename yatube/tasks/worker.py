@@ -0,0 +1,154 @@
+"""Выборка и выполнение задач из очереди.
+
+Воркер забирает из таблицы пачку готовых задач, помечая их своим
+именем, и выполняет по одной. Удачно выполненная задача удаляется,
+упавшая - возвращается в очередь с экспоненциальной задержкой, пока не
+кончатся попытки, а потом остается в таблице со статусом `failed`.
+Задачи воркера, который умер посреди работы, по таймауту блокировки
+снова становятся доступны.
+"""
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import OperationalError, connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import Task
+from .registry import loads, registry
+
+logger = logging.getLogger(__name__)
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def backoff(attempts):
+    """Задержка перед следующей попыткой, в секундах."""
+    delay = min(settings.TASKS_RETRY_DELAY * 2 ** (attempts - 1),
+                settings.TASKS_MAX_RETRY_DELAY)
+    # Разброс, чтобы упавшие вместе задачи не вернулись тоже вместе
+    return delay * random.uniform(1, 1.25)
+
+
+def requeue_stale(now=None):
+    """Возвращает в очередь задачи, которые воркер так и не завершил."""
+    now = now or timezone.now()
+    stale = Task.objects.filter(
+        status=Task.RUNNING,
+        locked_at__lt=now - timedelta(seconds=settings.TASKS_LOCK_TIMEOUT),
+    )
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Task.FAILED, last_error='Воркер не завершил задачу')
+    requeued = stale.update(
+        status=Task.QUEUED, locked_by='', locked_at=None)
+    return failed + requeued
+
+
+def claim(worker, limit, queues=None):
+    """Забирает до `limit` готовых задач, самые приоритетные первыми."""
+    now = timezone.now()
+    with transaction.atomic():
+        ready = Task.objects.filter(status=Task.QUEUED, run_at__lte=now)
+        if queues:
+            ready = ready.filter(queue__in=queues)
+        if connection.features.has_select_for_update_skip_locked:
+            ready = ready.select_for_update(skip_locked=True)
+        ids = list(ready.order_by('-priority', 'run_at', 'pk')
+                   .values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        # Условие на статус не даст двум воркерам взять одну задачу
+        Task.objects.filter(pk__in=ids, status=Task.QUEUED).update(
+            status=Task.RUNNING, locked_by=worker, locked_at=now,
+            attempts=F('attempts') + 1)
+        return list(Task.objects.filter(
+            pk__in=ids, locked_by=worker, locked_at=now))
+
+
+def execute(task):
+    """Выполняет задачу; True, если она отработала без ошибок."""
+    func = registry.get(task.name)
+    try:
+        if func is None:
+            raise LookupError(f'Неизвестная задача {task.name}')
+        args, kwargs = loads(task.payload)
+        func.func(*args, **kwargs)
+    except Exception:
+        logger.exception('Задача %s упала', task)
+        retry(task, traceback.format_exc(), final=func is None)
+        return False
+    task.delete()
+    return True
+
+
+def retry(task, error, final=False):
+    task.last_error = error
+    task.locked_by = ''
+    task.locked_at = None
+    if final or task.attempts >= task.max_attempts:
+        task.status = Task.FAILED
+    else:
+        task.status = Task.QUEUED
+        task.run_at = timezone.now() + timedelta(
+            seconds=backoff(task.attempts))
+    task.save(update_fields=[
+        'last_error', 'locked_by', 'locked_at', 'status', 'run_at'])
+
+
+def depth(queues=None):
+    """Состояние очередей: {очередь: {ready, scheduled, running, failed,
+    oldest}}, где oldest - время самой давней готовой задачи."""
+    now = timezone.now()
+    ready = Q(status=Task.QUEUED, run_at__lte=now)
+    rows = Task.objects.order_by().values('queue').annotate(
+        ready=Count('pk', filter=ready),
+        scheduled=Count('pk', filter=Q(status=Task.QUEUED, run_at__gt=now)),
+        running=Count('pk', filter=Q(status=Task.RUNNING)),
+        failed=Count('pk', filter=Q(status=Task.FAILED)),
+        oldest=Min('run_at', filter=ready),
+    )
+    if queues:
+        rows = rows.filter(queue__in=queues)
+    return {row.pop('queue'): row for row in rows}
+
+
+class Worker:
+    def __init__(self, queues=None, batch_size=None, poll_interval=None):
+        self.name = worker_name()
+        self.queues = queues
+        self.batch_size = batch_size or settings.TASKS_BATCH_SIZE
+        self.poll_interval = (settings.TASKS_POLL_INTERVAL
+                              if poll_interval is None else poll_interval)
+        self.stopped = False
+
+    def stop(self, *args):
+        # Текущая пачка дорабатывается, новая не берется
+        self.stopped = True
+
+    def run(self, once=False):
+        """Выполняет задачи до остановки; с `once` - пока есть готовые."""
+        done = 0
+        while not self.stopped:
+            try:
+                requeue_stale()
+                tasks = claim(self.name, self.batch_size, self.queues)
+            except OperationalError:
+                # SQLite занят другим воркером - попробуем позже
+                logger.warning('База занята, воркер %s ждет', self.name)
+                time.sleep(self.poll_interval)
+                continue
+            for task in tasks:
+                done += execute(task)
+            if not tasks:
+                if once:
+                    break
+                time.sleep(self.poll_interval)
+        return done
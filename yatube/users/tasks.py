@@ -0,0 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.mail import EmailMultiAlternatives
+from django.template import loader
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from tasks.registry import task
+
+User = get_user_model()
+
+
+@task(queue='mail', priority=10, max_attempts=5)
+def send_email(subject, body, from_email, to, html_body=None):
+    message = EmailMultiAlternatives(subject, body, from_email, to)
+    if html_body:
+        message.attach_alternative(html_body, 'text/html')
+    message.send()
+
+
+@task(queue='mail', priority=10, max_attempts=5)
+def send_password_reset(user_id, domain, site_name, protocol,
+                        subject_template_name, email_template_name,
+                        from_email=None, html_email_template_name=None,
+                        extra_email_context=None):
+    """Письмо для сброса пароля: ссылка с токеном собирается только здесь.
+
+    В очереди лежат лишь id пользователя и адрес сайта, поэтому токен не
+    попадает в таблицу задач. Если пароль уже сменили или пользователя
+    отключили, письма не будет.
+    """
+    user = User.objects.filter(pk=user_id, is_active=True).first()
+    if user is None or not user.has_usable_password() or not user.email:
+        return
+    context = {
+        'email': user.email,
+        'domain': domain,
+        'site_name': site_name,
+        'uid': urlsafe_base64_encode(force_bytes(user.pk)),
+        'user': user,
+        'token': default_token_generator.make_token(user),
+        'protocol': protocol,
+        **(extra_email_context or {}),
+    }
+    subject = loader.render_to_string(subject_template_name, context)
+    subject = ''.join(subject.splitlines())
+    body = loader.render_to_string(email_template_name, context)
+    html_body = None
+    if html_email_template_name is not None:
+        html_body = loader.render_to_string(html_email_template_name, context)
+    send_email(subject, body, from_email, [user.email], html_body)
@@ -11,6 +11,7 @@ from django.contrib.auth.views import (
 from django.urls import path
 
 from . import views
+from .forms import QueuedPasswordResetForm
 
 app_name = 'users'
 
@@ -29,6 +30,7 @@ urlpatterns = [
          name='password_change_done'),
     path('password_reset/',
          PasswordResetView.as_view(
+             form_class=QueuedPasswordResetForm,
              template_name='users/password_reset_form.html'),
          name='password_reset'),
     path('password_reset/done/',
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -46,10 +47,18 @@ INSTALLED_APPS = [
     'posts.apps.PostsConfig',
     'users.apps.UsersConfig',
     'about.apps.AboutConfig',
+    'search.apps.SearchConfig',
+    'tasks.apps.TasksConfig',
+    'benchmarks.apps.BenchmarksConfig',
     'sorl.thumbnail',
 ]
 
 MIDDLEWARE = [
+    'core.middleware.ServerTimingMiddleware',
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ProfilerMiddleware',
+    'core.middleware.MemoryMiddleware',
+    'core.middleware.NPlusOneMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -129,6 +138,71 @@ USE_TZ = True
 STATIC_URL = '/static/'
 
 POSTS_PER_PAGE = 10
+# 'cursor' - пагинация по ключу (pub_date, id), 'offset' - по номеру страницы
+POSTS_PAGINATION = 'cursor'
+# Авторам с таким числом подписчиков посты не рассылаются по лентам,
+# а подтягиваются при чтении follow_index
+FEED_FANOUT_LIMIT = 5000
+FEED_BATCH_SIZE = 1000
+# Фрагменты лент сбрасываются сигналами, таймаут лишь ограничивает память
+FEED_CACHE_TIMEOUT = 60 * 10
+# Карточки постов общие для всех лент и версионируются, таймаут тоже
+# только ограничивает память
+POST_CARD_CACHE_TIMEOUT = 60 * 60
+# Главная и страницы постов кэшируются целиком, одни на всех читателей:
+# шапка, ссылки автора и формы дорисовываются на каждый запрос
+PAGE_CACHE_ENABLED = not DEBUG
+PAGE_CACHE_TIMEOUT = 60 * 10
+# После срока фрагмент еще SWR_GRACE секунд отдается устаревшим, пока
+# один запрос его пересчитывает; остальные ждут пересчета при промахе
+# не дольше SWR_LOCK_WAIT
+SWR_GRACE = 60 * 5
+SWR_LOCK_TIMEOUT = 30
+SWR_LOCK_WAIT = 1
+SWR_BETA = 1
+# Модели, выборки которых через core.querycache.cached берутся из кэша;
+# записи в их таблицы сбрасывают кэш сами, таймаут ограничивает память
+QUERY_CACHE_MODELS = []
+QUERY_CACHE_TIMEOUT = 60 * 10
+# Фоновые задачи выполняют воркеры manage.py run_tasks;
+# True - выполнять сразу, в том же потоке
+TASKS_EAGER = False
+TASKS_BATCH_SIZE = 10
+TASKS_POLL_INTERVAL = 1
+# Задачи, взятые воркером дольше этого, считаются брошенными
+TASKS_LOCK_TIMEOUT = 60 * 5
+# Задержка повтора удваивается с каждой попыткой
+TASKS_RETRY_DELAY = 10
+TASKS_MAX_RETRY_DELAY = 60 * 60
+# Заголовок Server-Timing и строка лога core.timing на каждый ответ
+SERVER_TIMING_ENABLED = True
+# Метрики для Prometheus на /metrics/: воркеры складывают их в общий файл
+METRICS_ENABLED = True
+METRICS_SPOOL = os.path.join(tempfile.gettempdir(), 'yatube-metrics.sqlite3')
+METRICS_FLUSH_INTERVAL = 5
+# /metrics/ видят сотрудники и запросы с заголовком
+# Authorization: Bearer METRICS_TOKEN; пустой токен - такой доступ выключен
+METRICS_TOKEN = ''
+# Адреса, которым токен не нужен. За обратным прокси на той же машине
+# REMOTE_ADDR у всех 127.0.0.1, поэтому по умолчанию список пуст
+METRICS_ALLOWED_IPS = []
+# Профилировщик по запросу: POST /profiler/ или сигнал воркеру
+PROFILER_ENABLED = True
+PROFILER_DIR = os.path.join(tempfile.gettempdir(), 'yatube-profiles')
+PROFILER_INTERVAL = 0.01
+PROFILER_MAX_SECONDS = 120
+PROFILER_SIGNAL = 'SIGUSR2'
+PROFILER_SIGNAL_SECONDS = 30
+# Память по запросам и снимки tracemalloc на /memory/; заметно замедляет
+MEMORY_TRACKING = False
+MEMORY_TRACE_FRAMES = 10
+MEMORY_SNAPSHOTS = 5
+# Поиск N+1 обходит стек на каждый запрос: только для разработки и стенда
+NPLUSONE_ENABLED = DEBUG
+# Запрос, повторенный больше этого числа раз за ответ, попадает в лог
+NPLUSONE_THRESHOLD = 5
+# Сводка еще и в заголовке X-N-Plus-One
+NPLUSONE_HEADER = DEBUG
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
@@ -142,3 +216,28 @@ CACHES = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
+if not DEBUG:
+    # Память процесса перед общим на все воркеры машины кэшем: попадания
+    # и сброс версий лент общие, горячие ключи не ходят даже в SQLite
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.TieredCache',
+            'LOCATION': os.path.join(BASE_DIR, 'cache-bus.sqlite3'),
+            'OPTIONS': {
+                'L2': 'shared',
+                'L1_MAX_ENTRIES': 5000,
+                'L1_TIMEOUT': 30,
+                'BUS_INTERVAL': 0.5,
+            },
+        },
+        'shared': {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+            'OPTIONS': {
+                'MAX_ENTRIES': 100000,
+                'MAX_SIZE': 256 * 2 ** 20,
+            },
+        },
+    }
+    QUERY_CACHE_MODELS = [
+        'posts.Group', 'posts.Post', 'posts.Comment', 'auth.User']
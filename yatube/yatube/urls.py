@@ -18,12 +18,20 @@ from django.urls import include, path
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core import views as core_views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('', include('posts.urls', namespace='posts')),
     path('about/', include('about.urls', namespace='about')),
+    path('search/', include('search.urls', namespace='search')),
+    path('metrics/', core_views.metrics, name='metrics'),
+    path('profiler/', core_views.profiler_sessions, name='profiler'),
+    path('profiler/<str:profile>/', core_views.profiler_result,
+         name='profiler_result'),
+    path('memory/', core_views.memory_report, name='memory'),
 ]
 
 handler404 = 'core.views.page_not_found'